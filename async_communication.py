@@ -0,0 +1,494 @@
+import asyncio
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from communication import MULTICAST_GROUP, MULTICAST_PORT, MAX_DATAGRAM_SIZE, CHANNEL_RECV_BUFFER
+from framing import BufferPool, FrameBuffer, encode_frame
+from metrics import CommunicationMetrics, Metrics
+from outbound import BULK_TYPES, FLUSH_INTERVAL, MAX_BATCH_BYTES, PeerOutbox
+from transport import SocketTransport
+from codec import PeerCodecs, decode_message
+from utils import serialize_message, deserialize_message, get_logger
+
+logger = get_logger(__name__)
+
+class _FramedProtocol(asyncio.BufferedProtocol):
+    """Protocolo de recepção TCP: escreve os dados direto em um buffer do pool e extrai os frames.
+    As mensagens de uma conexão são processadas em ordem, uma de cada vez, no pool de handlers.
+    """
+    MAX_PENDING = 64  # Mensagens pendentes por conexão antes de pausar a leitura
+
+    def __init__(self, communication):
+        self.communication = communication
+        self.frame_buffer = FrameBuffer(communication.buffer_pool)
+        self.pending = deque()
+        self.draining = False
+        self.transport = None
+        self.addr = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.addr = transport.get_extra_info("peername")
+
+    def get_buffer(self, sizehint):
+        return self.frame_buffer.writable()
+
+    def buffer_updated(self, nbytes):
+        self.frame_buffer.commit(nbytes)
+        try:
+            for payload in self.frame_buffer.frames():
+                self._enqueue(payload)
+        except ValueError as e:
+            logger.debug(f"Conexão TCP de {self.addr} encerrada: {e}")
+            self.transport.close()
+
+    def eof_received(self):
+        for payload in self.frame_buffer.legacy_messages():
+            self._enqueue(payload)
+        return False
+
+    def connection_lost(self, exc):
+        self.frame_buffer.close()
+
+    def _enqueue(self, payload):
+        """Deserializa o payload (o buffer será reutilizado) e agenda seu processamento."""
+        try:
+            message = decode_message(payload)
+        except Exception as e:
+            logger.error(f"Erro ao tratar mensagem TCP de {self.addr}: {e}")
+            return
+        self.communication.metrics.received(message.get('type'), len(payload))
+        self.pending.append(message)
+        if len(self.pending) >= self.MAX_PENDING:
+            self.transport.pause_reading() # Contrapressão: o remetente espera o processamento
+        if not self.draining:
+            self.draining = True
+            self.communication.loop.create_task(self._drain())
+
+    async def _drain(self):
+        """Entrega as mensagens pendentes ao handler do nó, em ordem."""
+        try:
+            while self.pending:
+                message = self.pending.popleft()
+                await self.communication.run_handler(self.communication.message_handler_tcp, message, self.addr)
+                if len(self.pending) < self.MAX_PENDING // 2 and not self.transport.is_closing():
+                    self.transport.resume_reading()
+        finally:
+            self.draining = False
+
+class _ScheduledCall:
+    """Chamada agendada no loop de eventos, que pode ser cancelada de qualquer thread."""
+    def __init__(self, loop):
+        self.loop = loop
+        self.handle = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        if self.handle is not None:
+            self.loop.call_soon_threadsafe(self.handle.cancel)
+
+class AsyncCommunication:
+    """Backend de comunicação baseado em asyncio, com a mesma interface de Communication.
+    Accept TCP, recepção multicast, envios e timers rodam em um único loop de eventos;
+    os handlers do nó (que fazem envios bloqueantes) rodam em um pool limitado de threads.
+    """
+    def __init__(self, node_ip, node_port, message_handler_tcp, message_handler_udp,
+                 queue_policy="drop_oldest", max_queue_depth=1000, max_workers=8, transport=None, metrics=None):
+        self.node_ip = node_ip
+        self.node_port = node_port
+        self.message_handler_tcp = message_handler_tcp  # Função para processar mensagens TCP
+        self.message_handler_udp = message_handler_udp  # Função para processar mensagens UDP
+        # O loop de eventos precisa de sockets reais; a rede em memória só é suportada pelo backend com threads
+        if transport is not None and not isinstance(transport, SocketTransport):
+            raise ValueError("o backend asyncio suporta apenas o transporte de sockets")
+        self.transport = transport or SocketTransport()
+        # Contadores de mensagens, bytes, falhas de envio e latência de conexão
+        self.metrics = CommunicationMetrics(metrics or Metrics())
+        # Codec negociado com cada peer (binário ou JSON)
+        self.codecs = PeerCodecs()
+
+        # Os sockets são criados aqui para que erros de bind apareçam na inicialização, como no backend com threads
+        self.tcp_socket = self.transport.listen_tcp(self.node_ip, self.node_port, backlog=100)
+        self.tcp_socket.setblocking(False)
+        logger.info(f"Listener TCP (asyncio) iniciado em {self.node_ip}:{self.node_port}")
+
+        self.udp_multicast_socket = self.transport.multicast_receiver(MULTICAST_GROUP, MULTICAST_PORT)
+        self.udp_multicast_socket.setblocking(False)
+        logger.info(f"Listener Multicast UDP (asyncio) iniciado em {MULTICAST_GROUP}:{MULTICAST_PORT}")
+
+        # Socket único para envio multicast, reutilizado entre chamadas
+        self.udp_send_socket = self.transport.multicast_sender()
+        self._channels = []  # Sockets dos canais multicast adicionais (open_multicast_channel)
+
+        self.buffer_pool = BufferPool()
+        self.udp_buffer = bytearray(MAX_DATAGRAM_SIZE)
+        self.connect_timeout = 3.0
+        self.idle_timeout = 30.0
+        self._connections = {}  # (ip, port) -> [reader, writer, timestamp do último uso]
+        self._peer_locks = {}   # (ip, port) -> asyncio.Lock que serializa escritas na conexão
+        # Filas de saída por peer, esvaziadas por uma tarefa de escrita no loop
+        self.queue_policy = queue_policy
+        self.max_queue_depth = max_queue_depth
+        self._outboxes = {}       # (ip, port) -> PeerOutbox
+        self._outbox_lock = threading.Lock()
+        self._writer_events = {}  # (ip, port) -> asyncio.Event que acorda a tarefa de escrita
+
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="handler")
+        self.stop_event = threading.Event()
+        self._loop_thread = None
+        self._server = None
+        self._tasks = []
+
+    def start(self):
+        """Inicia o loop de eventos em uma thread e os listeners TCP e UDP."""
+        self._loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._loop_thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_listeners(), self.loop).result()
+
+    async def _start_listeners(self):
+        self._server = await self.loop.create_server(lambda: _FramedProtocol(self), sock=self.tcp_socket)
+        self._tasks.append(self.loop.create_task(self._listen_udp_multicast()))
+        self._tasks.append(self.loop.create_task(self._evict_idle_connections()))
+
+    def _in_loop_thread(self):
+        return threading.current_thread() is self._loop_thread
+
+    def _require_off_loop(self, operation):
+        """Os envios síncronos esperam o loop: chamados nele, nunca terminariam (ou informariam um envio que
+        não aconteceu). Os handlers do nó rodam no pool de threads; no loop, use post_tcp_message."""
+        if self._in_loop_thread():
+            raise RuntimeError(f"{operation} não pode ser chamado na thread do loop de eventos")
+
+    async def run_handler(self, handler, *args):
+        """Executa um handler bloqueante do nó no pool de threads, sem travar o loop."""
+        try:
+            await self.loop.run_in_executor(self.executor, handler, *args)
+        except Exception as e:
+            logger.error(f"Erro no handler {getattr(handler, '__name__', handler)}: {e}")
+
+    async def _listen_udp_multicast(self):
+        """Recebe mensagens multicast direto no buffer pré-alocado."""
+        view = memoryview(self.udp_buffer)
+        while not self.stop_event.is_set():
+            try:
+                size, addr = await self.loop.sock_recvfrom_into(self.udp_multicast_socket, self.udp_buffer)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not self.stop_event.is_set():
+                    logger.error(f"Erro no listener UDP multicast: {e}")
+                break
+            # Ignora as próprias mensagens multicast
+            if addr[0] == self.node_ip:
+                continue
+            try:
+                message = deserialize_message(str(view[:size], 'utf-8'))
+            except Exception as e:
+                logger.error(f"Mensagem UDP inválida de {addr}: {e}")
+                continue
+            self.metrics.received(message.get('type'), size)
+            # Um datagrama por vez, na ordem de chegada (como a thread do listener no backend com threads):
+            # mensagens de controle, como os JOIN_REQUESTs, não são tratadas em paralelo
+            await self.run_handler(self.message_handler_udp, message, addr)
+
+    async def _get_connection(self, key):
+        """Reutiliza a conexão persistente com o peer ou abre uma nova."""
+        conn = self._connections.get(key)
+        if conn is not None:
+            reader, writer, last_used = conn
+            if not writer.is_closing() and not reader.at_eof() and time.time() - last_used <= self.idle_timeout:
+                return conn, True
+            self._drop_connection(key)
+        started = time.perf_counter()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*key), self.connect_timeout)
+        self.metrics.connect_latency.observe(time.perf_counter() - started)
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = [reader, writer, time.time()]
+        self._connections[key] = conn
+        return conn, False
+
+    def _drop_connection(self, key):
+        conn = self._connections.pop(key, None)
+        if conn is not None:
+            conn[1].close()
+
+    async def _send(self, key, data):
+        """Escreve um frame na conexão do peer. Uma conexão reutilizada que falhar é reaberta uma vez."""
+        lock = self._peer_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            for attempt in range(2):
+                conn, reused = await self._get_connection(key)
+                try:
+                    conn[1].write(data)
+                    await asyncio.wait_for(conn[1].drain(), self.connect_timeout)
+                    conn[2] = time.time()
+                    return True
+                except (OSError, asyncio.TimeoutError):
+                    self._drop_connection(key)
+                    if not reused or attempt:
+                        raise
+
+    def send_tcp_message(self, target_ip, target_port, message):
+        """Envia uma mensagem TCP para um destino específico. Bloqueia até o envio (fora da thread do loop)."""
+        self._require_off_loop("send_tcp_message")
+        data = encode_frame(self.codecs.encode(message, target_ip, target_port))
+        self.metrics.sent(message.get('type'), len(data))
+        try:
+            asyncio.run_coroutine_threadsafe(self._send((target_ip, target_port), data), self.loop).result()
+            logger.debug(f"Mensagem TCP enviada para {target_ip}:{target_port}: {message.get('type')}")
+            return True
+        except Exception as e:
+            logger.warning(f"Falha ao enviar mensagem TCP para {target_ip}:{target_port}: {e}")
+            self.metrics.send_failed(target_ip, target_port)
+            return False
+
+    def broadcast(self, targets, message, deadline=3.0):
+        """Envia a mesma mensagem para vários peers em paralelo, com um prazo total único.
+        `targets` mapeia ID -> {ip, port, ...}. Retorna um dicionário ID -> True/False;
+        envios que não terminarem dentro do prazo são reportados como falha. Bloqueia (fora da thread do loop).
+        """
+        self._require_off_loop("broadcast")
+        if not targets:
+            return {}
+        msg_type = message.get('type')
+        # Serializada uma vez por codec negociado com os destinos: destino -> frame
+        frames = {}
+        for payload, members in self.codecs.encode_for(message, targets):
+            data = encode_frame(payload)
+            self.metrics.sent(msg_type, len(data), count=len(members))
+            frames.update((pid, data) for pid in members)
+        return asyncio.run_coroutine_threadsafe(self._broadcast(targets, frames, msg_type, deadline), self.loop).result()
+
+    async def _broadcast(self, targets, frames, msg_type, deadline):
+        tasks = {
+            self.loop.create_task(self._send_logged(self._send((pinfo["ip"], pinfo["port"]), frames[pid]), pinfo["ip"], pinfo["port"])): pid
+            for pid, pinfo in targets.items()
+        }
+        done, not_done = await asyncio.wait(tasks, timeout=deadline)
+        results = {tasks[t]: t.result() for t in done}
+        for t in not_done:
+            # O envio continua em segundo plano, mas é reportado como falha
+            logger.warning(f"Envio de {msg_type} para o peer {tasks[t]} excedeu o prazo de {deadline}s.")
+            results[tasks[t]] = False
+        return results
+
+    async def _send_logged(self, coro, target_ip, target_port):
+        """Aguarda um envio, registrando a falha em vez de propagá-la. Retorna True em caso de sucesso."""
+        try:
+            return await coro
+        except Exception as e:
+            logger.warning(f"Falha ao enviar mensagem TCP para {target_ip}:{target_port}: {e}")
+            self.metrics.send_failed(target_ip, target_port)
+            return False
+
+    def post_tcp_message(self, target_ip, target_port, message):
+        """Enfileira uma mensagem para envio assíncrono pela fila de saída do peer.
+        Retorna False se a fila estava cheia e a mensagem foi descartada.
+        """
+        data = encode_frame(self.codecs.encode(message, target_ip, target_port))
+        self.metrics.sent(message.get('type'), len(data))
+        return self._post((target_ip, target_port), data, message.get('type'))
+
+    def post_broadcast(self, targets, message):
+        """Enfileira a mesma mensagem (serializada uma única vez por codec) para vários peers.
+        Retorna um dicionário ID -> True/False indicando se a mensagem foi aceita na fila.
+        """
+        msg_type = message.get('type')
+        results = {}
+        for payload, members in self.codecs.encode_for(message, targets):
+            data = encode_frame(payload)
+            self.metrics.sent(msg_type, len(data), count=len(members))
+            for pid, pinfo in members.items():
+                results[pid] = self._post((pinfo["ip"], pinfo["port"]), data, msg_type)
+        return results
+
+    def _post(self, key, frame, msg_type):
+        with self._outbox_lock:
+            outbox = self._outboxes.get(key)
+            if outbox is None:
+                outbox = PeerOutbox(self.max_queue_depth, self.queue_policy)
+                self._outboxes[key] = outbox
+        # A política "block" não pode travar o loop de eventos
+        accepted = outbox.put(frame, control=msg_type not in BULK_TYPES, can_block=not self._in_loop_thread())
+        if not accepted:
+            logger.warning(f"Fila de saída para {key[0]}:{key[1]} cheia. Mensagem {msg_type} descartada.")
+        self.loop.call_soon_threadsafe(self._wake_writer, key, outbox)
+        return accepted
+
+    def _wake_writer(self, key, outbox):
+        """Acorda a tarefa de escrita do peer, criando-a se necessário."""
+        event = self._writer_events.get(key)
+        if event is None:
+            event = asyncio.Event()
+            self._writer_events[key] = event
+            self.loop.create_task(self._write_loop(key, outbox, event))
+        event.set()
+
+    async def _write_loop(self, key, outbox, event):
+        """Tarefa de escrita de um peer: agrupa os frames pendentes (controle primeiro) em uma única escrita."""
+        try:
+            while not outbox.closed:
+                try:
+                    await asyncio.wait_for(event.wait(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if not len(outbox):
+                        return # Encerra por ociosidade; será recriada no próximo envio
+                event.clear()
+                while len(outbox) and not outbox.closed:
+                    if not outbox.has_control() and outbox.size < MAX_BATCH_BYTES:
+                        await asyncio.sleep(FLUSH_INTERVAL) # Janela curta para agrupar mais mensagens de chat
+                    frames = outbox.drain(MAX_BATCH_BYTES)
+                    try:
+                        await self._send(key, b"".join(frames))
+                    except Exception as e:
+                        logger.warning(f"Falha ao enviar {len(frames)} mensagens enfileiradas para {key[0]}:{key[1]}: {e}")
+                        self.metrics.send_failed(*key)
+        finally:
+            if self._writer_events.get(key) is event:
+                del self._writer_events[key]
+
+    def set_peer_codecs(self, target_ip, target_port, offered):
+        """Registra os codecs anunciados por um peer (None se ele não anunciou: só JSON)."""
+        self.codecs.set(target_ip, target_port, offered)
+
+    def close_peer(self, target_ip, target_port):
+        """Fecha a conexão persistente e a fila de saída mantidas com um peer que saiu da rede."""
+        self.codecs.forget(target_ip, target_port)
+        key = (target_ip, target_port)
+        with self._outbox_lock:
+            outbox = self._outboxes.pop(key, None)
+        if outbox is not None:
+            outbox.close()
+        self.loop.call_soon_threadsafe(self._forget_peer, key)
+
+    def _forget_peer(self, key):
+        """Fecha a conexão com o peer e descarta o seu lock de escrita (se não houver um envio em andamento)."""
+        self._drop_connection(key)
+        lock = self._peer_locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._peer_locks[key]
+
+    async def _evict_idle_connections(self):
+        """Fecha periodicamente as conexões que ficaram ociosas."""
+        while not self.stop_event.is_set():
+            await asyncio.sleep(5.0)
+            now = time.time()
+            for key, conn in list(self._connections.items()):
+                if now - conn[2] > self.idle_timeout and not (key in self._peer_locks and self._peer_locks[key].locked()):
+                    self._drop_connection(key)
+            # Locks de peers sem conexão (ex.: envio em andamento quando o peer saiu, ou conexão que falhou)
+            for key, lock in list(self._peer_locks.items()):
+                if key not in self._connections and not lock.locked():
+                    del self._peer_locks[key]
+
+    def send_udp_multicast(self, message):
+        """Envia uma mensagem para o grupo multicast."""
+        try:
+            data = serialize_message(message).encode('utf-8')
+            self.udp_send_socket.sendto(data, (MULTICAST_GROUP, MULTICAST_PORT))
+            self.metrics.sent(message.get('type'), len(data))
+            logger.debug(f"Mensagem UDP multicast enviada: {message.get('type')}")
+            return True
+        except Exception as e:
+            logger.error(f"Falha ao enviar mensagem UDP multicast: {e}")
+            return False
+
+    def send_multicast_datagram(self, data, port):
+        """Envia um datagrama já codificado para o grupo multicast, na porta de um canal. Retorna True em caso de sucesso."""
+        try:
+            self.udp_send_socket.sendto(data, (MULTICAST_GROUP, port))
+            self.metrics.sent("MULTICAST_DATAGRAM", len(data))
+            return True
+        except OSError as e:
+            logger.warning(f"Falha ao enviar datagrama multicast para a porta {port}: {e}")
+            return False
+
+    def open_multicast_channel(self, port, handler):
+        """Inscreve o nó em um canal multicast adicional: `handler(data, addr)` recebe cada datagrama (bytes),
+        em ordem de chegada, no pool de handlers. Levanta OSError se o multicast não estiver disponível."""
+        sock = self.transport.multicast_receiver(MULTICAST_GROUP, port)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, CHANNEL_RECV_BUFFER) # Absorve rajadas de datagramas
+        sock.setblocking(False)
+        self._channels.append(sock)
+
+        def schedule():
+            self._tasks.append(self.loop.create_task(self._listen_channel(sock, handler)))
+        self.loop.call_soon_threadsafe(schedule)
+        logger.info(f"Canal multicast (asyncio) iniciado em {MULTICAST_GROUP}:{port}")
+
+    async def _listen_channel(self, sock, handler):
+        buffer = bytearray(MAX_DATAGRAM_SIZE)
+        view = memoryview(buffer)
+        while not self.stop_event.is_set():
+            try:
+                size, addr = await self.loop.sock_recvfrom_into(sock, buffer)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not self.stop_event.is_set():
+                    logger.error(f"Erro no canal multicast: {e}")
+                break
+            self.metrics.received("MULTICAST_DATAGRAM", size)
+            # Um datagrama por vez, na ordem de chegada
+            await self.run_handler(handler, bytes(view[:size]), addr)
+
+    def call_later(self, delay, callback, *args):
+        """Agenda `callback` para rodar após `delay` segundos, fora da thread do loop."""
+        call = _ScheduledCall(self.loop)
+
+        def fire():
+            if not call.cancelled and not self.stop_event.is_set():
+                self.loop.create_task(self.run_handler(callback, *args))
+
+        def schedule():
+            call.handle = self.loop.call_later(delay, fire)
+        self.loop.call_soon_threadsafe(schedule)
+        return call
+
+    def run_periodic(self, interval, callback):
+        """Executa `callback` a cada `interval` segundos enquanto a comunicação estiver ativa."""
+        async def periodic():
+            while not self.stop_event.is_set():
+                await asyncio.sleep(interval)
+                if not self.stop_event.is_set():
+                    await self.run_handler(callback)
+
+        def schedule():
+            self._tasks.append(self.loop.create_task(periodic()))
+        self.loop.call_soon_threadsafe(schedule)
+
+    async def _shutdown(self):
+        with self._outbox_lock:
+            for outbox in self._outboxes.values():
+                outbox.close()
+            self._outboxes.clear()
+        if self._server is not None:
+            self._server.close()
+        for key in list(self._connections):
+            self._drop_connection(key)
+        # Cancela as tarefas restantes (listeners, escritores, handlers) antes de parar o loop
+        tasks = [t for t in asyncio.all_tasks(self.loop) if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        """Encerra o loop de eventos, os sockets e o pool de handlers."""
+        self.stop_event.set()
+        if self._loop_thread is not None and self.loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout=2.0)
+            except Exception as e:
+                logger.debug(f"Erro ao encerrar o loop de eventos: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.tcp_socket.close()
+        self.udp_multicast_socket.close()
+        self.udp_send_socket.close()
+        for sock in self._channels:
+            sock.close()
+        self.executor.shutdown(wait=False)
+        logger.info("Módulo de comunicação (asyncio) encerrado.")
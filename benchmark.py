@@ -0,0 +1,222 @@
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import time
+import uuid
+from codec import decode_message, encode_message
+from simulation import Simulation
+
+# Histórico de execuções, uma por linha; fica no repositório (data/ não é versionado) para que as regressões apareçam
+RESULTS_PATH = os.path.join("benchmarks", "results.jsonl")
+REGRESSION_THRESHOLD = 0.2  # Piora relativa (20%) a partir da qual uma métrica é marcada como regressão
+# Métricas em que um valor maior é melhor; nas demais (tempos, bytes), menor é melhor
+HIGHER_IS_BETTER = {"chat_deliveries_per_s", "chat_delivered_ratio", "restart_same_id"}
+STALL_TIMEOUT = 2.0  # Sem novas entregas por esse tempo, o fan-out é dado como encerrado (o gossip pode perder mensagens)
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def bench_join(sim):
+    """Latência de entrada na rede (JOIN_REQUEST até JOIN_ACK) e tempo até todas as tabelas convergirem."""
+    latencies = [node.join_latency * 1000 for node in sim.nodes[1:]]
+    converge = sim.wait_until(sim.converged, timeout=30)
+    return {
+        "join_p50_ms": statistics.median(latencies),
+        "join_p95_ms": _percentile(latencies, 0.95),
+        "join_max_ms": max(latencies),
+        "membership_converge_ms": converge * 1000 if converge is not None else None,
+    }
+
+def bench_idle_overhead(sim, duration):
+    """Tráfego de controle (detector de falhas, heartbeats) com a rede ociosa, por nó e no coordenador."""
+    before = dict(sim.network.bytes_sent), dict(sim.network.sends)
+    time.sleep(duration)
+    after = dict(sim.network.bytes_sent), dict(sim.network.sends)
+    sent = {ip: after[0].get(ip, 0) - before[0].get(ip, 0) for ip in after[0]}
+    sends = {ip: after[1].get(ip, 0) - before[1].get(ip, 0) for ip in after[1]}
+    coordinator = sim.coordinator()
+    return {
+        "idle_bytes_per_node_s": sum(sent.values()) / len(sim.nodes) / duration,
+        "idle_sends_per_node_s": sum(sends.values()) / len(sim.nodes) / duration,
+        "idle_coordinator_bytes_s": sent.get(coordinator.host, 0) / duration if coordinator else None,
+    }
+
+def bench_chat_fanout(sim, messages):
+    """Tempo para `messages` mensagens de um nó chegarem a todos os outros e entregas por segundo."""
+    sender = sim.nodes[-1]
+    receivers = [node for node in sim.alive() if node is not sender]
+    expected = {node.id: len(node.message_log) + messages for node in receivers}
+    started = time.time()
+    for i in range(messages):
+        sender.send_chat_message(f"mensagem {i}")
+
+    def count():
+        return sum(min(messages, len(node.message_log) - expected[node.id] + messages) for node in receivers)
+
+    # Espera todas as entregas ou até elas pararem de avançar; o tempo medido vai até a última entrega
+    delivered, last_progress = count(), time.time()
+    while delivered < messages * len(receivers) and time.time() - last_progress < STALL_TIMEOUT:
+        time.sleep(0.01)
+        current = count()
+        if current > delivered:
+            delivered, last_progress = current, time.time()
+    elapsed = last_progress - started
+    return {
+        "chat_fanout_ms": elapsed * 1000,
+        "chat_deliveries_per_s": delivered / elapsed,
+        "chat_delivered_ratio": delivered / (messages * len(receivers)),
+    }
+
+def bench_restart(sim):
+    """Reinício de um nó comum a partir do snapshot: entrada na rede, convergência e se o ID foi mantido."""
+    index = len(sim.nodes) // 2
+    old_id = sim.nodes[index].id
+    sim.crash(index)
+    node = sim.restart(index)
+    converge = sim.wait_until(sim.converged, timeout=30)
+    return {
+        "restart_join_ms": node.join_latency * 1000,
+        "restart_converge_ms": converge * 1000 if converge is not None else None,
+        "restart_same_id": float(node.id == old_id),
+    }
+
+def bench_election(sim):
+    """Tempo entre a queda do coordenador e a convergência dos nós restantes (detecção + eleição)."""
+    old = sim.coordinator()
+    started = time.time()
+    sim.crash(sim.nodes.index(old))
+    converge = sim.wait_until(lambda: sim.converged() and sim.alive()[0].coordinator_id != old.id, timeout=60)
+    elected = [node.election.stats for node in sim.alive() if node.election.stats["elections"]]
+    return {
+        "election_convergence_ms": converge * 1000 if converge is not None else None,
+        "election_only_ms": max((s["last_duration"] for s in elected), default=0) * 1000,
+        "election_messages": sum(s["last_messages"] for s in elected),
+    }
+
+def _codec_samples():
+    """Mensagens típicas de cada categoria, para o micro-benchmark dos codecs."""
+    peers = {i: {"ip": f"10.0.0.{i}", "port": 9000, "username": f"user{i}", "codecs": ["binary", "json"]} for i in range(1, 21)}
+    entry = {"ts": time.time(), "msg_id": uuid.uuid4().hex, "sender_id": 3, "username": "user3", "text": "mensagem de teste"}
+    return {
+        "heartbeat": {"type": "HEARTBEAT", "sender_id": 1, "version": 42, "digest": "0123456789abcdef"},
+        "election": {"type": "ELECTION", "sender_id": 7},
+        "chat": {"type": "CHAT_MESSAGE", "msg_id": uuid.uuid4().hex, "sender_id": 3, "username": "user3",
+                 "text": "olá, tudo bem com todos?", "ts": time.time()},
+        "ping": {"type": "PING", "seq": 1234, "updates": [{"id": 5, "state": "suspect", "inc": 2}],
+                 "coordinator_beat": [20, 311], "version": 42, "sender_id": 3, "ip": "10.0.0.3", "port": 9000},
+        "join_ack": {"type": "JOIN_ACK", "id": 21, "coordinator_id": 20, "peers": peers, "version": 42},
+        "catchup_chunk": {"type": "CATCHUP_CHUNK", "sender_id": 20, "entries": [dict(entry, seq=i) for i in range(200)],
+                          "next_seq": 201, "done": True},
+    }
+
+def bench_codecs(iterations):
+    """Micro-benchmark dos codecs: bytes na rede e tempo (µs) de codificação e decodificação por mensagem."""
+    results = {}
+    for name, message in _codec_samples().items():
+        rounds = max(1, iterations // 50) if name == "catchup_chunk" else iterations
+        for codec in ("json", "binary"):
+            started = time.perf_counter()
+            for _ in range(rounds):
+                payload = encode_message(message, codec)
+            encoded = time.perf_counter()
+            for _ in range(rounds):
+                decode_message(payload)
+            decoded = time.perf_counter()
+            results[f"codec_{name}_{codec}_bytes"] = len(payload)
+            results[f"codec_{name}_{codec}_encode_us"] = (encoded - started) / rounds * 1e6
+            results[f"codec_{name}_{codec}_decode_us"] = (decoded - encoded) / rounds * 1e6
+    return results
+
+def run(args):
+    options = {
+        "election": args.election,
+        "failure_detector": args.failure_detector,
+        "dissemination": args.dissemination,
+        "group_size": args.group_size,
+    }
+    sim = Simulation(args.nodes, latency=args.latency / 1000, jitter=args.jitter / 1000, loss=args.loss,
+                     seed=args.seed, **options)
+    results = {}
+    # As mensagens de chat recebidas são impressas pelos nós; durante o benchmark elas são descartadas
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            sim.start()
+            results.update(bench_join(sim))
+            time.sleep(2) # Deixa terminar a sincronização inicial do histórico
+            results.update(bench_idle_overhead(sim, args.idle))
+            results.update(bench_chat_fanout(sim, args.messages))
+            results.update(bench_restart(sim))
+            results.update(bench_election(sim))
+        finally:
+            sim.stop()
+    return results
+
+def load_previous(path, config):
+    """Última execução salva com a mesma configuração, ou None."""
+    previous = None
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record["config"] == config:
+                    previous = record
+    return previous
+
+def report(results, previous):
+    """Imprime os resultados e a variação em relação à execução anterior, marcando regressões."""
+    regressions = []
+    for name, value in results.items():
+        line = f"  {name:36} {value:12.2f}" if value is not None else f"  {name:36} {'-':>12}"
+        old = previous["results"].get(name) if previous else None
+        if value is not None and old:
+            change = (value - old) / old
+            worse = -change if name in HIGHER_IS_BETTER else change
+            line += f"  ({change:+.0%})"
+            if worse > REGRESSION_THRESHOLD:
+                line += "  REGRESSÃO"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do chat distribuído em uma simulação em memória.")
+    parser.add_argument("--nodes", type=int, default=20, help="número de nós (padrão: 20)")
+    parser.add_argument("--latency", type=float, default=1.0, help="latência de ida da rede, em ms (padrão: 1)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="jitter máximo, em ms (padrão: 0.5)")
+    parser.add_argument("--loss", type=float, default=0.0, help="probabilidade de perda por envio (padrão: 0)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--messages", type=int, default=200, help="mensagens no teste de fan-out (padrão: 200)")
+    parser.add_argument("--idle", type=float, default=5.0, help="duração (s) da medição com a rede ociosa")
+    parser.add_argument("--election", choices=["bully", "fast"], default="bully")
+    parser.add_argument("--failure-detector", choices=["swim", "heartbeat"], default="swim")
+    parser.add_argument("--dissemination", choices=["direct", "gossip", "multicast"], default="direct")
+    parser.add_argument("--group-size", type=int, help="nós por grupo no modo hierárquico (padrão: rede plana)")
+    parser.add_argument("--codecs", action="store_true", help="executa apenas o micro-benchmark dos codecs de mensagem")
+    parser.add_argument("--codec-iterations", type=int, default=20000, help="repetições por mensagem no micro-benchmark")
+    parser.add_argument("--output", default=RESULTS_PATH, help=f"arquivo de resultados (padrão: {RESULTS_PATH})")
+    parser.add_argument("--no-save", action="store_true", help="não grava os resultados desta execução")
+    parser.add_argument("--verbose", action="store_true", help="mostra os logs dos nós")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.ERROR)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "no_save", "verbose")}
+    results = bench_codecs(args.codec_iterations) if args.codecs else run(args)
+    previous = load_previous(args.output, config)
+    print(("Resultados (codecs):" if args.codecs else f"Resultados ({args.nodes} nós):") + (f" comparados com a execução de {previous['date']}" if previous else ""))
+    regressions = report(results, previous)
+    if not args.no_save:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "a") as f:
+            f.write(json.dumps({"date": time.strftime("%Y-%m-%d %H:%M:%S"), "config": config, "results": results}) + "\n")
+    if regressions:
+        print(f"Regressões (piora acima de {REGRESSION_THRESHOLD:.0%}): {', '.join(regressions)}")
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from rooms import DEFAULT_ROOM
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+class CatchUp:
+    """Sincronização incremental do histórico de chat para nós que entram ou voltam à rede.
+    O nó informa a última sequência que já tem do log da fonte (o coordenador, por padrão) e
+    recebe apenas o intervalo que falta, em blocos. Após cada bloco o cursor é gravado em disco,
+    então uma sincronização interrompida é retomada do ponto onde parou. Só vêm as mensagens das
+    salas em que o nó está inscrito (e que a fonte recebeu, isto é, das salas em que ela também está).
+    """
+    CHUNK_SIZE = 200      # Entradas por bloco
+    TIME_MARGIN = 5.0     # Margem (s) para diferenças de relógio ao localizar o início do intervalo
+    RETRY_TIMEOUT = 5.0   # Tempo sem resposta antes de reenviar a requisição a partir do cursor
+    SETTLE_DELAY = 1.0    # Espera antes da rodada final, até todos os peers conhecerem o novo nó
+
+    def __init__(self, node):
+        self.node = node  # Referência ao objeto Node principal
+        self.cursor_path = os.path.join(node.data_dir, "catchup.json")
+        self.cursor = self._load_cursor()  # {"source": ID da fonte, "seq": última sequência aplicada do log da fonte}
+        self.session = None  # Sincronização em andamento
+        self._lock = threading.Lock()
+        # Requisições e blocos são processados fora da thread da conexão, para não atrasar o tráfego normal
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catchup")
+
+    def _load_cursor(self):
+        try:
+            with open(self.cursor_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"source": None, "seq": 0}
+
+    def _save_cursor(self):
+        tmp_path = self.cursor_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.cursor, f)
+        os.replace(tmp_path, self.cursor_path)
+
+    def start(self, source_id, final=False):
+        """Inicia a sincronização do histórico a partir do log do peer `source_id`.
+        Ao terminar, uma rodada final (`final=True`) busca as mensagens enviadas por peers que
+        ainda não conheciam este nó quando ele entrou."""
+        if source_id is None or source_id == self.node.id:
+            return
+        last = self.node.message_log.tail(1)
+        with self._lock:
+            # Com a mesma fonte, o cursor indica exatamente onde continuar; com outra, parte do horário da última mensagem
+            from_seq = self.cursor["seq"] + 1 if self.cursor.get("source") == source_id else 1
+            self.session = {
+                "source": source_id,
+                "from_seq": from_seq,
+                "since_ts": last[0]["ts"] if last else 0,
+                "received": 0,
+                "requested_at": 0,
+                "final": final,
+            }
+        logger.info(f"Nó {self.node.id}: Sincronizando histórico com o nó {source_id} a partir da sequência {from_seq}.")
+        self._request()
+
+    def _request(self):
+        with self._lock:
+            session = self.session
+            if session is None:
+                return
+            session["requested_at"] = time.time()
+            source = self.node.peers.get(session["source"])
+            request = {
+                "type": "CATCHUP_REQUEST",
+                "sender_id": self.node.id,
+                "ip": self.node.host,
+                "port": self.node.port,
+                "from_seq": session["from_seq"],
+                "since_ts": session["since_ts"],
+                "limit": self.CHUNK_SIZE,
+                "rooms": self.node.rooms.listing(),
+            }
+        if source is not None:
+            self.node.communication.post_tcp_message(source["ip"], source["port"], request)
+
+    def check_progress(self):
+        """Retoma uma sincronização parada (ex.: conexão perdida). Executado periodicamente."""
+        with self._lock:
+            session = self.session
+            if session is None or time.time() - session["requested_at"] < self.RETRY_TIMEOUT:
+                return
+            if session["source"] not in self.node.peers:
+                # A fonte saiu da rede: continua com o coordenador atual a partir do horário da última mensagem
+                if self.node.coordinator_id in (None, self.node.id):
+                    self.session = None
+                    return
+                session["source"] = self.node.coordinator_id
+                session["from_seq"] = 1
+        logger.info(f"Nó {self.node.id}: Retomando sincronização do histórico com o nó {session['source']} "
+                    f"a partir da sequência {session['from_seq']}.")
+        self._request()
+
+    def handle_request(self, message):
+        """Trata uma CATCHUP_REQUEST, respondendo com um bloco do histórico."""
+        self._submit(self._serve, message)
+
+    def _serve(self, message):
+        log = self.node.message_log
+        start = max(message["from_seq"], log.find_seq_by_time(message["since_ts"] - self.TIME_MARGIN))
+        entries = log.read(start, min(message["limit"], self.CHUNK_SIZE))
+        next_seq = start + len(entries)
+        rooms = set(message.get("rooms", (DEFAULT_ROOM,))) # Nós de versões antigas só conhecem a sala padrão
+        selected = []
+        for entry in entries:
+            room = entry.get("room") or DEFAULT_ROOM
+            if room in rooms:
+                selected.append(dict({key: entry.get(key) for key in ("ts", "msg_id", "sender_id", "username", "text")},
+                                     room=room))
+        chunk = {
+            "type": "CATCHUP_CHUNK",
+            "sender_id": self.node.id,
+            "entries": selected,
+            "next_seq": next_seq,
+            "done": next_seq > log.last_seq,
+        }
+        self.node.communication.post_tcp_message(message["ip"], message["port"], chunk)
+        logger.debug(f"Nó {self.node.id}: Enviou {len(selected)} mensagens do histórico para o nó {message['sender_id']}.")
+
+    def handle_chunk(self, message):
+        """Trata um CATCHUP_CHUNK, gravando as mensagens que ainda não estão no histórico."""
+        self._submit(self._apply, message)
+
+    def _submit(self, task, message):
+        try:
+            self.executor.submit(task, message)
+        except RuntimeError:
+            pass # Nó encerrado: o executor já não aceita tarefas
+
+    def _apply(self, message):
+        with self._lock:
+            session = self.session
+            if session is None or message["sender_id"] != session["source"]:
+                return # Bloco de uma sincronização antiga
+        applied = 0
+        for entry in message["entries"]:
+            if entry.get("msg_id") is not None and not self.node.seen_messages.add(entry["msg_id"]):
+                continue # Já recebida diretamente
+            self.node.record_chat(entry, own=entry.get("sender_id") == self.node.id)
+            applied += 1
+        with self._lock:
+            if self.session is not session:
+                return
+            session["received"] += applied
+            session["from_seq"] = message["next_seq"]
+            self.cursor = {"source": session["source"], "seq": message["next_seq"] - 1}
+            self._save_cursor()
+            if message["done"]:
+                self.session = None
+                logger.info(f"Nó {self.node.id}: Histórico sincronizado ({session['received']} mensagens novas).")
+                if not session["final"]:
+                    self.node.communication.call_later(self.SETTLE_DELAY, self.start, session["source"], True)
+                return
+        self._request()
+
+    def stop(self):
+        self.executor.shutdown(wait=False)
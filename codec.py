@@ -0,0 +1,374 @@
+import struct
+import zlib
+from utils import serialize_message, deserialize_message
+
+# Codecs suportados por este nó, em ordem de preferência (anunciados no JOIN_REQUEST e na tabela de peers)
+SUPPORTED_CODECS = ["binary", "json"]
+
+# Envelope dos payloads binários: versão do formato, flags e esquema da mensagem.
+# Payloads JSON sempre começam com "{", então os dois formatos convivem na mesma conexão.
+ENVELOPE = struct.Struct("!BBB")
+BINARY_VERSION = 1
+JSON_START = ord("{")
+FLAG_COMPRESSED = 0x01
+JSON_SCHEMA = 0               # Mensagens sem esquema fixo: corpo JSON dentro do envelope binário
+COMPRESS_THRESHOLD = 1024     # Corpos a partir desse tamanho (bytes) são comprimidos com zlib
+COMPRESS_LEVEL = 1            # Compressão rápida: o ganho está nos blocos de histórico e listas de peers
+MAX_DECOMPRESSED = 64 * 1024 * 1024  # Limite do corpo descomprimido (proteção contra payloads maliciosos)
+
+def negotiate(offered):
+    """Codec a usar com um peer que anunciou `offered` (None se ele não anunciou codecs: JSON)."""
+    for codec in SUPPORTED_CODECS:
+        if offered and codec in offered:
+            return codec
+    return "json"
+
+# --- Campos de tamanho variável ---
+
+_U32 = struct.Struct("!I")
+_U16 = struct.Struct("!H")
+_PEER = struct.Struct("!IHB")    # ID, porta, máscara das listas presentes (PEER_LISTS)
+_UPDATE = struct.Struct("!IBI")  # ID, estado, encarnação
+_CHANGE = struct.Struct("!IBI")  # versão, operação, ID
+_BEAT = struct.Struct("!?II")    # ID do coordenador presente, ID, contador
+SWIM_STATES = ("alive", "suspect", "dead")
+MEMBERSHIP_OPS = ("leave", "join")
+
+class _Str:
+    """Texto UTF-8 precedido do tamanho."""
+    def pack(self, value, parts):
+        data = value.encode('utf-8')
+        parts.append(_U32.pack(len(data)))
+        parts.append(data)
+
+    def unpack(self, buf, offset):
+        (size,) = _U32.unpack_from(buf, offset)
+        offset += _U32.size
+        return str(buf[offset:offset + size], 'utf-8'), offset + size
+
+class _Hex:
+    """Identificador hexadecimal (msg_id, digest), enviado como bytes: metade do tamanho."""
+    def pack(self, value, parts):
+        raw = bytes.fromhex(value)
+        if raw.hex() != value:
+            raise ValueError("hexadecimal fora da forma canônica")
+        parts.append(bytes((len(raw),)))
+        parts.append(raw)
+
+    def unpack(self, buf, offset):
+        size = buf[offset]
+        offset += 1
+        return buf[offset:offset + size].hex(), offset + size
+
+class _Number:
+    """Campo numérico opcional (campos obrigatórios ficam no cabeçalho fixo do esquema)."""
+    def __init__(self, fmt):
+        self.struct = struct.Struct("!" + fmt)
+
+    def pack(self, value, parts):
+        parts.append(self.struct.pack(value))
+
+    def unpack(self, buf, offset):
+        return self.struct.unpack_from(buf, offset)[0], offset + self.struct.size
+
+class _U32List:
+    """Lista de inteiros sem sinal (ex.: sequências pedidas em um NACK)."""
+    def pack(self, value, parts):
+        parts.append(_U32.pack(len(value)))
+        parts.append(struct.pack(f"!{len(value)}I", *value))
+
+    def unpack(self, buf, offset):
+        (count,) = _U32.unpack_from(buf, offset)
+        offset += _U32.size
+        return list(struct.unpack_from(f"!{count}I", buf, offset)), offset + 4 * count
+
+class _Beat:
+    """Contador de vida do coordenador no SWIM: [ID ou None, contador]."""
+    def pack(self, value, parts):
+        coordinator_id, counter = value
+        parts.append(_BEAT.pack(coordinator_id is not None, coordinator_id or 0, counter))
+
+    def unpack(self, buf, offset):
+        present, coordinator_id, counter = _BEAT.unpack_from(buf, offset)
+        return [coordinator_id if present else None, counter], offset + _BEAT.size
+
+class _Updates:
+    """Atualizações de estado do SWIM levadas de carona: [{id, state, inc}]."""
+    def pack(self, value, parts):
+        parts.append(_U16.pack(len(value)))
+        for update in value:
+            if len(update) != 3:
+                raise ValueError("atualização com campos inesperados")
+            parts.append(_UPDATE.pack(update["id"], SWIM_STATES.index(update["state"]), update["inc"]))
+
+    def unpack(self, buf, offset):
+        (count,) = _U16.unpack_from(buf, offset)
+        offset += _U16.size
+        updates = []
+        for peer_id, state, inc in _UPDATE.iter_unpack(bytes(buf[offset:offset + count * _UPDATE.size])):
+            updates.append({"id": peer_id, "state": SWIM_STATES[state], "inc": inc})
+        return updates, offset + count * _UPDATE.size
+
+_STR = _Str()
+
+class _Strings:
+    """Lista de textos (ex.: salas de um pedido de histórico), em um único bloco separado por NUL."""
+    def pack(self, value, parts):
+        if not isinstance(value, list):
+            raise ValueError("lista esperada")
+        parts.append(_U32.pack(len(value)))
+        _pack_texts(value, parts)
+
+    def unpack(self, buf, offset):
+        (count,) = _U32.unpack_from(buf, offset)
+        return _unpack_texts(buf, offset + _U32.size, count)
+
+# Listas opcionais de uma entrada da tabela de peers: codecs suportados, salas inscritas e recursos
+# opcionais do nó (ex.: "multicast": recebe o chat pelo canal multicast)
+PEER_LISTS = ("codecs", "rooms", "features")
+
+def _peer_texts(info):
+    """Máscara das listas presentes e textos (ip, usuário, listas unidas por vírgula) de uma entrada de peer."""
+    present = 0
+    texts = [info["ip"], info["username"]]
+    for bit, key in enumerate(PEER_LISTS):
+        values = info.get(key)
+        if values is not None:
+            if not isinstance(values, list) or any("," in value for value in values):
+                raise ValueError(f"lista {key} inválida")
+            present |= 1 << bit
+        texts.append(",".join(values) if values is not None else "")
+    if len(info) != 3 + bin(present).count("1"):
+        raise ValueError("peer com campos inesperados")
+    return present, texts
+
+def _peer_info(port, present, texts):
+    info = {"ip": texts[0], "port": port, "username": texts[1]}
+    for bit, key in enumerate(PEER_LISTS):
+        if present >> bit & 1:
+            info[key] = texts[2 + bit].split(",") if texts[2 + bit] else []
+    return info
+
+def _pack_texts(texts, parts):
+    block = "\0".join(texts)
+    if block.count("\0") != max(len(texts) - 1, 0):
+        raise ValueError("texto com NUL")
+    _STR.pack(block, parts)
+
+def _unpack_texts(buf, offset, count):
+    block, offset = _STR.unpack(buf, offset)
+    return (block.split("\0") if count else []), offset
+
+_TEXTS_PER_PEER = 2 + len(PEER_LISTS)
+
+def _pack_peer(peer_id, info, parts):
+    present, texts = _peer_texts(info)
+    parts.append(_PEER.pack(peer_id, info["port"], present))
+    _pack_texts(texts, parts)
+
+def _unpack_peer(buf, offset):
+    peer_id, port, present = _PEER.unpack_from(buf, offset)
+    texts, offset = _unpack_texts(buf, offset + _PEER.size, 1)
+    return peer_id, _peer_info(port, present, texts), offset
+
+class _Peers:
+    """Tabela de peers (ID -> {ip, port, username[, codecs][, rooms][, features]}), em colunas: IDs, portas e
+    listas presentes em um único struct, e os textos em um único bloco UTF-8 separado por NUL.
+    As chaves continuam inteiras, ao contrário do JSON.
+    """
+    def pack(self, value, parts):
+        ids, ports, masks, texts = [], [], [], []
+        for peer_id, info in value.items():
+            present, peer_texts = _peer_texts(info)
+            ids.append(int(peer_id))
+            ports.append(info["port"])
+            masks.append(present)
+            texts += peer_texts
+        count = len(ids)
+        parts.append(_U32.pack(count))
+        parts.append(struct.pack(f"!{count}I{count}H{count}B", *ids, *ports, *masks))
+        _pack_texts(texts, parts)
+
+    def unpack(self, buf, offset):
+        (count,) = _U32.unpack_from(buf, offset)
+        offset += _U32.size
+        columns = struct.Struct(f"!{count}I{count}H{count}B")
+        values = columns.unpack_from(buf, offset)
+        texts, offset = _unpack_texts(buf, offset + columns.size, count)
+        peers = {}
+        for i in range(count):
+            first = _TEXTS_PER_PEER * i
+            peers[values[i]] = _peer_info(values[count + i], values[2 * count + i], texts[first:first + _TEXTS_PER_PEER])
+        return peers, offset
+
+class _Changes:
+    """Alterações da tabela de membros: [{v, op, id, info}] (info só nas entradas)."""
+    def pack(self, value, parts):
+        parts.append(_U32.pack(len(value)))
+        for change in value:
+            if len(change) != 4:
+                raise ValueError("alteração com campos inesperados")
+            op = MEMBERSHIP_OPS.index(change["op"])
+            parts.append(_CHANGE.pack(change["v"], op, change["id"]))
+            if op:
+                _pack_peer(change["id"], change["info"], parts)
+            elif change["info"] is not None:
+                raise ValueError("saída com informações do peer")
+
+    def unpack(self, buf, offset):
+        (count,) = _U32.unpack_from(buf, offset)
+        offset += _U32.size
+        changes = []
+        for _ in range(count):
+            version, op, peer_id = _CHANGE.unpack_from(buf, offset)
+            offset += _CHANGE.size
+            info = None
+            if op:
+                _, info, offset = _unpack_peer(buf, offset)
+            changes.append({"v": version, "op": MEMBERSHIP_OPS[op], "id": peer_id, "info": info})
+        return changes, offset
+
+# --- Esquemas das mensagens ---
+
+class Schema:
+    """Formato binário de um tipo de mensagem: campos numéricos obrigatórios em um cabeçalho fixo
+    (um único struct.pack), seguidos dos campos variáveis e dos opcionais presentes (indicados por
+    uma máscara de bits). Uma mensagem com campos diferentes dos previstos não usa o esquema.
+    """
+    def __init__(self, schema_id, msg_type, fixed=(), variable=(), optional=()):
+        self.schema_id = schema_id
+        self.msg_type = msg_type
+        self.fixed_names = tuple(name for name, _ in fixed)
+        self.names = ("type",) + self.fixed_names
+        self.head = struct.Struct("!B" + "".join(fmt for _, fmt in fixed))  # máscara dos opcionais + campos fixos
+        self.variable = tuple(variable)
+        self.optional = tuple(optional)
+        self.required_count = 1 + len(fixed) + len(variable)  # inclui "type"
+
+    def encode(self, message):
+        present = 0
+        count = self.required_count
+        for bit, (name, _) in enumerate(self.optional):
+            if name in message:
+                present |= 1 << bit
+                count += 1
+        if len(message) != count:
+            raise ValueError("campos inesperados")
+        parts = [self.head.pack(present, *[message[name] for name in self.fixed_names])]
+        for name, field in self.variable:
+            field.pack(message[name], parts)
+        if present:
+            for bit, (name, field) in enumerate(self.optional):
+                if present >> bit & 1:
+                    field.pack(message[name], parts)
+        return b"".join(parts) if len(parts) > 1 else parts[0]
+
+    def decode(self, buf, offset=0):
+        values = self.head.unpack_from(buf, offset)
+        message = dict(zip(self.names, values))  # "type" ocupa a posição da máscara dos opcionais
+        message["type"] = self.msg_type
+        offset += self.head.size
+        for name, field in self.variable:
+            message[name], offset = field.unpack(buf, offset)
+        present = values[0]
+        if present:
+            for bit, (name, field) in enumerate(self.optional):
+                if present >> bit & 1:
+                    message[name], offset = field.unpack(buf, offset)
+        return message
+
+_HEX = _Hex()
+SCHEMAS = [
+    # Controle de formato constante
+    Schema(1, "HEARTBEAT", fixed=(("sender_id", "I"), ("version", "I")), variable=(("digest", _HEX),)),
+    Schema(2, "ELECTION", fixed=(("sender_id", "I"),)),
+    Schema(3, "ANSWER", fixed=(("sender_id", "I"),)),
+    Schema(4, "COORDINATOR", fixed=(("coordinator_id", "I"),)),
+    # Chat (direto, gossip ou multicast)
+    Schema(5, "CHAT_MESSAGE", fixed=(("sender_id", "I"), ("ts", "d")),
+           variable=(("msg_id", _HEX), ("username", _STR), ("text", _STR)),
+           optional=(("ttl", _Number("B")), ("relay_id", _Number("I")), ("room", _STR))),
+    # Sondas do SWIM, com as atualizações de carona
+    *[Schema(schema_id, msg_type, fixed=(("seq", "I"), ("sender_id", "I"), ("port", "H"), ("version", "I")),
+             variable=(("ip", _STR), ("updates", _Updates()), ("coordinator_beat", _Beat())),
+             optional=(("target_id", _Number("I")), ("digest", _HEX)))
+      for schema_id, msg_type in ((6, "PING"), (7, "ACK"), (8, "PING_REQ"))],
+    # Listas de peers
+    Schema(9, "JOIN_ACK", fixed=(("id", "I"), ("coordinator_id", "I"), ("version", "I")), variable=(("peers", _Peers()),)),
+    Schema(10, "MEMBERSHIP_DELTA", fixed=(("to_version", "I"),), variable=(("digest", _HEX),),
+           optional=(("full", _Number("?")), ("from_version", _Number("I")), ("peers", _Peers()), ("changes", _Changes()))),
+    # Histórico e canal multicast
+    Schema(11, "CATCHUP_REQUEST", fixed=(("sender_id", "I"), ("port", "H"), ("from_seq", "I"), ("since_ts", "d"), ("limit", "I")),
+           variable=(("ip", _STR),), optional=(("rooms", _Strings()),)),
+    Schema(12, "MCAST_NACK", fixed=(("sender_id", "I"), ("epoch", "I")), variable=(("missing", _U32List()),)),
+    Schema(13, "MCAST_GAP", fixed=(("sender_id", "I"), ("epoch", "I"), ("next_seq", "I"))),
+    Schema(14, "MCAST_START", fixed=(("sender_id", "I"), ("epoch", "I"), ("next_seq", "I"))),
+]
+SCHEMAS_BY_TYPE = {schema.msg_type: schema for schema in SCHEMAS}
+SCHEMAS_BY_ID = {schema.schema_id: schema for schema in SCHEMAS}
+
+def encode_message(message, codec="json"):
+    """Codifica uma mensagem para envio: JSON ou binário. O payload segue sempre em um frame (framing.py)."""
+    if codec != "binary":
+        return serialize_message(message).encode('utf-8')
+    schema = SCHEMAS_BY_TYPE.get(message.get("type"))
+    body = None
+    if schema is not None:
+        try:
+            body = schema.encode(message)
+            schema_id = schema.schema_id
+        except (struct.error, TypeError, ValueError, KeyError, AttributeError):
+            body = None # Campos fora do formato previsto (ex.: ID ainda não atribuído): vai como JSON
+    if body is None:
+        body = serialize_message(message).encode('utf-8')
+        schema_id = JSON_SCHEMA
+    flags = 0
+    if len(body) >= COMPRESS_THRESHOLD:
+        compressed = zlib.compress(body, COMPRESS_LEVEL)
+        if len(compressed) < len(body):
+            body, flags = compressed, FLAG_COMPRESSED
+    return ENVELOPE.pack(BINARY_VERSION, flags, schema_id) + body
+
+def decode_message(payload):
+    """Decodifica um payload recebido (bytes ou memoryview), identificando o formato pelo primeiro byte."""
+    if payload[0] == JSON_START:
+        return deserialize_message(str(payload, 'utf-8'))
+    version, flags, schema_id = ENVELOPE.unpack_from(payload)
+    if version != BINARY_VERSION:
+        raise ValueError(f"formato de mensagem desconhecido ({version})")
+    body, offset = payload, ENVELOPE.size
+    if flags & FLAG_COMPRESSED:
+        decompressor = zlib.decompressobj()
+        body, offset = decompressor.decompress(payload[offset:], MAX_DECOMPRESSED), 0
+        if decompressor.unconsumed_tail:
+            raise ValueError("mensagem descomprimida excede o limite")
+    if schema_id == JSON_SCHEMA:
+        return deserialize_message(str(body[offset:], 'utf-8'))
+    return SCHEMAS_BY_ID[schema_id].decode(body, offset)
+
+class PeerCodecs:
+    """Codec negociado com cada peer, por endereço (ip, porta), compartilhado pelos dois backends.
+    Destinos sem negociação (endereços ainda desconhecidos) recebem JSON.
+    """
+    def __init__(self):
+        self._codecs = {}  # (ip, porta) -> nome do codec
+
+    def set(self, ip, port, offered):
+        self._codecs[(ip, port)] = negotiate(offered)
+
+    def forget(self, ip, port):
+        self._codecs.pop((ip, port), None)
+
+    def get(self, ip, port):
+        return self._codecs.get((ip, port), "json")
+
+    def encode(self, message, ip, port):
+        return encode_message(message, self.get(ip, port))
+
+    def encode_for(self, message, targets):
+        """Codifica a mensagem uma única vez por codec usado entre os destinos (ID -> {ip, port, ...}).
+        Retorna uma lista de (payload, destinos que o recebem)."""
+        groups = {}
+        for pid, pinfo in targets.items():
+            groups.setdefault(self.get(pinfo["ip"], pinfo["port"]), {})[pid] = pinfo
+        return [(encode_message(message, codec), members) for codec, members in groups.items()]
@@ -1,8 +1,14 @@
 import socket
 import json
-import struct
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from connection_pool import ConnectionPool
+from outbound import OutboundQueues
+from framing import BufferPool, FrameReader, encode_frame
+from metrics import CommunicationMetrics, Metrics
+from transport import SocketTransport
+from codec import PeerCodecs, decode_message
 from utils import serialize_message, deserialize_message, get_logger
 
 logger = get_logger(__name__)
@@ -10,31 +16,48 @@ logger = get_logger(__name__)
 # Constantes para a comunicação multicast
 MULTICAST_GROUP = '224.1.1.1'  # Endereço IP do grupo multicast
 MULTICAST_PORT = 5007         # Porta para a comunicação multicast
+MAX_DATAGRAM_SIZE = 65535     # Tamanho máximo de um datagrama UDP
+CHAT_MULTICAST_PORT = 5008    # Porta do canal multicast de chat (disseminação "multicast")
+CHANNEL_RECV_BUFFER = 4 * 1024 * 1024  # Buffer de recepção pedido para os canais multicast (limitado pelo sistema)
 
 class Communication:
     """Gerencia toda a comunicação de rede para um nó, incluindo TCP e UDP multicast."""
-    def __init__(self, node_ip, node_port, message_handler_tcp, message_handler_udp):
+    def __init__(self, node_ip, node_port, message_handler_tcp, message_handler_udp,
+                 queue_policy="drop_oldest", max_queue_depth=1000, transport=None, metrics=None):
         self.node_ip = node_ip
         self.node_port = node_port
         self.message_handler_tcp = message_handler_tcp  # Função para processar mensagens TCP
         self.message_handler_udp = message_handler_udp  # Função para processar mensagens UDP
+        # Transporte que cria os sockets: rede real (padrão) ou rede em memória (simulações)
+        self.transport = transport or SocketTransport()
+        # Contadores de mensagens, bytes, falhas de envio e latência de conexão
+        self.metrics = CommunicationMetrics(metrics or Metrics())
+        # Codec negociado com cada peer (binário ou JSON)
+        self.codecs = PeerCodecs()
 
         # Configuração do Socket TCP para comunicação ponto a ponto
-        self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.tcp_socket.bind((self.node_ip, self.node_port))
-        self.tcp_socket.listen(10) # Permite até 10 conexões pendentes
+        self.tcp_socket = self.transport.listen_tcp(self.node_ip, self.node_port, backlog=10)
         logger.info(f"Listener TCP iniciado em {self.node_ip}:{self.node_port}")
 
         # Configuração do Socket UDP para descoberta de nós via multicast
-        self.udp_multicast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        self.udp_multicast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        # O bind é feito em "" para escutar em todas as interfaces de rede disponíveis
-        self.udp_multicast_socket.bind(('', MULTICAST_PORT))
-        # Adiciona o socket ao grupo multicast
-        mreq = struct.pack("4sl", socket.inet_aton(MULTICAST_GROUP), socket.INADDR_ANY)
-        self.udp_multicast_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        self.udp_multicast_socket = self.transport.multicast_receiver(MULTICAST_GROUP, MULTICAST_PORT)
         logger.info(f"Listener Multicast UDP iniciado em {MULTICAST_GROUP}:{MULTICAST_PORT}")
+        # Socket único para envio multicast, reutilizado entre chamadas
+        self.udp_send_socket = self.transport.multicast_sender()
+        self._channels = []  # Sockets dos canais multicast adicionais (open_multicast_channel)
+
+        # Buffers reutilizáveis para recepção (recv_into), evitando alocações a cada leitura
+        self.buffer_pool = BufferPool()
+        self.udp_buffer = bytearray(MAX_DATAGRAM_SIZE)
+
+        # Pool de conexões TCP persistentes para envio, reutilizadas entre mensagens. Uma conexão por peer:
+        # as escritas saem na ordem em que são feitas, e o receptor lê cada conexão em ordem
+        self.connection_pool = ConnectionPool(self.metrics.timed_connect(self.transport.connect_tcp), connect_timeout=3.0, max_per_peer=1,
+                                              idle_timeout=30.0)
+        # Filas de saída por peer: agrupam mensagens e priorizam as de controle sobre as de chat
+        self.outbound = OutboundQueues(self._write_queued, max_depth=max_queue_depth, policy=queue_policy)
+        # Pool limitado de threads para envios em paralelo (broadcast)
+        self.broadcast_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="broadcast")
 
         self.stop_event = threading.Event() # Evento para sinalizar o encerramento das threads
 
@@ -42,6 +65,12 @@ class Communication:
         """Inicia as threads de escuta para mensagens TCP e UDP."""
         threading.Thread(target=self._listen_tcp, daemon=True).start()
         threading.Thread(target=self._listen_udp_multicast, daemon=True).start()
+        threading.Thread(target=self._evict_idle_connections, daemon=True).start()
+
+    def _evict_idle_connections(self):
+        """Fecha periodicamente as conexões do pool que ficaram ociosas."""
+        while not self.stop_event.wait(5.0):
+            self.connection_pool.evict_idle()
 
     def _listen_tcp(self):
         """Loop principal para aceitar conexões TCP e despachar para um handler."""
@@ -59,38 +88,121 @@ class Communication:
                     break
 
     def _handle_tcp_connection(self, conn, addr):
-        """Processa uma única conexão TCP, recebe a mensagem e a envia para o handler do nó."""
+        """Processa uma conexão TCP persistente, lendo mensagens em frames até o peer fechá-la."""
         with conn:
+            conn.settimeout(1.0) # Timeout para permitir a verificação do stop_event
+            reader = FrameReader(conn, self.buffer_pool)
             try:
-                data = conn.recv(4096) # Buffer de 4KB para receber dados
-                if data:
-                    message = deserialize_message(data.decode('utf-8'))
-                    self.message_handler_tcp(message, addr)
-            except Exception as e:
-                logger.error(f"Erro ao tratar conexão TCP de {addr}: {e}")
+                for payload in reader.read_frames(self.stop_event):
+                    self._dispatch_tcp(payload, addr)
+            except (OSError, ValueError) as e:
+                logger.debug(f"Conexão TCP de {addr} encerrada: {e}")
+            finally:
+                reader.close()
+
+    def _dispatch_tcp(self, payload, addr):
+        """Deserializa uma mensagem TCP recebida e a envia para o handler do nó."""
+        try:
+            message = decode_message(payload)
+            self.metrics.received(message.get('type'), len(payload))
+            self.message_handler_tcp(message, addr)
+        except Exception as e:
+            logger.error(f"Erro ao tratar mensagem TCP de {addr}: {e}")
 
     def send_tcp_message(self, target_ip, target_port, message):
-        """Envia uma mensagem TCP para um destino específico."""
+        """Envia uma mensagem TCP para um destino específico usando uma conexão persistente do pool."""
+        data = encode_frame(self.codecs.encode(message, target_ip, target_port))
+        self.metrics.sent(message.get('type'), len(data))
+        return self._send_frame(target_ip, target_port, data, message.get('type'))
+
+    def _send_frame(self, target_ip, target_port, data, msg_type):
+        """Envia um frame já serializado. Retorna True em caso de sucesso."""
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.settimeout(3.0) # Timeout de 3 segundos para a conexão
-                sock.connect((target_ip, target_port))
-                sock.sendall(serialize_message(message).encode('utf-8'))
-                logger.debug(f"Mensagem TCP enviada para {target_ip}:{target_port}: {message.get('type')}")
-                return True
+            self.connection_pool.send(target_ip, target_port, data)
+            logger.debug(f"Mensagem TCP enviada para {target_ip}:{target_port}: {msg_type}")
+            return True
         except Exception as e:
             logger.warning(f"Falha ao enviar mensagem TCP para {target_ip}:{target_port}: {e}")
+            self.metrics.send_failed(target_ip, target_port)
             return False
 
+    def _write_queued(self, target_ip, target_port, data):
+        """Escreve um lote da fila de saída, contabilizando as falhas por peer."""
+        try:
+            self.connection_pool.send(target_ip, target_port, data)
+        except Exception:
+            self.metrics.send_failed(target_ip, target_port)
+            raise
+
+    def broadcast(self, targets, message, deadline=3.0):
+        """Envia a mesma mensagem para vários peers em paralelo, com um prazo total único.
+        `targets` mapeia ID -> {ip, port, ...}. Retorna um dicionário ID -> True/False;
+        envios que não terminarem dentro do prazo são reportados como falha.
+        """
+        if not targets:
+            return {}
+        msg_type = message.get('type')
+        try:
+            futures = {}
+            # Serializada uma vez por codec negociado com os destinos
+            for payload, members in self.codecs.encode_for(message, targets):
+                data = encode_frame(payload)
+                self.metrics.sent(msg_type, len(data), count=len(members))
+                for pid, pinfo in members.items():
+                    futures[self.broadcast_executor.submit(self._send_frame, pinfo["ip"], pinfo["port"], data, msg_type)] = pid
+        except RuntimeError:
+            return {pid: False for pid in targets} # Encerrado: o executor já não aceita tarefas
+        done, not_done = wait(futures, timeout=deadline)
+        results = {futures[f]: f.result() for f in done}
+        for f in not_done:
+            pid = futures[f]
+            logger.warning(f"Envio de {msg_type} para o peer {pid} excedeu o prazo de {deadline}s.")
+            results[pid] = False
+        return results
+
+    def post_tcp_message(self, target_ip, target_port, message):
+        """Enfileira uma mensagem para envio assíncrono pela fila de saída do peer.
+        Retorna False se a fila estava cheia e a mensagem foi descartada.
+        """
+        data = encode_frame(self.codecs.encode(message, target_ip, target_port))
+        self.metrics.sent(message.get('type'), len(data))
+        return self.outbound.post(target_ip, target_port, data, message.get('type'))
+
+    def post_broadcast(self, targets, message):
+        """Enfileira a mesma mensagem (serializada uma única vez por codec) para vários peers.
+        Retorna um dicionário ID -> True/False indicando se a mensagem foi aceita na fila.
+        """
+        msg_type = message.get('type')
+        results = {}
+        for payload, members in self.codecs.encode_for(message, targets):
+            data = encode_frame(payload)
+            self.metrics.sent(msg_type, len(data), count=len(members))
+            for pid, pinfo in members.items():
+                results[pid] = self.outbound.post(pinfo["ip"], pinfo["port"], data, msg_type)
+        return results
+
+    def set_peer_codecs(self, target_ip, target_port, offered):
+        """Registra os codecs anunciados por um peer (None se ele não anunciou: só JSON)."""
+        self.codecs.set(target_ip, target_port, offered)
+
+    def close_peer(self, target_ip, target_port):
+        """Fecha as conexões persistentes e a fila de saída mantidas com um peer que saiu da rede."""
+        self.codecs.forget(target_ip, target_port)
+        self.outbound.close_peer(target_ip, target_port)
+        self.connection_pool.close_peer(target_ip, target_port)
+
     def _listen_udp_multicast(self):
         """Loop principal para escutar mensagens multicast UDP."""
+        view = memoryview(self.udp_buffer)
         while not self.stop_event.is_set():
             try:
                 self.udp_multicast_socket.settimeout(1.0)
-                data, addr = self.udp_multicast_socket.recvfrom(1024)
+                # Recebe diretamente no buffer pré-alocado, sem criar um novo objeto bytes
+                size, addr = self.udp_multicast_socket.recvfrom_into(self.udp_buffer)
                 # Ignora as próprias mensagens multicast
                 if addr[0] != self.node_ip:
-                    message = deserialize_message(data.decode('utf-8'))
+                    message = deserialize_message(str(view[:size], 'utf-8'))
+                    self.metrics.received(message.get('type'), size)
                     self.message_handler_udp(message, addr)
             except socket.timeout:
                 continue
@@ -102,20 +214,80 @@ class Communication:
     def send_udp_multicast(self, message):
         """Envia uma mensagem para o grupo multicast."""
         try:
-            # Cria um socket temporário para enviar a mensagem multicast
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP) as sock:
-                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2) # TTL (Time-To-Live) da mensagem
-                sock.sendto(serialize_message(message).encode('utf-8'), (MULTICAST_GROUP, MULTICAST_PORT))
-                logger.debug(f"Mensagem UDP multicast enviada: {message.get('type')}")
-                return True
+            data = serialize_message(message).encode('utf-8')
+            self.udp_send_socket.sendto(data, (MULTICAST_GROUP, MULTICAST_PORT))
+            self.metrics.sent(message.get('type'), len(data))
+            logger.debug(f"Mensagem UDP multicast enviada: {message.get('type')}")
+            return True
         except Exception as e:
             logger.error(f"Falha ao enviar mensagem UDP multicast: {e}")
             return False
 
+    def send_multicast_datagram(self, data, port):
+        """Envia um datagrama já codificado para o grupo multicast, na porta de um canal. Retorna True em caso de sucesso."""
+        try:
+            self.udp_send_socket.sendto(data, (MULTICAST_GROUP, port))
+            self.metrics.sent("MULTICAST_DATAGRAM", len(data))
+            return True
+        except OSError as e:
+            logger.warning(f"Falha ao enviar datagrama multicast para a porta {port}: {e}")
+            return False
+
+    def open_multicast_channel(self, port, handler):
+        """Inscreve o nó em um canal multicast adicional: `handler(data, addr)` recebe cada datagrama (bytes),
+        em ordem de chegada, em uma thread própria. Levanta OSError se o multicast não estiver disponível."""
+        sock = self.transport.multicast_receiver(MULTICAST_GROUP, port)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, CHANNEL_RECV_BUFFER) # Absorve rajadas de datagramas
+        self._channels.append(sock)
+        threading.Thread(target=self._listen_channel, args=(sock, handler), daemon=True).start()
+        logger.info(f"Canal multicast iniciado em {MULTICAST_GROUP}:{port}")
+
+    def _listen_channel(self, sock, handler):
+        buffer = bytearray(MAX_DATAGRAM_SIZE)
+        view = memoryview(buffer)
+        while not self.stop_event.is_set():
+            try:
+                sock.settimeout(1.0)
+                size, addr = sock.recvfrom_into(buffer)
+            except socket.timeout:
+                continue
+            except Exception as e:
+                if not self.stop_event.is_set():
+                    logger.error(f"Erro no canal multicast: {e}")
+                break
+            self.metrics.received("MULTICAST_DATAGRAM", size)
+            try:
+                handler(bytes(view[:size]), addr)
+            except Exception as e:
+                logger.error(f"Erro ao tratar datagrama multicast de {addr}: {e}")
+
+    def call_later(self, delay, callback, *args):
+        """Agenda `callback` para rodar após `delay` segundos em uma thread de timer."""
+        timer = threading.Timer(delay, callback, args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def run_periodic(self, interval, callback):
+        """Executa `callback` a cada `interval` segundos em uma thread dedicada."""
+        def loop():
+            while not self.stop_event.wait(interval):
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"Erro na tarefa periódica {callback.__name__}: {e}")
+        threading.Thread(target=loop, daemon=True).start()
+
     def stop(self):
         """Encerra os sockets e as threads de comunicação."""
         self.stop_event.set()
         # Fechar os sockets interrompe as chamadas de bloqueio nas threads de escuta
         self.tcp_socket.close()
         self.udp_multicast_socket.close()
+        self.udp_send_socket.close()
+        for sock in self._channels:
+            sock.close()
+        self.outbound.close_all()
+        self.connection_pool.close_all()
+        self.broadcast_executor.shutdown(wait=False)
         logger.info("Módulo de comunicação encerrado.")
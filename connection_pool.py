@@ -0,0 +1,138 @@
+import socket
+import threading
+import time
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+class ConnectionPool:
+    """Mantém conexões TCP persistentes por peer, reutilizadas entre envios.
+    Conexões são abertas sob demanda, descartadas quando ficam ociosas e limitadas por peer.
+    """
+    def __init__(self, connect, connect_timeout=3.0, max_per_peer=2, idle_timeout=30.0):
+        self.connect = connect  # Função (ip, porta, timeout) -> socket conectado, fornecida pelo transporte
+        self.connect_timeout = connect_timeout  # Timeout de conexão e envio
+        self.max_per_peer = max_per_peer        # Máximo de conexões simultâneas por peer
+        self.idle_timeout = idle_timeout        # Tempo máximo (s) que uma conexão fica ociosa no pool
+        self._lock = threading.Lock()
+        self._idle = {}   # (ip, port) -> lista de (socket, timestamp do último uso)
+        self._slots = {}  # (ip, port) -> semáforo que limita as conexões em uso
+
+    def _slot(self, key):
+        """Retorna o semáforo de conexões do peer, criando-o se necessário."""
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.max_per_peer)
+                self._slots[key] = slot
+            return slot
+
+    def _connect(self, key):
+        """Abre uma nova conexão TCP com o peer."""
+        sock = self.connect(key[0], key[1], self.connect_timeout)
+        sock.settimeout(self.connect_timeout)
+        logger.debug(f"Nova conexão TCP aberta para {key[0]}:{key[1]}")
+        return sock
+
+    def _is_alive(self, sock):
+        """Verifica, sem bloquear, se o peer não fechou a conexão ociosa.
+        O receptor nunca escreve nessas conexões, então qualquer leitura disponível indica fechamento ou erro.
+        """
+        try:
+            sock.setblocking(False)
+            try:
+                return sock.recv(1, socket.MSG_PEEK) != b""
+            except BlockingIOError:
+                return True
+            finally:
+                sock.settimeout(self.connect_timeout)
+        except OSError:
+            return False
+
+    def _take_idle(self, key):
+        """Retira do pool uma conexão ociosa ainda válida para o peer, se houver."""
+        now = time.time()
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    return None
+                sock, last_used = idle.pop()
+            if now - last_used <= self.idle_timeout and self._is_alive(sock):
+                return sock
+            sock.close()
+
+    def send(self, ip, port, data):
+        """Envia bytes para o peer usando uma conexão do pool.
+        Uma conexão reutilizada que falhar é descartada e o envio é repetido uma vez em uma conexão nova.
+        """
+        key = (ip, port)
+        slot = self._slot(key)
+        if not slot.acquire(timeout=self.connect_timeout):
+            raise TimeoutError(f"limite de {self.max_per_peer} conexões para {ip}:{port} atingido")
+        try:
+            sock = self._take_idle(key)
+            if sock is not None:
+                try:
+                    sock.sendall(data)
+                    self._put_idle(key, sock)
+                    return
+                except OSError as e:
+                    logger.debug(f"Conexão reutilizada com {ip}:{port} falhou ({e}). Reconectando.")
+                    sock.close()
+            sock = self._connect(key)
+            try:
+                sock.sendall(data)
+            except Exception:
+                sock.close()
+                raise
+            self._put_idle(key, sock)
+        finally:
+            slot.release()
+
+    def _put_idle(self, key, sock):
+        """Devolve uma conexão ao pool para reutilização."""
+        with self._lock:
+            if key in self._slots:
+                self._idle.setdefault(key, []).append((sock, time.time()))
+                return
+        # O pool do peer foi fechado enquanto a conexão estava em uso
+        sock.close()
+
+    def evict_idle(self):
+        """Fecha as conexões que ficaram ociosas por mais tempo que idle_timeout."""
+        now = time.time()
+        expired = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                keep = []
+                for sock, last_used in idle:
+                    if now - last_used > self.idle_timeout:
+                        expired.append(sock)
+                    else:
+                        keep.append((sock, last_used))
+                self._idle[key] = keep
+        for sock in expired:
+            sock.close()
+        if expired:
+            logger.debug(f"{len(expired)} conexões ociosas fechadas.")
+
+    def close_peer(self, ip, port):
+        """Fecha todas as conexões ociosas de um peer e descarta seu pool."""
+        key = (ip, port)
+        with self._lock:
+            idle = self._idle.pop(key, [])
+            self._slots.pop(key, None)
+        for sock, _ in idle:
+            sock.close()
+        if idle:
+            logger.debug(f"Pool de conexões de {ip}:{port} fechado.")
+
+    def close_all(self):
+        """Fecha todas as conexões do pool."""
+        with self._lock:
+            idle = [sock for conns in self._idle.values() for sock, _ in conns]
+            self._idle.clear()
+            self._slots.clear()
+        for sock in idle:
+            sock.close()
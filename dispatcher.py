@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+from outbound import BULK_TYPES
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+# Detecção de falhas: handlers que não bloqueiam (os envios vão para as filas de saída), com uma faixa própria
+PROBE_TYPES = {"PING", "PING_REQ", "ACK", "HEARTBEAT"}
+
+class Dispatcher:
+    """Despacho das mensagens recebidas por tabela (tipo -> handler) em um pool fixo de threads.
+    Cada mensagem vai para a fila de um worker escolhido pelo remetente (sender_id, ou o IP de origem),
+    então as mensagens de um remetente são processadas na ordem em que são entregues ao dispatcher, e
+    remetentes diferentes em paralelo. Os dois backends mantêm uma única conexão de envio por peer,
+    lida por uma única thread, então a ordem de chegada é a ordem de envio do remetente.
+    Mensagens de controle têm uma faixa própria de workers, para não esperarem atrás do chat, e as do
+    detector de falhas outra, para que uma eleição (que espera o resultado dos envios) não atrase as
+    sondas e gere suspeitas falsas.
+    As filas são limitadas: cheias, bloqueiam a conexão que recebeu a mensagem (contrapressão).
+    """
+    WORKERS = 8           # Workers da faixa de chat e histórico
+    CONTROL_WORKERS = 2   # Workers da faixa de controle (entrada, eleição, membros)
+    PROBE_WORKERS = 1     # Workers da faixa do detector de falhas (SWIM e heartbeats)
+    MAX_PENDING = 1000    # Mensagens pendentes por worker
+
+    def __init__(self, node, handlers, workers=WORKERS, control_workers=CONTROL_WORKERS, probe_workers=PROBE_WORKERS,
+                 max_pending=MAX_PENDING):
+        self.node = node  # Referência ao objeto Node principal
+        self.handlers = handlers  # Tipo de mensagem -> handler(message)
+        self.lanes = {
+            "control": [queue.Queue(max_pending) for _ in range(control_workers)],
+            "probe": [queue.Queue(max_pending) for _ in range(probe_workers)],
+            "bulk": [queue.Queue(max_pending) for _ in range(workers)],
+        }
+        self.stop_event = threading.Event()
+        self.wait_latency = node.metrics.histogram("dispatch_wait_seconds", "Tempo das mensagens na fila do worker, por faixa",
+                                                   ("lane",))
+        node.metrics.gauge("dispatch_pending", "Mensagens aguardando processamento",
+                           lambda: sum(q.qsize() for lane in self.lanes.values() for q in lane))
+
+    def start(self):
+        for lane, queues in self.lanes.items():
+            for index, worker_queue in enumerate(queues):
+                threading.Thread(target=self._work, args=(lane, worker_queue), daemon=True,
+                                 name=f"dispatch-{lane}-{index}").start()
+
+    def submit(self, message, addr):
+        """Enfileira uma mensagem recebida no worker do seu remetente."""
+        msg_type = message.get("type")
+        handler = self.handlers.get(msg_type)
+        if handler is None:
+            logger.debug(f"Mensagem de tipo desconhecido ignorada: {msg_type}")
+            return
+        lane = "bulk" if msg_type in BULK_TYPES else "probe" if msg_type in PROBE_TYPES else "control"
+        queues = self.lanes[lane]
+        key = message.get("sender_id")
+        if key is None and addr:
+            key = addr[0]
+        worker_queue = queues[hash(key) % len(queues)]
+        item = (handler, message, lane, time.perf_counter())
+        while not self.stop_event.is_set():
+            try:
+                worker_queue.put(item, timeout=1.0) # Fila cheia: segura a conexão até o worker avançar
+                return
+            except queue.Full:
+                logger.warning(f"Fila de processamento ({lane}) cheia. Aguardando para enfileirar {msg_type}.")
+
+    def _work(self, lane, worker_queue):
+        """Processa, em ordem, as mensagens da fila de um worker."""
+        while not self.stop_event.is_set():
+            try:
+                handler, message, lane, queued_at = worker_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            started = time.perf_counter()
+            self.wait_latency.observe(started - queued_at, lane)
+            msg_type = message.get("type")
+            try:
+                handler(message)
+            except Exception as e:
+                logger.error(f"Erro ao tratar mensagem {msg_type}: {e}")
+            finally:
+                self.node.handler_latency.observe(time.perf_counter() - started, msg_type)
+
+    def stop(self):
+        self.stop_event.set()
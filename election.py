@@ -6,56 +6,123 @@ logger = get_logger(__name__)
 
 class Election:
     """Implementa o algoritmo de eleição do Bully para escolher um novo coordenador.
-    O nó com o maior ID ativo na rede se torna o coordenador.
+    O nó com o maior ID ativo na rede se torna o coordenador. O escopo da eleição (candidatos,
+    tipos das mensagens e o que fazer com o vencedor) fica nos métodos _candidates, _announce_targets,
+    _elected e _is_leader, para que a mesma lógica eleja também os líderes de grupo (hierarchy.py).
     """
+    # Tipos das mensagens da eleição
+    TYPES = {"election": "ELECTION", "answer": "ANSWER", "coordinator": "COORDINATOR"}
+    ROLE = "coordenador"  # Papel disputado, usado nos logs
+    METRIC = "election"   # Prefixo das métricas da eleição
+
     def __init__(self, node):
         self.node = node  # Referência ao objeto Node principal
         self.election_in_progress = False  # Flag para evitar múltiplas eleições simultâneas
         self.answered = False  # Flag para saber se um nó de ID maior respondeu
+        # Estatísticas das eleições das quais o nó participou (mensagens contadas são as enviadas por ele)
+        self.stats = {"elections": 0, "last_duration": None, "last_messages": 0, "suppressed": 0}
+        self._started_at = None  # Início da eleição em andamento
+        self._messages = 0  # Mensagens enviadas na eleição em andamento
+        self._lock = threading.Lock()
+        # As mesmas estatísticas, acumuladas nas métricas do nó
+        self.duration_metric = node.metrics.histogram(f"{self.METRIC}_seconds", "Duração das eleições das quais o nó participou")
+        self.messages_metric = node.metrics.counter(f"{self.METRIC}_messages_total", "Mensagens de eleição enviadas")
+        self.suppressed_metric = node.metrics.counter(f"{self.METRIC}s_suppressed_total", "Eleições duplicadas suprimidas")
+
+    def _candidates(self):
+        """Peers de ID maior que o deste nó, do maior para o menor."""
+        return self.node.peers.higher(self.node.id)
+
+    def _announce_targets(self):
+        """Peers que recebem o anúncio do vencedor (None: todos)."""
+        return None
+
+    def _elected(self, leader_id):
+        """Adota o vencedor da eleição."""
+        self.node.set_coordinator(leader_id)
+
+    def _is_leader(self):
+        return self.node.is_coordinator
+
+    def _begin(self):
+        """Marca o início da participação do nó em uma eleição (para as estatísticas)."""
+        with self._lock:
+            if self._started_at is None:
+                self._started_at = time.time()
+                self._messages = 0
+
+    def _count(self, messages):
+        with self._lock:
+            self._messages += messages
+        self.messages_metric.inc(amount=messages)
+
+    def _finish(self, coordinator_id):
+        """Registra a duração e o número de mensagens da eleição concluída."""
+        with self._lock:
+            if self._started_at is None:
+                return
+            duration = time.time() - self._started_at
+            self._started_at = None
+            self.stats["elections"] += 1
+            self.stats["last_duration"] = duration
+            self.stats["last_messages"] = self._messages
+        self.duration_metric.observe(duration)
+        logger.info(f"Nó {self.node.id}: Eleição concluída em {duration * 1000:.0f} ms ({self.ROLE} {coordinator_id}, "
+                    f"{self.stats['last_messages']} mensagens enviadas por este nó).")
+
+    def _try_begin(self):
+        """Marca a eleição como em andamento. Retorna False se já houver uma (eleição duplicada)."""
+        with self._lock:
+            if self.election_in_progress:
+                self.stats["suppressed"] += 1
+                self.suppressed_metric.inc()
+                return False
+            self.election_in_progress = True
+            self.answered = False
+        self._begin()
+        return True
 
     def start_election(self):
         """Inicia o processo de eleição."""
-        if self.election_in_progress:
+        if not self._try_begin():
             logger.info(f"Nó {self.node.id}: Eleição já em andamento.")
             return
 
         logger.info(f"Nó {self.node.id}: Iniciando eleição.")
-        self.election_in_progress = True
-        self.answered = False
 
         # Filtra apenas os peers com ID maior que o nó atual
-        higher_peers = {pid: pinfo for pid, pinfo in self.node.peers.items() if pid > self.node.id}
+        higher_peers = self._candidates()
 
         if not higher_peers:
             # Se não houver peers com ID maior, o nó atual se declara coordenador
-            logger.info(f"Nó {self.node.id}: Nenhum peer com ID maior. Declarando-me coordenador.")
+            logger.info(f"Nó {self.node.id}: Nenhum peer com ID maior. Declarando-me {self.ROLE}.")
             self.declare_coordinator()
             return
 
         # Envia mensagens ELECTION para todos os peers com ID maior
         election_message = {
-            "type": "ELECTION",
+            "type": self.TYPES["election"],
             "sender_id": self.node.id
         }
-        sent_to_any = False
-        for pid, pinfo in higher_peers.items():
-            if self.node.communication.send_tcp_message(pinfo["ip"], pinfo["port"], election_message):
-                logger.info(f"Nó {self.node.id}: Enviou ELECTION para {pid}")
-                sent_to_any = True
+        results = self.node.broadcast(election_message, targets=higher_peers)
+        self._count(len(results))
+        for pid in (pid for pid, delivered in results.items() if delivered):
+            logger.info(f"Nó {self.node.id}: Enviou ELECTION para {pid}")
+        sent_to_any = any(results.values())
 
         if not sent_to_any:
             # Se não conseguir enviar para ninguém, assume que é o maior ID ativo
-            logger.warning(f"Nó {self.node.id}: Não foi possível alcançar nenhum peer com ID maior. Declarando-me coordenador.")
+            logger.warning(f"Nó {self.node.id}: Não foi possível alcançar nenhum peer com ID maior. Declarando-me {self.ROLE}.")
             self.declare_coordinator()
             return
 
         # Inicia um timer para esperar por mensagens ANSWER
-        threading.Timer(5, self._election_timeout).start()
+        self.node.communication.call_later(5, self._election_timeout)
 
     def _election_timeout(self):
         """Função chamada se o timer de eleição expirar sem receber um ANSWER."""
         if not self.answered:
-            logger.info(f"Nó {self.node.id}: Timeout da eleição. Nenhum ANSWER recebido. Declarando-me coordenador.")
+            logger.info(f"Nó {self.node.id}: Timeout da eleição. Nenhum ANSWER recebido. Declarando-me {self.ROLE}.")
             self.declare_coordinator()
         self.election_in_progress = False
 
@@ -63,16 +130,18 @@ class Election:
         """Trata a recepção de uma mensagem ELECTION."""
         sender_id = message["sender_id"]
         logger.info(f"Nó {self.node.id}: Recebeu ELECTION de {sender_id}")
+        self._begin()
 
         # Se o nó atual tiver ID maior, ele responde com ANSWER
         if self.node.id > sender_id:
             answer_message = {
-                "type": "ANSWER",
+                "type": self.TYPES["answer"],
                 "sender_id": self.node.id
             }
             sender_info = self.node.peers.get(sender_id)
             if sender_info:
-                self.node.communication.send_tcp_message(sender_info["ip"], sender_info["port"], answer_message)
+                self.node.communication.post_tcp_message(sender_info["ip"], sender_info["port"], answer_message)
+                self._count(1)
                 logger.info(f"Nó {self.node.id}: Enviou ANSWER para {sender_id}")
 
         # Inicia sua própria eleição, a menos que já esteja em andamento
@@ -88,23 +157,115 @@ class Election:
 
     def declare_coordinator(self):
         """Declara o nó atual como o novo coordenador e notifica os outros peers."""
-        self.node.set_coordinator(self.node.id)
-        logger.info(f"Nó {self.node.id}: Eu sou o novo coordenador!")
+        self._elected(self.node.id)
+        logger.info(f"Nó {self.node.id}: Eu sou o novo {self.ROLE}!")
 
         coordinator_message = {
-            "type": "COORDINATOR",
+            "type": self.TYPES["coordinator"],
             "coordinator_id": self.node.id
         }
         # Informa todos os outros peers sobre o novo coordenador
-        for pid, pinfo in self.node.peers.items():
-            if pid != self.node.id:
-                self.node.communication.send_tcp_message(pinfo["ip"], pinfo["port"], coordinator_message)
-                logger.info(f"Nó {self.node.id}: Enviou mensagem COORDINATOR para {pid}")
+        results = self.node.broadcast(coordinator_message, targets=self._announce_targets(), queued=True)
+        self._count(len(results))
+        for pid in (pid for pid, delivered in results.items() if delivered):
+            logger.info(f"Nó {self.node.id}: Enviou mensagem COORDINATOR para {pid}")
         self.election_in_progress = False
+        self._finish(self.node.id)
 
     def handle_coordinator_message(self, message):
         """Trata a recepção de uma mensagem COORDINATOR."""
         coordinator_id = message["coordinator_id"]
-        logger.info(f"Nó {self.node.id}: Recebeu mensagem COORDINATOR. Novo coordenador é {coordinator_id}")
-        self.node.set_coordinator(coordinator_id)
+        logger.info(f"Nó {self.node.id}: Recebeu mensagem COORDINATOR. Novo {self.ROLE} é {coordinator_id}")
+        self._elected(coordinator_id)
         self.election_in_progress = False
+        self._finish(coordinator_id)
+
+class FastElection(Election):
+    """Bully modificado, de baixa latência. Em vez de enviar ELECTION para todos os peers de ID maior
+    (e cada um deles iniciar a própria eleição), o nó contata esses peers um de cada vez, do maior
+    para o menor. O primeiro que responder é o maior ativo e se anuncia imediatamente. No caso comum
+    são O(N) mensagens em vez de O(N^2). Os prazos de espera vêm do RTT observado com cada peer, não
+    de um timer fixo.
+    """
+    def __init__(self, node):
+        super().__init__(node)
+        self._round = 0  # Identifica a eleição atual, para descartar timers de eleições anteriores
+
+    def start_election(self):
+        """Inicia a eleição contatando primeiro o peer de maior ID."""
+        if not self._try_begin():
+            logger.info(f"Nó {self.node.id}: Eleição já em andamento.")
+            return
+        with self._lock:
+            self._round += 1
+            election_round = self._round
+        candidates = list(self._candidates()) # Do maior para o menor
+        logger.info(f"Nó {self.node.id}: Iniciando eleição rápida. Candidatos: {candidates}")
+        self._contact_next(election_round, candidates)
+
+    def _contact_next(self, election_round, candidates):
+        """Envia ELECTION ao próximo candidato; sem candidatos alcançáveis, declara-se coordenador."""
+        while candidates:
+            pid = candidates.pop(0)
+            pinfo = self.node.peers.get(pid)
+            if pinfo is None:
+                continue
+            results = self.node.broadcast({"type": self.TYPES["election"], "sender_id": self.node.id}, targets={pid: pinfo})
+            self._count(1)
+            if results.get(pid):
+                logger.info(f"Nó {self.node.id}: Enviou ELECTION para {pid}")
+                self.node.communication.call_later(self.node.rtt.timeout(pid), self._answer_timeout,
+                                                   election_round, candidates)
+                return
+        logger.info(f"Nó {self.node.id}: Nenhum peer com ID maior respondeu. Declarando-me {self.ROLE}.")
+        self.declare_coordinator()
+
+    def _answer_timeout(self, election_round, candidates):
+        """Sem ANSWER do candidato no prazo: passa para o próximo."""
+        with self._lock:
+            if election_round != self._round or not self.election_in_progress or self.answered:
+                return
+        self._contact_next(election_round, candidates)
+
+    def handle_answer_message(self, message):
+        """Trata um ANSWER: o candidato está ativo e vai se anunciar; aguarda o COORDINATOR."""
+        sender_id = message["sender_id"]
+        logger.info(f"Nó {self.node.id}: Recebeu ANSWER de {sender_id}. Aguardando COORDINATOR.")
+        with self._lock:
+            if self.answered or not self.election_in_progress:
+                return
+            self.answered = True
+            election_round = self._round
+        # O candidato pode ainda consultar peers de ID maior que ele: um prazo por nível acima deste nó
+        higher = list(self._candidates())
+        timeout = self.node.rtt.timeout(*higher) * (len(higher) + 2)
+        self.node.communication.call_later(timeout, self._coordinator_timeout, election_round)
+
+    def _coordinator_timeout(self, election_round):
+        """O candidato respondeu mas não se anunciou (ex.: falhou logo depois): recomeça a eleição."""
+        with self._lock:
+            if election_round != self._round or not self.election_in_progress:
+                return
+            self.election_in_progress = False
+        logger.warning(f"Nó {self.node.id}: COORDINATOR não recebido. Reiniciando a eleição.")
+        self.start_election()
+
+    def handle_election_message(self, message):
+        """Responde a um ELECTION. Se este nó já é o coordenador, reenvia o COORDINATOR em vez de eleger de novo."""
+        sender_id = message["sender_id"]
+        sender_info = self.node.peers.get(sender_id)
+        if self._is_leader() and sender_info:
+            with self._lock:
+                self.stats["suppressed"] += 1
+                self.suppressed_metric.inc()
+            coordinator_message = {"type": self.TYPES["coordinator"], "coordinator_id": self.node.id}
+            self.node.communication.post_tcp_message(sender_info["ip"], sender_info["port"], coordinator_message)
+            logger.info(f"Nó {self.node.id}: Recebeu ELECTION de {sender_id}, mas já é o {self.ROLE}.")
+            return
+        super().handle_election_message(message)
+
+# Estratégias de eleição disponíveis, selecionáveis na inicialização
+ELECTION_STRATEGIES = {
+    "bully": Election,      # Bully clássico: ELECTION para todos os peers de ID maior e timer fixo
+    "fast": FastElection,   # Bully modificado: maior ID primeiro e prazos adaptativos
+}
@@ -0,0 +1,358 @@
+import math
+import random
+import threading
+import time
+from collections import deque
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+class PhiAccrualDetector:
+    """Detector de falhas phi-accrual. Em vez de um limite fixo, calcula um nível de suspeita (phi)
+    a partir da distribuição dos intervalos observados entre sinais de vida: phi é -log10 da
+    probabilidade de o próximo sinal chegar ainda mais tarde do que o atraso atual.
+    """
+    def __init__(self, expected_interval, threshold=8.0, window=100, acceptable_pause=None, min_std_dev=None):
+        self.expected_interval = expected_interval  # Intervalo esperado entre sinais, usado até haver amostras
+        self.threshold = threshold  # Phi a partir do qual o monitorado é considerado falho
+        # Folga somada à média, para tolerar pausas curtas (ex.: coleta de lixo, rede congestionada)
+        self.acceptable_pause = expected_interval / 2 if acceptable_pause is None else acceptable_pause
+        self.min_std_dev = expected_interval / 10 if min_std_dev is None else min_std_dev
+        self.intervals = deque(maxlen=window)  # Intervalos mais recentes entre sinais de vida
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Recomeça o monitoramento (ex.: ao trocar de coordenador)."""
+        with self._lock:
+            self.intervals.clear()
+            # Estimativa inicial: o intervalo esperado, com desvio de 1/4 dele
+            self.intervals.extend((self.expected_interval * 0.75, self.expected_interval * 1.25))
+            self.last_arrival = time.time()
+
+    def heartbeat(self):
+        """Registra a chegada de um sinal de vida."""
+        now = time.time()
+        with self._lock:
+            self.intervals.append(now - self.last_arrival)
+            self.last_arrival = now
+
+    def phi(self):
+        """Nível de suspeita atual (0 logo após um sinal de vida, crescendo com o atraso)."""
+        with self._lock:
+            elapsed = time.time() - self.last_arrival
+            mean = sum(self.intervals) / len(self.intervals)
+            variance = sum((x - mean) ** 2 for x in self.intervals) / len(self.intervals)
+        std_dev = max(math.sqrt(variance), self.min_std_dev)
+        # Probabilidade (distribuição normal) de um intervalo maior que o atraso atual
+        p_later = 0.5 * math.erfc((elapsed - mean - self.acceptable_pause) / (std_dev * math.sqrt(2)))
+        return -math.log10(max(p_later, 1e-300))
+
+class RttEstimator:
+    """Tempo de ida e volta (RTT) por peer, estimado como no TCP (RFC 6298): média suavizada e
+    variação, usadas para calcular timeouts que acompanham a rede em vez de valores fixos.
+    """
+    ALPHA = 0.125  # Peso de uma nova amostra na média
+    BETA = 0.25    # Peso de uma nova amostra na variação
+
+    def __init__(self, initial_timeout=1.0, min_timeout=0.05, max_timeout=5.0):
+        self.initial_timeout = initial_timeout  # Timeout para peers ainda sem amostras
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._estimates = {}  # peer_id -> (srtt, rttvar)
+        self._lock = threading.Lock()
+
+    def observe(self, peer_id, rtt):
+        """Registra uma amostra de RTT (em segundos) para o peer."""
+        with self._lock:
+            estimate = self._estimates.get(peer_id)
+            if estimate is None:
+                self._estimates[peer_id] = (rtt, rtt / 2)
+                return
+            srtt, rttvar = estimate
+            rttvar = (1 - self.BETA) * rttvar + self.BETA * abs(srtt - rtt)
+            srtt = (1 - self.ALPHA) * srtt + self.ALPHA * rtt
+            self._estimates[peer_id] = (srtt, rttvar)
+
+    def timeout(self, *peer_ids):
+        """Timeout sugerido para uma resposta: o maior entre os peers informados."""
+        with self._lock:
+            timeouts = [
+                self.initial_timeout if peer_id not in self._estimates
+                else self._estimates[peer_id][0] + 4 * self._estimates[peer_id][1]
+                for peer_id in peer_ids
+            ]
+        if not timeouts:
+            return self.initial_timeout
+        return min(self.max_timeout, max(self.min_timeout, max(timeouts)))
+
+    def forget(self, peer_id):
+        with self._lock:
+            self._estimates.pop(peer_id, None)
+
+class Swim:
+    """Detector de falhas no estilo SWIM. A cada período o nó sonda um único peer (em round-robin
+    embaralhado); sem ACK no prazo, pede a k outros peers que sondem o alvo (sonda indireta). Sem
+    resposta, o peer fica suspeito e só é declarado falho se não refutar a suspeita a tempo.
+    As mudanças de estado, a versão da tabela de membros e o contador de vida do coordenador vão de
+    carona nas próprias sondas, então a carga por nó não cresce com o tamanho da rede.
+    """
+    PERIOD = 1.0           # Intervalo (s) entre sondas
+    INDIRECT_PROBES = 3    # Peers (k) usados na sonda indireta
+    SUSPICION_PERIODS = 3  # Períodos (vezes log2 N) até um suspeito ser declarado falho
+    RETRANSMIT_MULT = 3    # Cada atualização vai de carona em até RETRANSMIT_MULT * log2 N mensagens
+    MAX_PIGGYBACK = 8      # Atualizações de estado por mensagem
+
+    def __init__(self, node, rtt):
+        self.node = node  # Referência ao objeto Node principal
+        self.rtt = rtt  # Estimativa de RTT por peer, usada no prazo do ACK direto
+        self.incarnation = 0  # Encarnação deste nó, incrementada para refutar suspeitas
+        self.members = {}  # peer_id -> {"state": alive|suspect|dead, "inc": encarnação, "since": timestamp}
+        self.updates = []  # Atualizações a disseminar: [atualização, transmissões restantes]
+        self.coordinator_beat = (None, 0)  # (ID do coordenador, maior contador de vida visto)
+        self._probe_order = []  # Ordem embaralhada dos próximos alvos
+        self._probes = {}  # seq -> {"target", "sent_at", "on_failure"} das sondas sem ACK
+        self._relays = {}  # seq local -> (ID, endereço e seq de quem pediu a sonda indireta)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.probes = node.metrics.counter("swim_probes_total", "Sondas SWIM concluídas, por resultado", ("result",))
+
+    def _log_n(self):
+        return max(1, math.ceil(math.log2(len(self.node.peers) + 1)))
+
+    def _state(self, peer_id):
+        return self.members.get(peer_id, {"state": "alive"})["state"]
+
+    def forget(self, peer_id):
+        """Descarta o estado de um peer (ex.: ID reatribuído a um novo nó)."""
+        with self._lock:
+            self.members.pop(peer_id, None)
+        self.rtt.forget(peer_id)
+
+    def tick(self):
+        """Executa um período do protocolo: expira suspeitas, avança o contador de vida e sonda um peer."""
+        if self.node.id is None or self.node.stop_event.is_set():
+            return
+        self._expire_suspects()
+        with self._lock:
+            if self.node.is_coordinator:
+                coordinator_id, beat = self.coordinator_beat
+                self.coordinator_beat = (self.node.id, beat + 1 if coordinator_id == self.node.id else 1)
+        target = self._next_target()
+        if target is not None:
+            self.probe(target)
+
+    def _next_target(self):
+        with self._lock:
+            while self._probe_order:
+                peer_id = self._probe_order.pop()
+                if peer_id in self.node.peers and self._state(peer_id) != "dead":
+                    return peer_id
+            # Fim da rodada: embaralha novamente, para que cada peer seja sondado uma vez por rodada
+            candidates = [pid for pid in self.node.peers.others(self.node.id) if self._state(pid) != "dead"]
+            random.shuffle(candidates)
+            self._probe_order = candidates
+            return self._probe_order.pop() if candidates else None
+
+    def probe(self, target, on_failure=None):
+        """Sonda um peer. Sem ACK (direto ou indireto) até o fim do período, o peer é marcado como
+        suspeito, ou `on_failure(target)` é chamado, se informado."""
+        pinfo = self.node.peers.get(target)
+        if pinfo is None:
+            return
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._probes[seq] = {"target": target, "sent_at": time.time(), "on_failure": on_failure}
+        self._send(pinfo, {"type": "PING", "seq": seq})
+        self.node.communication.call_later(min(self.rtt.timeout(target), self.PERIOD / 2), self._indirect_probe, seq)
+        self.node.communication.call_later(self.PERIOD, self._finish_probe, seq)
+
+    def _indirect_probe(self, seq):
+        with self._lock:
+            probe = self._probes.get(seq)
+            if probe is None:
+                return # ACK já recebido
+            target = probe["target"]
+            helpers = [pid for pid in self.node.peers.others(self.node.id)
+                       if pid != target and self._state(pid) == "alive"]
+        helpers = random.sample(helpers, min(self.INDIRECT_PROBES, len(helpers)))
+        logger.debug(f"Nó {self.node.id}: Sem ACK de {target}. Sonda indireta via {helpers}")
+        for pid in helpers:
+            self._send(self.node.peers.get(pid), {"type": "PING_REQ", "seq": seq, "target_id": target})
+
+    def _finish_probe(self, seq):
+        with self._lock:
+            probe = self._probes.pop(seq, None)
+        if probe is None:
+            return
+        self.probes.inc("failed")
+        if probe["on_failure"] is not None:
+            probe["on_failure"](probe["target"])
+        else:
+            self.suspect(probe["target"])
+
+    def _send(self, pinfo, message):
+        """Envia uma mensagem do protocolo com as informações de carona."""
+        if pinfo is None:
+            return
+        message.update(self._piggyback(), sender_id=self.node.id, ip=self.node.host, port=self.node.port)
+        self.node.communication.post_tcp_message(pinfo["ip"], pinfo["port"], message)
+
+    def _piggyback(self):
+        with self._lock:
+            # Prioriza as atualizações menos transmitidas
+            self.updates.sort(key=lambda item: -item[1])
+            chosen = self.updates[:self.MAX_PIGGYBACK]
+            for item in chosen:
+                item[1] -= 1
+            self.updates = [item for item in self.updates if item[1] > 0]
+            extra = {
+                "updates": [item[0] for item in chosen],
+                "coordinator_beat": list(self.coordinator_beat),
+                "version": self.node.membership.version,
+            }
+        if self.node.is_coordinator:
+            extra["digest"] = self.node.membership.digest()
+        return extra
+
+    def handle_ping(self, message):
+        """Responde a uma sonda com ACK."""
+        self._receive(message)
+        self._send(message, {"type": "ACK", "seq": message["seq"]})
+
+    def handle_ping_req(self, message):
+        """Sonda o alvo em nome de outro peer e repassa o ACK a ele."""
+        self._receive(message)
+        target = self.node.peers.get(message["target_id"])
+        if target is None:
+            return
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._relays[seq] = (message["target_id"], {"ip": message["ip"], "port": message["port"]}, message["seq"])
+        self._send(target, {"type": "PING", "seq": seq})
+        self.node.communication.call_later(self.PERIOD, self._expire_relay, seq)
+
+    def _expire_relay(self, seq):
+        with self._lock:
+            self._relays.pop(seq, None)
+
+    def handle_ack(self, message):
+        """Trata um ACK: confirma uma sonda própria ou repassa o de uma sonda indireta."""
+        self._receive(message)
+        with self._lock:
+            relay = self._relays.pop(message["seq"], None)
+            probe = self._probes.pop(message["seq"], None) if relay is None else None
+        if relay is not None:
+            target_id, requester, requester_seq = relay
+            self._send(requester, {"type": "ACK", "seq": requester_seq, "target_id": target_id})
+        elif probe is not None and message["sender_id"] == probe["target"]:
+            self.rtt.observe(probe["target"], time.time() - probe["sent_at"]) # Só ACKs diretos medem o RTT
+            self.probes.inc("ack")
+        elif probe is not None:
+            self.probes.inc("indirect_ack")
+
+    def _receive(self, message):
+        """Aplica as informações de carona de uma mensagem recebida."""
+        for update in message.get("updates", ()):
+            self._apply(update)
+        self._observe_beat(message.get("coordinator_beat"))
+        if message.get("sender_id") == self.node.coordinator_id and "digest" in message:
+            self.node.membership.check_digest(message.get("version"), message["digest"])
+        else:
+            self.node.membership.observe_version(message.get("version"))
+
+    def _observe_beat(self, beat):
+        """Repassa ao detector phi-accrual cada avanço do contador de vida do coordenador."""
+        if not beat or self.node.is_coordinator:
+            return
+        coordinator_id, counter = beat
+        with self._lock:
+            if coordinator_id != self.node.coordinator_id:
+                return
+            known_id, known = self.coordinator_beat
+            if known_id == coordinator_id and counter <= known:
+                return
+            self.coordinator_beat = (coordinator_id, counter)
+        self.node.coordinator_detector.heartbeat()
+
+    def _overrides(self, state, inc, current):
+        """Regras do SWIM: falha é definitiva; suspeita vence 'vivo' da mesma encarnação; caso contrário vence a maior encarnação."""
+        if current["state"] == "dead":
+            return False
+        if state == "dead":
+            return True
+        if state == "suspect":
+            return inc > current["inc"] or (inc == current["inc"] and current["state"] == "alive")
+        return inc > current["inc"]
+
+    def _apply(self, update):
+        peer_id, state, inc = update["id"], update["state"], update["inc"]
+        if peer_id == self.node.id:
+            if state != "alive":
+                self._refute(state, inc)
+            return
+        with self._lock:
+            current = self.members.get(peer_id, {"state": "alive", "inc": 0})
+            if not self._overrides(state, inc, current):
+                return
+            self.members[peer_id] = {"state": state, "inc": inc, "since": time.time()}
+            self._enqueue(update)
+        if state == "suspect":
+            logger.info(f"Nó {self.node.id}: Peer {peer_id} está suspeito.")
+        elif state == "dead":
+            self._declare_dead(peer_id)
+
+    def _enqueue(self, update):
+        """Agenda a disseminação de uma atualização (chamado com o lock adquirido)."""
+        self.updates = [item for item in self.updates if item[0]["id"] != update["id"]]
+        self.updates.append([update, self.RETRANSMIT_MULT * self._log_n()])
+
+    def _refute(self, state, inc):
+        if state == "dead":
+            logger.warning(f"Nó {self.node.id}: Declarado falho por outro peer.")
+            # A falha é definitiva (qualquer que seja a encarnação): os peers removem o nó, que pede para voltar
+            self.node.node_state.reannounce()
+        with self._lock:
+            if inc < self.incarnation:
+                return # Suspeita sobre uma encarnação antiga
+            self.incarnation = inc + 1
+            self._enqueue({"id": self.node.id, "state": "alive", "inc": self.incarnation})
+        logger.info(f"Nó {self.node.id}: Refutando suspeita (encarnação {self.incarnation}).")
+
+    def restore(self, incarnation):
+        """Retoma a encarnação salva antes de um reinício com o mesmo ID, anunciando o nó como vivo em uma
+        encarnação nova: anula as suspeitas levantadas enquanto o processo estava fora do ar."""
+        with self._lock:
+            self.incarnation = max(self.incarnation, incarnation + 1)
+            self._enqueue({"id": self.node.id, "state": "alive", "inc": self.incarnation})
+
+    def suspect(self, peer_id):
+        """Marca um peer como suspeito após uma sonda sem resposta."""
+        with self._lock:
+            inc = self.members.get(peer_id, {"inc": 0})["inc"]
+        logger.warning(f"Nó {self.node.id}: Peer {peer_id} não respondeu à sonda.")
+        self._apply({"id": peer_id, "state": "suspect", "inc": inc})
+
+    def confirm_failed(self, peer_id):
+        """Declara um peer falho sem passar pela suspeita (ex.: coordenador já suspeito pelo phi-accrual)."""
+        with self._lock:
+            inc = self.members.get(peer_id, {"inc": 0})["inc"]
+        self._apply({"id": peer_id, "state": "dead", "inc": inc})
+
+    def _expire_suspects(self):
+        timeout = self.SUSPICION_PERIODS * self._log_n() * self.PERIOD
+        now = time.time()
+        with self._lock:
+            expired = [(pid, m["inc"]) for pid, m in self.members.items()
+                       if m["state"] == "suspect" and now - m["since"] > timeout]
+        for peer_id, inc in expired:
+            self._apply({"id": peer_id, "state": "dead", "inc": inc})
+
+    def _declare_dead(self, peer_id):
+        logger.warning(f"Nó {self.node.id}: Peer {peer_id} declarado falho.")
+        if peer_id == self.node.coordinator_id and not self.node.is_coordinator:
+            self.node.handle_coordinator_failure()
+        else:
+            self.node.remove_peer(peer_id)
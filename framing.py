@@ -0,0 +1,130 @@
+import socket
+import struct
+import threading
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+# Cabeçalho de cada frame: tamanho do payload em 4 bytes (big-endian)
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024  # Frames maiores que 16MB são considerados corrompidos
+LEGACY_MESSAGE_START = ord("{")    # Remetentes antigos enviam JSON puro, sem cabeçalho
+
+def encode_frame(payload):
+    """Prefixa o payload com o cabeçalho de tamanho para envio em uma conexão TCP."""
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+class BufferPool:
+    """Pool de buffers (bytearray) reutilizáveis para recepção com recv_into,
+    evitando a alocação de um novo objeto bytes a cada leitura.
+    """
+    def __init__(self, buffer_size=64 * 1024, max_buffers=32):
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers  # Máximo de buffers livres mantidos no pool
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Retira um buffer do pool ou aloca um novo se o pool estiver vazio."""
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return bytearray(self.buffer_size)
+
+    def release(self, buffer):
+        """Devolve um buffer ao pool para ser reutilizado."""
+        if len(buffer) != self.buffer_size:
+            return # Buffers temporários de tamanho diferente não voltam ao pool
+        with self._lock:
+            if len(self._free) < self.max_buffers:
+                self._free.append(buffer)
+
+class FrameBuffer:
+    """Buffer de recepção que acumula bytes de uma conexão e extrai os frames completos.
+    Os payloads são entregues como memoryview sobre o buffer e só são válidos até a próxima escrita nele.
+    """
+    def __init__(self, buffer_pool):
+        self.buffer_pool = buffer_pool
+        self.buffer = buffer_pool.acquire()
+        self.view = memoryview(self.buffer)
+        self.start = 0  # Início dos dados ainda não consumidos
+        self.end = 0    # Fim dos dados recebidos
+        self.legacy = None  # Definido na primeira leitura: True se o remetente não usa frames
+
+    def close(self):
+        """Devolve o buffer ao pool."""
+        self.buffer_pool.release(self.buffer)
+
+    def _make_room(self, needed):
+        """Garante espaço contíguo para `needed` bytes a partir do início dos dados pendentes."""
+        if self.start + needed <= len(self.buffer):
+            return
+        pending = self.end - self.start
+        if needed > len(self.buffer):
+            # Dados maiores que o buffer do pool: usa um buffer temporário maior
+            bigger = bytearray(max(needed, 2 * len(self.buffer)))
+            bigger[:pending] = self.view[self.start:self.end]
+            self.buffer_pool.release(self.buffer)
+            self.buffer, self.view = bigger, memoryview(bigger)
+        else:
+            # Move os dados pendentes para o início do buffer
+            self.view[:pending] = self.view[self.start:self.end]
+        self.start, self.end = 0, pending
+
+    def writable(self):
+        """Retorna a área livre do buffer onde a próxima leitura deve ser escrita."""
+        if self.end == len(self.buffer):
+            self._make_room(self.end - self.start + 1)
+        return self.view[self.end:]
+
+    def commit(self, received):
+        """Registra que `received` bytes foram escritos na área retornada por writable()."""
+        if self.legacy is None and received:
+            self.legacy = self.buffer[self.start] == LEGACY_MESSAGE_START
+        self.end += received
+
+    def frames(self):
+        """Gera os payloads dos frames completos já recebidos."""
+        if self.legacy:
+            return # Mensagens antigas são entregues apenas no fim da conexão
+        while self.end - self.start >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(self.buffer, self.start)
+            if length > MAX_FRAME_SIZE:
+                raise ValueError(f"frame de {length} bytes excede o limite")
+            frame_end = self.start + FRAME_HEADER.size + length
+            if frame_end > self.end:
+                self._make_room(FRAME_HEADER.size + length)
+                break
+            yield self.view[self.start + FRAME_HEADER.size:frame_end]
+            self.start = frame_end
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def legacy_messages(self):
+        """Gera as mensagens de um remetente antigo, após o fim da conexão.
+        Remetentes antigos enviam uma mensagem JSON por linha (ou uma única mensagem por conexão).
+        """
+        if not self.legacy:
+            return
+        for line in bytes(self.view[self.start:self.end]).split(b"\n"):
+            if line.strip():
+                yield memoryview(line)
+
+class FrameReader(FrameBuffer):
+    """Lê frames sucessivos de um socket bloqueante usando recv_into em um buffer do pool."""
+    def __init__(self, conn, buffer_pool):
+        super().__init__(buffer_pool)
+        self.conn = conn
+
+    def read_frames(self, stop_event):
+        """Gera os payloads recebidos na conexão até o peer fechá-la ou stop_event ser sinalizado."""
+        while not stop_event.is_set():
+            try:
+                received = self.conn.recv_into(self.writable())
+            except socket.timeout:
+                continue
+            if received == 0:
+                break
+            self.commit(received)
+            yield from self.frames()
+        yield from self.legacy_messages()
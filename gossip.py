@@ -0,0 +1,85 @@
+import math
+import random
+import threading
+from collections import OrderedDict
+from rooms import DEFAULT_ROOM
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+class MessageIdCache:
+    """Cache LRU limitado de IDs de mensagens já vistas, usado para suprimir duplicatas."""
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, msg_id):
+        """Registra o ID. Retorna True se ele ainda não tinha sido visto."""
+        with self._lock:
+            if msg_id in self._ids:
+                self._ids.move_to_end(msg_id)
+                return False
+            self._ids[msg_id] = None
+            if len(self._ids) > self.capacity:
+                self._ids.popitem(last=False) # Descarta o ID menos recente
+            return True
+
+    def __contains__(self, msg_id):
+        with self._lock:
+            return msg_id in self._ids
+
+class Gossip:
+    """Disseminação epidêmica (push gossip) de mensagens de chat.
+    O remetente envia a mensagem para um pequeno subconjunto aleatório de peers, e cada receptor
+    a repassa para outro subconjunto enquanto o TTL não se esgota. O custo de envio por nó fica em
+    O(log N), em vez de N-1 conexões diretas. A mensagem circula apenas entre os inscritos na sua
+    sala, e o fanout e o TTL são dimensionados pelo tamanho da sala.
+    """
+    def __init__(self, node, fanout=None, ttl=None):
+        self.node = node  # Referência ao objeto Node principal
+        self.fixed_fanout = fanout  # Se None, o fanout é calculado a partir do tamanho da rede
+        self.fixed_ttl = ttl        # Se None, o TTL é calculado a partir do tamanho da rede
+
+    def fanout(self, cluster_size):
+        """Número de peers para os quais cada nó repassa a mensagem: ~log2(N) + 1."""
+        if self.fixed_fanout is not None:
+            return self.fixed_fanout
+        return max(2, math.ceil(math.log2(max(cluster_size, 2))) + 1)
+
+    def ttl(self, cluster_size):
+        """Número máximo de saltos de uma mensagem: ~log2(N) + 2."""
+        if self.fixed_ttl is not None:
+            return self.fixed_ttl
+        return math.ceil(math.log2(max(cluster_size, 2))) + 2
+
+    def _members(self, message):
+        """Inscritos na sala da mensagem, exceto o próprio nó."""
+        return self.node.rooms.members(message.get("room", DEFAULT_ROOM))
+
+    def _pick_targets(self, members, exclude):
+        """Escolhe aleatoriamente os próximos peers entre os inscritos, exceto os excluídos."""
+        candidates = [(pid, pinfo) for pid, pinfo in members.items() if pid not in exclude]
+        chosen = random.sample(candidates, min(self.fanout(len(members) + 1), len(candidates)))
+        return dict(chosen)
+
+    def publish(self, message):
+        """Inicia a disseminação de uma mensagem criada por este nó."""
+        members = self._members(message)
+        message["ttl"] = self.ttl(len(members) + 1)
+        message["relay_id"] = self.node.id
+        targets = self._pick_targets(members, exclude=())
+        self.node.broadcast(message, targets=targets, queued=True)
+        logger.debug(f"Nó {self.node.id}: Mensagem {message['msg_id']} publicada via gossip para {list(targets)}")
+
+    def relay(self, message):
+        """Repassa uma mensagem recebida pela primeira vez, se o TTL permitir."""
+        ttl = message.get("ttl", 0) - 1
+        if ttl <= 0:
+            return
+        # Não devolve a mensagem para quem a criou nem para quem acabou de repassá-la
+        exclude = (message.get("sender_id"), message.get("relay_id"))
+        relayed = dict(message, ttl=ttl, relay_id=self.node.id)
+        targets = self._pick_targets(self._members(message), exclude)
+        self.node.broadcast(relayed, targets=targets, queued=True)
+        logger.debug(f"Nó {self.node.id}: Mensagem {message['msg_id']} repassada (TTL {ttl}) para {list(targets)}")
@@ -0,0 +1,295 @@
+import threading
+import time
+from types import MappingProxyType
+from election import ELECTION_STRATEGIES
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+class GroupScope:
+    """Restringe uma estratégia de eleição ao grupo do nó: os candidatos são os membros do grupo de
+    ID maior, o anúncio vai só para o grupo e o vencedor passa a ser o líder do grupo."""
+    TYPES = {"election": "GROUP_ELECTION", "answer": "GROUP_ANSWER", "coordinator": "GROUP_LEADER"}
+    ROLE = "líder do grupo"
+    METRIC = "group_election"
+
+    def _candidates(self):
+        hierarchy = self.node.hierarchy
+        group = hierarchy.group_of(self.node.id)
+        return MappingProxyType({pid: pinfo for pid, pinfo in self.node.peers.higher(self.node.id).items()
+                                 if hierarchy.group_of(pid) == group})
+
+    def _announce_targets(self):
+        return self.node.hierarchy.group_members()
+
+    def _elected(self, leader_id):
+        self.node.hierarchy.set_leader(leader_id)
+
+    def _is_leader(self):
+        return self.node.hierarchy.is_leader()
+
+def group_election(strategy, node):
+    """Instância da estratégia de eleição `strategy` (bully ou fast) restrita ao grupo do nó."""
+    base = ELECTION_STRATEGIES[strategy]
+    return type(f"Group{base.__name__}", (GroupScope, base), {})(node)
+
+class Hierarchy:
+    """Modo hierárquico (dois níveis) para redes grandes. Os IDs são distribuídos em blocos de
+    `group_size` IDs, e cada bloco é um grupo. O líder de um grupo é o seu membro de maior ID
+    (o vencedor do Bully dentro do grupo, reeleito com a mesma lógica de election.py quando o
+    líder falha). O coordenador fala apenas com os líderes, que repassam deltas da tabela de
+    membros e heartbeats ao seu grupo, respondem à sincronização da tabela e admitem os novos nós.
+
+    Os IDs de um bloco são atribuídos de cima para baixo: o primeiro nó recebe o maior ID do bloco
+    (e lidera o grupo), e o líder atribui os seguintes sem consultar o coordenador, que só registra
+    a entrada (JOIN_RECORD) e a divulga; o novo nó só entra na tabela do líder com o delta do
+    coordenador, para que todas as tabelas com a mesma versão continuem iguais. O coordenador abre
+    um bloco novo quando todos estão cheios.
+    Com group_size=None o modo é desativado e a rede continua plana.
+    """
+    ROUTE_TTL = 5.0  # Tempo (s) em que as retransmissões de um JOIN_REQUEST vão para o mesmo líder e recebem o mesmo ID
+
+    def __init__(self, node, group_size=None, election="bully"):
+        self.node = node  # Referência ao objeto Node principal
+        self.group_size = group_size
+        self.enabled = bool(group_size)
+        self.leader_id = None  # Líder do grupo anunciado pela última eleição do grupo
+        self.election = group_election(election, node) if self.enabled else None
+        self._routes = {}  # (ip, porta) -> (líder, instante) das entradas encaminhadas e ainda não registradas
+        self._admitted = {}  # (ip, porta) -> (ID, instante) das entradas admitidas por este líder e ainda não registradas
+        self._lock = threading.Lock()
+        self.joins = node.metrics.counter("hierarchy_joins_total", "Entradas na rede tratadas, por caminho", ("path",))
+
+    # --- Grupos e líderes ---
+
+    def group_of(self, peer_id):
+        return (peer_id - 1) // self.group_size
+
+    def first_id(self):
+        """ID do primeiro nó da rede: o maior do primeiro bloco (1 no modo plano)."""
+        return self.group_size if self.enabled else 1
+
+    def groups(self):
+        """Grupo -> IDs dos membros, em ordem crescente (calculado uma vez por versão da tabela)."""
+        def compute(table):
+            groups = {}
+            for pid in sorted(table):
+                groups.setdefault(self.group_of(pid), []).append(pid)
+            return groups
+        return self.node.peers.view(("groups", self.group_size), compute)
+
+    def leader_of(self, group):
+        """Líder de um grupo: o eleito (no grupo deste nó) ou, sem eleição, o membro de maior ID."""
+        members = self.groups().get(group)
+        if not members:
+            return None
+        if self.leader_id in self.node.peers and self.node.id is not None and group == self.group_of(self.node.id) \
+                and self.group_of(self.leader_id) == group:
+            return self.leader_id
+        return members[-1]
+
+    def is_leader(self):
+        return self.enabled and self.node.id is not None and self.leader_of(self.group_of(self.node.id)) == self.node.id
+
+    def group_members(self):
+        """Membros do grupo deste nó, exceto ele próprio."""
+        group = self.group_of(self.node.id)
+        return MappingProxyType({pid: self.node.peers[pid] for pid in self.groups().get(group, ())
+                                 if pid != self.node.id and pid in self.node.peers})
+
+    def downstream(self):
+        """Peers que recebem diretamente deste nó o que vem do coordenador (deltas da tabela e heartbeats):
+        o coordenador envia aos líderes e ao próprio grupo, e cada líder ao seu grupo.
+        None no modo plano (todos os peers)."""
+        if not self.enabled:
+            return None
+        if not (self.node.is_coordinator or self.is_leader()):
+            return {}
+        if not self.node.is_coordinator:
+            return self.group_members()
+        own = self.group_of(self.node.id)
+        targets = dict(self.group_members())
+        for group in self.groups():
+            leader = self.leader_of(group)
+            if group != own and leader in self.node.peers:
+                targets[leader] = self.node.peers[leader]
+        return targets
+
+    def upstream_id(self):
+        """De quem este nó recebe as alterações da tabela e os heartbeats: o líder do grupo ou, para os
+        líderes, o coordenador."""
+        if not self.enabled or self.node.id is None or self.is_leader():
+            return self.node.coordinator_id
+        return self.leader_of(self.group_of(self.node.id))
+
+    def set_leader(self, leader_id):
+        """Adota o vencedor da eleição do grupo. O vencedor informa ao coordenador os membros de ID maior
+        que não responderam, para que a tabela de membros (e a visão dos líderes) convirja."""
+        self.leader_id = leader_id
+        self.node.coordinator_detector.reset()
+        logger.info(f"Nó {self.node.id}: Líder do grupo {self.group_of(leader_id)} é {leader_id}.")
+        if leader_id != self.node.id:
+            return
+        for pid in self.groups().get(self.group_of(leader_id), ()):
+            if pid > leader_id:
+                self.report_failure(pid)
+
+    def peer_removed(self, peer_id):
+        """Com a saída do líder do grupo (maior ID do grupo), os membros elegem o próximo."""
+        if not self.enabled or self.node.id is None or self.group_of(peer_id) != self.group_of(self.node.id):
+            return
+        if self.leader_id == peer_id:
+            self.leader_id = None
+        elif self.leader_id in self.node.peers:
+            return # O grupo já elegeu outro líder (ex.: saída do líder antigo, que não respondia)
+        remaining = self.groups().get(self.group_of(peer_id), ())
+        if peer_id == self.node.id or (remaining and peer_id < remaining[-1]):
+            return # Não era o líder
+        self.node.communication.call_later(0, self.election.start_election)
+
+    def handle_leader_failure(self):
+        """O líder do grupo parou de enviar heartbeats: elege outro dentro do grupo."""
+        logger.warning(f"Nó {self.node.id}: Líder do grupo {self.upstream_id()} sem sinais de vida. Iniciando eleição no grupo.")
+        self.node.coordinator_detector.reset()
+        self.election.start_election()
+
+    # --- Falhas detectadas pelos líderes ---
+
+    def report_failure(self, peer_id):
+        """Informa ao coordenador um membro do grupo que não responde (apenas líderes)."""
+        if self.node.is_coordinator:
+            self.node.remove_peer(peer_id)
+            return
+        coordinator = self.node.peers.get(self.node.coordinator_id)
+        if coordinator is not None:
+            message = {"type": "MEMBER_FAILED", "sender_id": self.node.id, "id": peer_id}
+            self.node.communication.post_tcp_message(coordinator["ip"], coordinator["port"], message)
+
+    def handle_member_failed(self, message):
+        """Remove da tabela um membro que o líder do seu grupo não alcança (apenas coordenador)."""
+        if not self.node.is_coordinator:
+            return
+        peer_id = message["id"]
+        if self.group_of(peer_id) != self.group_of(message["sender_id"]):
+            return # Só o líder do grupo responde pelos seus membros
+        logger.warning(f"Nó {self.node.id}: Líder {message['sender_id']} informou a falha do peer {peer_id}.")
+        self.node.remove_peer(peer_id)
+
+    # --- Entrada na rede ---
+
+    def route_join(self, message):
+        """Escolhe o grupo de um novo nó (apenas coordenador). Retorna True se o pedido foi encaminhado ao
+        líder do grupo, ou False se o próprio coordenador deve admiti-lo (grupo dele ou bloco novo)."""
+        address = (message["sender_ip"], message["sender_port"])
+        now = time.time()
+        with self._lock:
+            self._routes = {addr: route for addr, route in self._routes.items() if now - route[1] < self.ROUTE_TTL}
+            leader = self._routes.get(address, (None,))[0]
+        existing = next((pid for pid, pinfo in self.node.peers.items() if (pinfo["ip"], pinfo["port"]) == address), None)
+        if existing is not None:
+            leader = self.leader_of(self.group_of(existing)) # Retransmissão ou reentrada: mesmo grupo
+        elif leader not in self.node.peers:
+            group = self._pick_group()
+            leader = self.leader_of(group) if group is not None else None
+        if leader is None or leader == self.node.id:
+            return False
+        with self._lock:
+            self._routes[address] = (leader, now)
+        pinfo = self.node.peers[leader]
+        self.node.communication.post_tcp_message(pinfo["ip"], pinfo["port"], dict(message, forwarded=True))
+        self.joins.inc("forwarded")
+        logger.debug(f"Nó {self.node.id}: JOIN_REQUEST de {address[0]}:{address[1]} encaminhado ao líder {leader}.")
+        return True
+
+    def _pick_group(self):
+        """Grupo com menos membros entre os que têm IDs livres (None: todos cheios). As entradas já
+        encaminhadas e ainda não registradas contam como membros, para que uma rajada de entradas
+        não esgote o mesmo grupo."""
+        with self._lock:
+            pending = {}
+            for leader, _ in self._routes.values():
+                pending[self.group_of(leader)] = pending.get(self.group_of(leader), 0) + 1
+        best, best_size = None, None
+        for group, members in self.groups().items():
+            size = len(members) + pending.get(group, 0)
+            if len(self._free_ids(group, members)) > pending.get(group, 0) and (best is None or size < best_size):
+                best, best_size = group, size
+        return best
+
+    def _free_ids(self, group, members):
+        """IDs livres do bloco abaixo do líder (os IDs são atribuídos de cima para baixo)."""
+        start = group * self.group_size + 1
+        taken = set(members)
+        return [pid for pid in range(self.leader_of(group) - 1, start - 1, -1) if pid not in taken]
+
+    def assign_id(self, address):
+        """Próximo ID para um novo nó: do bloco deste líder ou, no coordenador sem espaço no próprio
+        grupo, o maior ID de um bloco novo. None se o bloco do líder estiver cheio.
+        O ID fica reservado para o endereço até o registro (record_join), para que entradas
+        simultâneas não recebam o mesmo ID. No modo plano, o maior ID da tabela mais um."""
+        if not self.enabled:
+            return max(self.node.peers) + 1
+        group = self.group_of(self.node.id)
+        now = time.time()
+        with self._lock:
+            self._admitted = {addr: entry for addr, entry in self._admitted.items() if now - entry[1] < self.ROUTE_TTL}
+            pending = [pid for pid, _ in self._admitted.values()]
+            free = self._free_ids(group, [*self.groups().get(group, ()), *pending])
+            if free:
+                peer_id = free[0]
+                path = "leader" if not self.node.is_coordinator else "coordinator"
+            elif self.node.is_coordinator:
+                peer_id = (max([*self.groups(), *map(self.group_of, pending)]) + 2) * self.group_size
+                path = "new_group"
+            else:
+                return None
+            self._admitted[address] = (peer_id, now)
+        self.joins.inc(path)
+        return peer_id
+
+    def admitting(self, group):
+        """True se há entradas encaminhadas ao grupo e ainda não registradas (o líder pode estar atribuindo IDs do bloco)."""
+        now = time.time()
+        with self._lock:
+            return any(self.group_of(leader) == group and now - at < self.ROUTE_TTL for leader, at in self._routes.values())
+
+    def admitted_id(self, address):
+        """ID já atribuído por este líder ao endereço e ainda não registrado (retransmissão do JOIN_REQUEST)."""
+        now = time.time()
+        with self._lock:
+            self._admitted = {addr: entry for addr, entry in self._admitted.items() if now - entry[1] < self.ROUTE_TTL}
+            return self._admitted.get(address, (None,))[0]
+
+    def record_join(self, peer_id, info):
+        """Registra a entrada de um nó admitido por este nó: no coordenador, direto na tabela de membros;
+        em um líder, via JOIN_RECORD ao coordenador. Retorna a versão da tabela enviada no JOIN_ACK."""
+        if self.node.is_coordinator:
+            version = self.node.membership.record_join(peer_id, info)
+            with self._lock:
+                self._admitted.pop((info["ip"], info["port"]), None) # Já na tabela: a reserva não é mais necessária
+            return version
+        with self._lock:
+            self._admitted[(info["ip"], info["port"])] = (peer_id, time.time())
+        coordinator = self.node.peers.get(self.node.coordinator_id)
+        if coordinator is not None:
+            record = {"type": "JOIN_RECORD", "sender_id": self.node.id, "id": peer_id, "info": info}
+            self.node.communication.post_tcp_message(coordinator["ip"], coordinator["port"], record)
+        return self.node.membership.version
+
+    def handle_join_record(self, message):
+        """Registra na tabela de membros um nó admitido por um líder de grupo (apenas coordenador)."""
+        if not self.node.is_coordinator:
+            return
+        peer_id, info = message["id"], message["info"]
+        if self.group_of(peer_id) != self.group_of(message["sender_id"]):
+            logger.warning(f"Nó {self.node.id}: ID {peer_id} fora do bloco do líder {message['sender_id']}. Ignorado.")
+            return
+        with self.node._join_lock: # Não se intercala com as entradas admitidas pelo próprio coordenador
+            existing = self.node.peers.get(peer_id)
+            if existing is not None and (existing["ip"], existing["port"]) != (info["ip"], info["port"]):
+                logger.warning(f"Nó {self.node.id}: ID {peer_id} já pertence a outro nó. Registro ignorado.")
+                return
+            with self._lock:
+                self._routes.pop((info["ip"], info["port"]), None)
+            self.node.membership.record_join(peer_id, info)
+        logger.info(f"Novo peer {peer_id} ({info['username']}) admitido pelo líder {message['sender_id']}.")
@@ -0,0 +1,167 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from array import array
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+# Mensagens de carga: "#carga <execução>:<sequência> " seguido do preenchimento até o tamanho pedido;
+# ao terminar, o gerador envia "#carga <execução>:fim <total enviado>"
+LOAD_PREFIX = "#carga "
+LOAD_MESSAGE = re.compile(r"#carga ([0-9a-f]+):(\d+|fim \d+)")
+PERCENTILES = (50, 90, 99, 99.9)
+
+def percentile(ordered, fraction):
+    """Percentil de uma sequência já ordenada (`fraction` entre 0 e 1)."""
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class LoadStats:
+    """Estatísticas das mensagens de carga recebidas por um nó: latência de ponta a ponta (horário de
+    envio da mensagem até a entrega, o que supõe relógios sincronizados entre as máquinas), vazão e,
+    por execução de cada remetente, mensagens perdidas e fora de ordem. Mensagens duplicadas já são
+    descartadas antes (supressão por ID), então não aparecem aqui.
+    """
+    def __init__(self, node):
+        self.node = node  # Referência ao objeto Node principal
+        self.latencies = array("d")  # Latências (s) de todas as entregas, para percentis exatos no relatório
+        self.bytes = 0
+        self.first_at = None  # Horário da primeira e da última entrega (janela da vazão)
+        self.last_at = None
+        self.runs = {}  # (remetente, execução) -> {"received", "lowest", "highest", "reordered", "total"}
+        self._lock = threading.Lock()
+        self.latency = node.metrics.histogram("load_latency_seconds", "Latência de ponta a ponta das mensagens de carga")
+
+    def observe(self, message):
+        """Registra uma mensagem de chat entregue; ignora as que não são de carga."""
+        text = message.get("text") or ""
+        if not text.startswith(LOAD_PREFIX):
+            return
+        match = LOAD_MESSAGE.match(text)
+        if match is None:
+            return
+        now = time.time()
+        key = (message.get("sender_id"), match.group(1))
+        with self._lock:
+            run = self.runs.setdefault(key, {"username": message.get("username"), "received": 0, "lowest": None, "highest": -1,
+                                             "reordered": 0, "total": None})
+            if match.group(2).startswith("fim"):
+                run["total"] = int(match.group(2).split()[1])
+                return
+            seq = int(match.group(2))
+            latency = max(0.0, now - message.get("ts", now))
+            self.latencies.append(latency)
+            self.bytes += len(text.encode("utf-8"))
+            self.first_at = self.first_at or now
+            self.last_at = now
+            run["received"] += 1
+            run["lowest"] = seq if run["lowest"] is None else min(run["lowest"], seq)
+            if seq < run["highest"]:
+                run["reordered"] += 1 # Chegou depois de uma mensagem posterior do mesmo remetente
+            else:
+                run["highest"] = seq
+        self.latency.observe(latency)
+
+    def report(self):
+        """Resumo das entregas: vazão, percentis de latência (ms) e perdas e reordenações por remetente."""
+        with self._lock:
+            ordered = sorted(self.latencies)
+            runs = {key: dict(run) for key, run in self.runs.items()}
+            window = (self.last_at - self.first_at) if ordered else 0.0
+            received_bytes = self.bytes
+        senders = []
+        for (sender_id, run_id), run in sorted(runs.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+            # Sem a mensagem final, o total enviado é estimado pela maior sequência recebida. As mensagens
+            # anteriores à primeira recebida (enviadas antes de este nó entrar na rede) não contam como perdas
+            expected = (run["total"] if run["total"] is not None else run["highest"] + 1) - (run["lowest"] or 0)
+            senders.append({
+                "sender_id": sender_id,
+                "username": run["username"],
+                "run": run_id,
+                "received": run["received"],
+                "expected": expected,
+                "lost": max(0, expected - run["received"]),
+                "reordered": run["reordered"],
+                "complete": run["total"] is not None, # False: a mensagem final não chegou (perdas no fim não contam)
+            })
+        latency_ms = {}
+        if ordered:
+            latency_ms = {f"p{p:g}": percentile(ordered, p / 100) * 1000 for p in PERCENTILES}
+            latency_ms.update(mean=sum(ordered) / len(ordered) * 1000, max=ordered[-1] * 1000)
+        return {
+            "messages": len(ordered),
+            "bytes": received_bytes,
+            "window_s": window,
+            "messages_per_s": len(ordered) / window if window > 0 else None,
+            "bytes_per_s": received_bytes / window if window > 0 else None,
+            "latency_ms": latency_ms,
+            "lost": sum(s["lost"] for s in senders),
+            "reordered": sum(s["reordered"] for s in senders),
+            "senders": senders,
+        }
+
+class LoadGenerator:
+    """Gera tráfego de chat com taxa e tamanho fixos por `Node.send_chat_message`. Cada mensagem leva o
+    horário de envio (campo ts) e uma sequência da execução no texto; os nós que recebem a carga (com
+    LoadStats) medem latência, vazão, perdas e reordenações. A taxa segue um cronograma absoluto:
+    atrasos (ex.: fila de saída bloqueada) são compensados com envios imediatos, sem acumular deriva.
+    """
+    def __init__(self, node, rate, size, duration, room):
+        self.node = node  # Referência ao objeto Node principal
+        self.rate = rate  # Mensagens por segundo (0: só recebe)
+        self.size = size  # Tamanho do texto de cada mensagem, em bytes
+        self.duration = duration
+        self.room = room
+        self.run_id = uuid.uuid4().hex[:8]  # Distingue as execuções de um mesmo nó (ex.: após um reinício)
+        self.sent = 0
+        self.started = None
+        self.finished = None
+
+    def _payload(self, seq):
+        head = f"{LOAD_PREFIX}{self.run_id}:{seq} "
+        return head + "x" * max(0, self.size - len(head))
+
+    def run(self, stop_event):
+        """Envia a carga até o fim da duração (ou até `stop_event`)."""
+        self.started = time.time()
+        deadline = self.started + self.duration
+        if self.rate > 0:
+            logger.info(f"Nó {self.node.id}: Gerando carga: {self.rate:g} msg/s de {self.size} bytes por {self.duration:g} s "
+                        f"(execução {self.run_id}).")
+            while not stop_event.is_set():
+                due = self.started + self.sent / self.rate
+                if due >= deadline:
+                    break
+                if due > time.time():
+                    stop_event.wait(due - time.time())
+                    continue
+                self.node.send_chat_message(self._payload(self.sent), room=self.room)
+                self.sent += 1
+            self.finished = time.time()
+            self.node.send_chat_message(f"{LOAD_PREFIX}{self.run_id}:fim {self.sent}", room=self.room)
+        else:
+            stop_event.wait(max(0.0, deadline - time.time()))
+            self.finished = time.time()
+
+    def summary(self):
+        """Resumo do envio (também de uma execução interrompida)."""
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0.0
+        return {
+            "run": self.run_id,
+            "messages": self.sent,
+            "duration_s": elapsed,
+            "messages_per_s": self.sent / elapsed if elapsed > 0 else None,
+        }
+
+def write_report(path, report):
+    """Grava o relatório em JSON (arquivo temporário e troca atômica)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
@@ -1,30 +1,150 @@
+import argparse
+import contextlib
+import os
 import socket
 import random
-import sys
-from node import Node
+import threading
+import time
+from node import Node, BACKENDS
+from election import ELECTION_STRATEGIES
+from message_log import format_entry
+from rooms import DEFAULT_ROOM, valid_room
+from loadgen import LoadGenerator, LoadStats, write_report
+
+HISTORY_PAGE_SIZE = 50 # Mensagens exibidas por padrão no comando history
+SEARCH_PAGE_SIZE = 20  # Resultados por página dos comandos search e from
+
+def print_results(node, query):
+    """Imprime uma página de resultados de busca e avança a consulta para a próxima página."""
+    seqs, more = query["run"](query["terms"], offset=query["offset"], limit=SEARCH_PAGE_SIZE)
+    for seq in seqs:
+        entries = node.message_log.read(seq, 1)
+        if entries:
+            print(f"[{seq}] {format_entry(entries[0])}")
+    shown = query["offset"] + len(seqs)
+    query["offset"] = shown
+    if not shown:
+        print("Nenhuma mensagem encontrada.")
+    else:
+        print(f"--- {shown} resultados exibidos{' (more para continuar)' if more else ''} ---")
+    return more
+
+def run_headless(node, args):
+    """Modo sem interação (teste de carga): envia mensagens com a taxa e o tamanho pedidos, mede as
+    mensagens de carga recebidas dos outros nós e grava um relatório em JSON ao terminar."""
+    node.load_stats = LoadStats(node)
+    room = args.rooms[0] if args.rooms else DEFAULT_ROOM
+    generator = LoadGenerator(node, args.rate, args.size, args.duration, room)
+    stop = threading.Event()
+    started_at = time.time()
+    # As mensagens recebidas não são impressas durante a carga
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            generator.run(stop)
+            stop.wait(args.settle) # Entregas em andamento e nós que terminam de enviar depois deste
+        except KeyboardInterrupt:
+            stop.set()
+    report = {
+        "node": {"id": node.id, "ip": node.host, "port": node.port, "username": node.username},
+        "config": {"rate": args.rate, "size": args.size, "duration": args.duration, "room": room,
+                   "dissemination": node.dissemination, "backend": args.backend},
+        "started_at": started_at,
+        "interrupted": stop.is_set(),
+        "sent": generator.summary(),
+        "received": node.load_stats.report(),
+    }
+    path = args.report or os.path.join(node.data_dir, "load_report.json")
+    write_report(path, report)
+    received = report["received"]
+    latency = received["latency_ms"]
+    print(f"Enviadas: {report['sent']['messages']}. Recebidas: {received['messages']} "
+          f"(perdidas: {received['lost']}, fora de ordem: {received['reordered']}).")
+    if latency:
+        print(f"Latência (ms): p50 {latency['p50']:.2f}, p99 {latency['p99']:.2f}, máx. {latency['max']:.2f}. "
+              f"Vazão: {received['messages_per_s'] or 0:.1f} msg/s.")
+    print(f"Relatório gravado em {path}")
+
+def parse_args():
+    """Interpreta os argumentos de linha de comando: [IP] [Porta] e opções do nó."""
+    parser = argparse.ArgumentParser(description="Nó do chat distribuído.")
+    parser.add_argument("address", nargs="*", help="[IP] Porta do nó (padrão: IP local e porta aleatória)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="threads",
+                        help="backend de comunicação: threads (padrão) ou asyncio")
+    parser.add_argument("--dissemination", choices=["direct", "gossip", "multicast"], default="direct",
+                        help="envio do chat: direct (para todos os peers, padrão), gossip (epidêmico) "
+                             "ou multicast (UDP multicast com reparo por NACK)")
+    parser.add_argument("--queue-policy", choices=["drop_oldest", "drop_newest", "block"], default="drop_oldest",
+                        help="o que fazer quando a fila de saída de um peer está cheia (padrão: drop_oldest)")
+    parser.add_argument("--failure-detector", choices=["swim", "heartbeat"], default="swim",
+                        help="detecção de falhas: swim (sondas entre peers, padrão) ou heartbeat (coordenador envia para todos)")
+    parser.add_argument("--election", choices=sorted(ELECTION_STRATEGIES), default="bully",
+                        help="algoritmo de eleição: bully (padrão) ou fast (Bully modificado, maior ID primeiro)")
+    parser.add_argument("--join-timeout", type=float, default=5.0,
+                        help="tempo máximo (s) procurando um coordenador antes de assumir a rede (padrão: 5)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="porta local para o endpoint HTTP de métricas (formato Prometheus, em /metrics)")
+    parser.add_argument("--data-dir", help="diretório de dados do nó (padrão: data/<ip>_<porta>)")
+    parser.add_argument("--group-size", type=int,
+                        help="modo hierárquico: nós por grupo, cada grupo com um líder (padrão: rede plana)")
+    parser.add_argument("--fresh", action="store_true",
+                        help="ignora o snapshot salvo do nó e entra na rede como um nó novo (padrão: retoma o ID anterior)")
+    parser.add_argument("--rooms", default=DEFAULT_ROOM,
+                        help=f"salas de chat iniciais, separadas por vírgula (padrão: {DEFAULT_ROOM})")
+    parser.add_argument("--username", help="nome de usuário (padrão: perguntado ao iniciar)")
+    load = parser.add_argument_group("modo de carga", "execução sem interação, para testes de carga (--headless)")
+    load.add_argument("--headless", action="store_true",
+                      help="gera e mede tráfego de chat sem ler comandos e grava um relatório ao terminar")
+    load.add_argument("--rate", type=float, default=10.0, help="mensagens enviadas por segundo (padrão: 10; 0: só mede)")
+    load.add_argument("--size", type=int, default=100, help="tamanho do texto de cada mensagem, em bytes (padrão: 100)")
+    load.add_argument("--duration", type=float, default=30.0, help="duração do envio, em segundos (padrão: 30)")
+    load.add_argument("--settle", type=float, default=3.0,
+                      help="espera (s) após o envio pelas últimas entregas antes do relatório (padrão: 3)")
+    load.add_argument("--report", help="arquivo do relatório em JSON (padrão: <diretório de dados>/load_report.json)")
+    args = parser.parse_args()
+    if len(args.address) > 2:
+        parser.error("informe no máximo IP e Porta")
+    if args.rate < 0 or args.size < 1 or args.duration <= 0 or args.settle < 0:
+        parser.error("--rate e --settle não podem ser negativos, e --size e --duration devem ser positivos")
+    if args.group_size is not None and args.group_size < 2:
+        parser.error("--group-size deve ser pelo menos 2")
+    args.rooms = [room for room in args.rooms.split(",") if room]
+    invalid = [room for room in args.rooms if not valid_room(room)]
+    if invalid:
+        parser.error(f"nome de sala inválido: {', '.join(invalid)} (letras, dígitos, _ e -, começando com letra)")
+    return args
 
 def main():
     """Função principal para iniciar o nó e gerenciar a interação com o usuário."""
     try:
+        args = parse_args()
         # Lógica para tratar os argumentos IP e Porta
         # Assume IP local e porta aleatória por padrão
         my_ip = socket.gethostbyname(socket.gethostname())
         my_port = random.randint(8000, 9000)
 
-        if len(sys.argv) == 3:
+        if len(args.address) == 2:
             # Se 2 argumentos: IP e Porta
-            my_ip = sys.argv[1]
-            my_port = int(sys.argv[2])
-        elif len(sys.argv) == 2:
+            my_ip = args.address[0]
+            my_port = int(args.address[1])
+        elif len(args.address) == 1:
             # Se 1 argumento: Porta (usa IP local)
-            my_port = int(sys.argv[1])
+            my_port = int(args.address[0])
 
-        # Solicita o nome de usuário
-        username = input("Digite seu nome de usuário: ")
+        # Solicita o nome de usuário (no modo de carga, sem interação)
+        username = args.username or (f"carga-{my_port}" if args.headless else input("Digite seu nome de usuário: "))
         
         # Cria e inicia o nó
-        node = Node(my_ip, my_port, username)
+        node = Node(my_ip, my_port, username, backend=args.backend, dissemination=args.dissemination,
+                    queue_policy=args.queue_policy, data_dir=args.data_dir,
+                    failure_detector=args.failure_detector, join_timeout=args.join_timeout,
+                    election=args.election, metrics_port=args.metrics_port, rooms=args.rooms,
+                    group_size=args.group_size, resume=not args.fresh)
         node.start()
+        if args.headless:
+            run_headless(node, args)
+            node.stop()
+            return
+        query = None # Última busca com mais páginas (comando more)
 
         # Loop para interação com o usuário
         while True:
@@ -41,6 +161,50 @@ def main():
                     else:
                         print("Não é possível enviar mensagem, ainda não está na rede.")
                 
+                # Comando para enviar a uma sala: post <sala> <msg>
+                elif command.lower().split()[:1] == ["post"]:
+                    parts = command.split(" ", 2)
+                    if len(parts) < 3 or not valid_room(parts[1]):
+                        print("Uso: post <sala> <msg>")
+                    elif not node.id:
+                        print("Não é possível enviar mensagem, ainda não está na rede.")
+                    elif not node.rooms.subscribed(parts[1]):
+                        print(f"Você não está na sala {parts[1]}. Use: join {parts[1]}")
+                    else:
+                        node.send_chat_message(parts[2], room=parts[1])
+
+                # Comandos de inscrição: join <sala> e leave <sala>
+                elif command.lower().split()[:1] in (["join"], ["leave"]):
+                    parts = command.split()
+                    if len(parts) != 2 or not valid_room(parts[1]):
+                        print(f"Uso: {parts[0].lower()} <sala> (letras, dígitos, _ e -, começando com letra)")
+                    elif parts[0].lower() == "join":
+                        print(f"Entrou na sala {parts[1]}." if node.rooms.join(parts[1]) else f"Já está na sala {parts[1]}.")
+                    else:
+                        print(f"Saiu da sala {parts[1]}." if node.rooms.leave(parts[1]) else f"Não está na sala {parts[1]}.")
+
+                # Comando para listar as salas inscritas
+                elif command.lower() == "rooms":
+                    print("Salas inscritas:")
+                    for room in node.rooms.listing():
+                        print(f"  - {room} ({len(node.rooms.members(room))} outros inscritos)")
+
+                # Comandos de busca no histórico: search <termos> e from <usuário>; more mostra a próxima página
+                elif command.lower().split()[:1] in (["search"], ["from"]):
+                    parts = command.split(" ", 1)
+                    if len(parts) < 2 or not parts[1].strip():
+                        print(f"Uso: {parts[0].lower()} {'<termos>' if parts[0].lower() == 'search' else '<usuário>'}")
+                        continue
+                    run = node.search_index.search if parts[0].lower() == "search" else node.search_index.by_user
+                    query = {"run": run, "terms": parts[1].strip(), "offset": 0}
+                    if not print_results(node, query):
+                        query = None
+                elif command.lower() == "more":
+                    if query is None:
+                        print("Nenhuma busca com mais resultados.")
+                    elif not print_results(node, query):
+                        query = None
+
                 # Comando para listar peers
                 elif command.lower() == "peers":
                     if node.id:
@@ -48,12 +212,28 @@ def main():
                     else:
                         print("Não está na rede.")
                 
-                # Comando para ver o histórico
-                elif command.lower() == "history":
+                # Comando para ver as métricas do nó
+                elif command.lower() == "stats":
+                    node.print_stats()
+
+                # Comando para ver o histórico: history [início] [quantidade] ou history <sala> [quantidade]
+                elif command.lower().split()[:1] == ["history"]:
+                    args_history = command.split()[1:]
+                    try:
+                        count = int(args_history[1]) if len(args_history) > 1 else HISTORY_PAGE_SIZE
+                        if args_history and valid_room(args_history[0]):
+                            entries = node.message_log.room_tail(args_history[0], count)
+                        elif args_history:
+                            entries = node.message_log.read(int(args_history[0]), count)
+                        else:
+                            entries = node.message_log.tail(count) # Sem argumentos: as mensagens mais recentes
+                    except ValueError:
+                        print("Uso: history [início] [quantidade] ou history <sala> [quantidade]")
+                        continue
                     print("--- Histórico de Mensagens ---")
-                    for msg in node.message_history:
-                        print(msg)
-                    print("-----------------------")
+                    for entry in entries:
+                        print(f"[{entry['seq']}] {format_entry(entry)}")
+                    print(f"--- {len(entries)} de {len(node.message_log)} mensagens ---")
                 
                 # Comando para sair
                 elif command.lower() == "exit":
@@ -62,7 +242,9 @@ def main():
                     break
                 
                 else:
-                    print("Comando desconhecido. Comandos disponíveis: chat <msg>, peers, history, exit")
+                    print("Comando desconhecido. Comandos disponíveis: chat <msg>, post <sala> <msg>, join <sala>, "
+                          "leave <sala>, rooms, peers, stats, history [início | sala] [quantidade], search <termos>, "
+                          "from <usuário>, more, exit")
             
             except (EOFError, KeyboardInterrupt):
                 print("\nEncerrando...")
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import threading
+from collections import deque
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+class Membership:
+    """Tabela de membros versionada. Cada entrada ou saída aprovada pelo coordenador incrementa a
+    versão e é guardada em um histórico limitado de alterações. Em vez de reenviar a lista completa,
+    o coordenador envia apenas os deltas (agrupando as entradas que chegam em uma janela curta), e os
+    peers comparam versão e digest para detectar divergências e buscar só o que falta.
+    """
+    def __init__(self, node, batch_window=0.05, max_changes=1000):
+        self.node = node  # Referência ao objeto Node principal
+        self.batch_window = batch_window  # Janela (s) para agrupar alterações em um único delta
+        self.version = 0
+        self.changes = deque(maxlen=max_changes)  # Alterações recentes: {"v", "op", "id", "info"}
+        self._flushed_version = 0  # Última versão já anunciada aos peers
+        self._flush_scheduled = False
+        self._requested_version = 0  # Maior versão já pedida ao coordenador via observe_version
+        self._lock = threading.Lock()
+
+    def digest(self):
+        """Resumo da tabela de peers, usado para detectar divergências entre nós com a mesma versão.
+        Cobre o registro completo de cada peer (salas, codecs, recursos), não só o endereço: uma atualização
+        perdida também é detectada. É calculado uma vez por versão da tabela local (vai de carona em toda
+        sonda do coordenador)."""
+        return self.node.peers.view("digest", self._compute_digest)
+
+    @staticmethod
+    def _compute_digest(peers):
+        entries = sorted(peers.items())
+        return hashlib.blake2b(json.dumps(entries, sort_keys=True).encode('utf-8'), digest_size=8).hexdigest()
+
+    def reset(self, version):
+        """Adota a versão de uma tabela completa recebida do coordenador."""
+        with self._lock:
+            self.version = version
+            self._flushed_version = version
+            self.changes.clear()
+
+    def _record(self, op, peer_id, info):
+        with self._lock:
+            self.version += 1
+            self.changes.append({"v": self.version, "op": op, "id": peer_id, "info": info})
+            return self.version
+
+    def record_join(self, peer_id, info):
+        """Registra a entrada de um peer (apenas coordenador) e agenda o anúncio do delta."""
+        self.node._add_peer(peer_id, info)
+        version = self._record("join", peer_id, info)
+        self._schedule_flush()
+        return version
+
+    def record_update(self, peer_id, info):
+        """Registra novos dados de um peer já presente (ex.: inscrições em salas; apenas coordenador).
+        Vai nos deltas como uma entrada repetida, que substitui o registro anterior do peer."""
+        return self.record_join(peer_id, info)
+
+    def record_leave(self, peer_id):
+        """Registra a saída de um peer (apenas coordenador) e agenda o anúncio do delta."""
+        self.node._drop_peer(peer_id)
+        version = self._record("leave", peer_id, None)
+        self._schedule_flush()
+        return version
+
+    def delta_since(self, version):
+        """Retorna as alterações posteriores a `version`, ou None se o histórico já não as contém."""
+        with self._lock:
+            if version >= self.version:
+                return []
+            if not self.changes or self.changes[0]["v"] > version + 1:
+                return None
+            return [c for c in self.changes if c["v"] > version]
+
+    def _schedule_flush(self):
+        with self._lock:
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        self.node.communication.call_later(self.batch_window, self._flush)
+
+    def _flush(self):
+        """Envia aos peers, em uma única mensagem, todas as alterações desde o último anúncio."""
+        with self._lock:
+            self._flush_scheduled = False
+            from_version = self._flushed_version
+            self._flushed_version = self.version
+        changes = self.delta_since(from_version)
+        if not changes:
+            return
+        delta = {
+            "type": "MEMBERSHIP_DELTA",
+            "from_version": from_version,
+            "to_version": changes[-1]["v"],
+            "changes": changes,
+            "digest": self.digest(),
+        }
+        # Peers que entraram no meio do lote ignoram as alterações que já vieram no JOIN_ACK
+        # (no modo hierárquico o delta vai aos líderes, que o repassam aos seus grupos)
+        self.node.broadcast(delta, targets=self.node.hierarchy.downstream(), queued=True)
+        logger.info(f"Nó {self.node.id}: Delta de membros v{from_version}->v{delta['to_version']} "
+                    f"({len(changes)} alterações) enviado.")
+
+    def full_snapshot(self):
+        """Mensagem com a tabela completa, usada quando o delta não está mais disponível."""
+        return {
+            "type": "MEMBERSHIP_DELTA",
+            "full": True,
+            "to_version": self.version,
+            "peers": dict(self.node.peers),
+            "digest": self.digest(),
+        }
+
+    def announce_full(self):
+        """Envia a tabela completa para todos os peers (ex.: ao assumir como novo coordenador)."""
+        with self._lock:
+            self._flushed_version = self.version
+        self.node.broadcast(self.full_snapshot(), targets=self.node.hierarchy.downstream(), queued=True)
+
+    def handle_delta(self, message):
+        """Aplica um MEMBERSHIP_DELTA recebido do coordenador (ou do líder do grupo)."""
+        if message.get("full"):
+            self.node._replace_peers({int(k): v for k, v in message["peers"].items()})
+            self.reset(message["to_version"])
+            logger.info(f"Tabela de membros completa recebida (v{self.version}).")
+            self._relay(message)
+            return
+        if message["from_version"] > self.version:
+            # Alterações intermediárias foram perdidas: pede ao coordenador só o que falta
+            self.request_sync()
+            return
+        applied = 0
+        for change in message["changes"]:
+            if change["v"] <= self.version:
+                continue # Alteração já aplicada (ex.: recebida no JOIN_ACK)
+            if change["op"] == "join":
+                self.node._add_peer(change["id"], change["info"])
+            elif change["id"] != self.node.id:
+                self.node._drop_peer(change["id"])
+            with self._lock:
+                self.version = change["v"]
+                self.changes.append(change)
+            applied += 1
+        logger.info(f"Delta de membros aplicado: {applied} alterações (v{self.version}).")
+        if applied:
+            self._relay(message)
+        if self.version == message["to_version"] and self.digest() != message["digest"]:
+            logger.warning("Tabela de membros divergente após aplicar o delta. Solicitando a tabela completa.")
+            self.request_sync(full=True)
+
+    def _relay(self, message):
+        """No modo hierárquico, um líder de grupo repassa ao grupo as alterações que acabou de aplicar."""
+        if self.node.hierarchy.is_leader() and not self.node.is_coordinator:
+            self.node.broadcast(message, targets=self.node.hierarchy.downstream(), queued=True)
+
+    def check_digest(self, version, digest):
+        """Compara a versão e o digest anunciados pelo coordenador (no heartbeat) com a tabela local."""
+        if version is None:
+            return
+        if version > self.version:
+            self.request_sync()
+        elif version == self.version and digest != self.digest():
+            self.request_sync(full=True)
+
+    def observe_version(self, version):
+        """Trata a versão anunciada por um peer qualquer: se for maior que a local, busca o que falta."""
+        if version is None or version <= self.version:
+            return
+        with self._lock:
+            if version <= self._requested_version:
+                return # Já pedido; aguarda a resposta do coordenador
+            self._requested_version = version
+        self.request_sync()
+
+    def request_sync(self, full=False):
+        """Pede ao coordenador (ou ao líder do grupo) as alterações posteriores à versão local (ou a tabela completa)."""
+        source_id = self.node.hierarchy.upstream_id()
+        source = self.node.peers.get(source_id)
+        if source is None or self.node.is_coordinator or source_id == self.node.id:
+            return
+        request = {
+            "type": "MEMBERSHIP_SYNC",
+            "sender_id": self.node.id,
+            "ip": self.node.host,
+            "port": self.node.port,
+            "version": 0 if full else self.version,
+        }
+        self.node.communication.post_tcp_message(source["ip"], source["port"], request)
+
+    def handle_sync_request(self, message):
+        """Responde a um MEMBERSHIP_SYNC com o delta pedido ou, se não estiver disponível, a tabela completa."""
+        changes = self.delta_since(message["version"]) if message["version"] else None
+        if changes is None:
+            reply = self.full_snapshot()
+        else:
+            reply = {
+                "type": "MEMBERSHIP_DELTA",
+                "from_version": message["version"],
+                "to_version": self.version,
+                "changes": changes,
+                "digest": self.digest(),
+            }
+        self.node.communication.post_tcp_message(message["ip"], message["port"], reply)
@@ -0,0 +1,266 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict, deque
+from rooms import DEFAULT_ROOM
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+# Cada registro do segmento: número de sequência (8 bytes) + tamanho do payload JSON (4 bytes)
+RECORD_HEADER = struct.Struct("!QI")
+# Cada entrada do índice: posição (offset) do registro dentro do segmento
+INDEX_ENTRY = struct.Struct("!Q")
+
+def format_entry(entry):
+    """Formata uma entrada do log para exibição (ex.: 'Ana: olá', 'Ana (You): olá' ou '[jogos] Ana: olá')."""
+    room = entry.get("room") or DEFAULT_ROOM
+    prefix = "" if room == DEFAULT_ROOM else f"[{room}] "
+    if entry.get("own"):
+        return f"{prefix}{entry['username']} (You): {entry['text']}"
+    return f"{prefix}{entry['username']}: {entry['text']}"
+
+class _Segment:
+    """Um segmento do log: arquivo de registros (.log) e índice de offsets (.idx)."""
+    def __init__(self, directory, base_seq):
+        self.base_seq = base_seq
+        self.log_path = os.path.join(directory, f"{base_seq:020d}.log")
+        self.index_path = os.path.join(directory, f"{base_seq:020d}.idx")
+        self.count = 0  # Número de registros no segmento
+
+    def offset_of(self, index_data, seq):
+        return INDEX_ENTRY.unpack_from(index_data, (seq - self.base_seq) * INDEX_ENTRY.size)[0]
+
+class MessageLog:
+    """Log de mensagens de chat em disco, append-only e dividido em segmentos.
+    Cada mensagem recebe um número de sequência crescente. As mensagens recentes ficam em um
+    ring buffer em memória (um geral e um por sala); segmentos antigos (fechados) são lidos via mmap,
+    sem carregar o log inteiro.
+    """
+    SCAN_CHUNK = 1000  # Entradas lidas por vez ao buscar no disco o histórico de uma sala
+    def __init__(self, directory, segment_entries=10000, ring_size=500, max_open_segments=8):
+        self.directory = directory
+        self.segment_entries = segment_entries  # Registros por segmento antes de abrir um novo
+        self.max_open_segments = max_open_segments  # Segmentos fechados mantidos mapeados em memória
+        self.recent = deque(maxlen=ring_size)  # Ring buffer das entradas mais recentes
+        self.recent_rooms = {}  # Sala -> ring buffer das entradas mais recentes da sala
+        self._lock = threading.Lock()
+        self._segments = []
+        self._mapped = OrderedDict()  # base_seq -> (mmap do log, mmap do índice), em ordem LRU
+        os.makedirs(directory, exist_ok=True)
+
+        bases = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith(".log"))
+        for base in bases:
+            segment = _Segment(directory, base)
+            segment.count = os.path.getsize(segment.index_path) // INDEX_ENTRY.size if os.path.exists(segment.index_path) else 0
+            self._segments.append(segment)
+        if self._segments:
+            self._recover(self._segments[-1])
+        else:
+            self._segments.append(_Segment(directory, 1))
+        self._open_active()
+        self.next_seq = self._active.base_seq + self._active.count
+        # Pré-carrega o ring buffer com as últimas entradas do log
+        first = max(1, self.next_seq - self.recent.maxlen)
+        self.recent.extend(self._read_from_disk(first, self.next_seq - first))
+        for entry in self.recent:
+            self._room_ring(entry).append(entry)
+        logger.info(f"Log de mensagens aberto em {directory} ({self.next_seq - 1} mensagens).")
+
+    def _room_ring(self, entry):
+        room = entry.get("room") or DEFAULT_ROOM
+        ring = self.recent_rooms.get(room)
+        if ring is None:
+            ring = self.recent_rooms[room] = deque(maxlen=self.recent.maxlen)
+        return ring
+
+    @property
+    def _active(self):
+        return self._segments[-1]
+
+    @property
+    def last_seq(self):
+        """Número de sequência da última mensagem gravada (0 se o log estiver vazio)."""
+        return self.next_seq - 1
+
+    def __len__(self):
+        return self.next_seq - 1
+
+    def _recover(self, segment):
+        """Reconstrói o índice do segmento ativo e descarta um registro incompleto no final
+        (ex.: processo encerrado no meio de uma escrita)."""
+        offsets = []
+        valid_size = 0
+        if os.path.exists(segment.log_path):
+            with open(segment.log_path, "rb") as f:
+                data = f.read()
+            while valid_size + RECORD_HEADER.size <= len(data):
+                seq, length = RECORD_HEADER.unpack_from(data, valid_size)
+                end = valid_size + RECORD_HEADER.size + length
+                if end > len(data) or seq != segment.base_seq + len(offsets):
+                    break
+                offsets.append(valid_size)
+                valid_size = end
+            if valid_size < len(data):
+                logger.warning(f"Descartando {len(data) - valid_size} bytes incompletos no final de {segment.log_path}.")
+                with open(segment.log_path, "r+b") as f:
+                    f.truncate(valid_size)
+        with open(segment.index_path, "wb") as f:
+            f.write(b"".join(INDEX_ENTRY.pack(offset) for offset in offsets))
+        segment.count = len(offsets)
+
+    def _open_active(self):
+        self._log_file = open(self._active.log_path, "ab")
+        self._index_file = open(self._active.index_path, "ab")
+
+    def _roll(self):
+        """Fecha o segmento ativo e inicia um novo."""
+        self._log_file.close()
+        self._index_file.close()
+        self._segments.append(_Segment(self.directory, self.next_seq))
+        self._open_active()
+
+    def append(self, entry):
+        """Grava uma entrada no final do log e retorna seu número de sequência."""
+        with self._lock:
+            if self._active.count >= self.segment_entries:
+                self._roll()
+            seq = self.next_seq
+            entry = dict(entry, seq=seq)
+            payload = json.dumps(entry).encode('utf-8')
+            offset = self._log_file.tell()
+            self._log_file.write(RECORD_HEADER.pack(seq, len(payload)) + payload)
+            self._log_file.flush()
+            self._index_file.write(INDEX_ENTRY.pack(offset))
+            self._index_file.flush()
+            self._active.count += 1
+            self.next_seq += 1
+            self.recent.append(entry)
+            self._room_ring(entry).append(entry)
+            return seq
+
+    def read(self, start_seq, count):
+        """Retorna até `count` entradas a partir de `start_seq`, sem carregar o log inteiro."""
+        start_seq = max(1, start_seq)
+        count = max(0, min(count, self.next_seq - start_seq))
+        if count == 0:
+            return []
+        recent = list(self.recent)
+        if recent and recent[0]["seq"] <= start_seq:
+            first = start_seq - recent[0]["seq"]
+            return recent[first:first + count]
+        return self._read_from_disk(start_seq, count)
+
+    def tail(self, count):
+        """Retorna as últimas `count` entradas do log."""
+        return self.read(self.next_seq - count, count)
+
+    def room_tail(self, room, count):
+        """Retorna as últimas `count` entradas de uma sala: do ring buffer da sala e, se ele não bastar,
+        lendo o log do disco de trás para frente, em blocos."""
+        recent = list(self.recent_rooms.get(room, ()))
+        if len(recent) >= count:
+            return recent[len(recent) - count:]
+        entries = []
+        end = self.next_seq
+        while end > 1 and len(entries) < count:
+            start = max(1, end - self.SCAN_CHUNK)
+            block = [entry for entry in self.read(start, end - start) if (entry.get("room") or DEFAULT_ROOM) == room]
+            entries = block + entries
+            end = start
+        return entries[max(0, len(entries) - count):]
+
+    def find_seq_by_time(self, ts):
+        """Retorna, por busca binária, a primeira sequência cuja entrada tem timestamp >= ts.
+        As entradas são gravadas em ordem de chegada, então o resultado é aproximado se os relógios divergirem.
+        """
+        lo, hi = 1, self.next_seq
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self.read(mid, 1)
+            if entry and entry[0].get("ts", 0) < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _segment_for(self, seq):
+        """Encontra, por busca binária, o segmento que contém `seq`."""
+        lo, hi = 0, len(self._segments) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self._segments[mid].base_seq <= seq:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def _read_from_disk(self, start_seq, count):
+        entries = []
+        seq = start_seq
+        end_seq = start_seq + count
+        while seq < end_seq:
+            with self._lock:
+                position = self._segment_for(seq)
+                segment = self._segments[position]
+                stop = min(end_seq, segment.base_seq + segment.count)
+                if segment is self._active:
+                    entries.extend(self._read_active(segment, seq, stop))
+                else:
+                    log_data, index_data = self._map(segment)
+                    for s in range(seq, stop):
+                        entries.append(self._decode(log_data, segment.offset_of(index_data, s)))
+            if stop <= seq:
+                break
+            seq = stop
+        return entries
+
+    def _decode(self, data, offset):
+        _, length = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        return json.loads(data[start:start + length])
+
+    def _read_active(self, segment, start_seq, stop_seq):
+        """Lê registros do segmento ativo, que ainda cresce e por isso não é mapeado."""
+        # Lê também o offset do registro seguinte (se existir) para saber onde o intervalo termina
+        extra = 1 if stop_seq < segment.base_seq + segment.count else 0
+        with open(segment.index_path, "rb") as f:
+            f.seek((start_seq - segment.base_seq) * INDEX_ENTRY.size)
+            index_data = f.read((stop_seq - start_seq + extra) * INDEX_ENTRY.size)
+        offsets = [o for (o,) in INDEX_ENTRY.iter_unpack(index_data)]
+        if not offsets:
+            return []
+        with open(segment.log_path, "rb") as f:
+            f.seek(offsets[0])
+            data = f.read(offsets[-1] - offsets[0]) if extra else f.read()
+        if extra:
+            offsets.pop()
+        return [self._decode(data, offset - offsets[0]) for offset in offsets]
+
+    def _map(self, segment):
+        """Retorna os mmaps (log e índice) de um segmento fechado, mantendo um número limitado abertos."""
+        mapped = self._mapped.get(segment.base_seq)
+        if mapped is not None:
+            self._mapped.move_to_end(segment.base_seq)
+            return mapped
+        maps = []
+        for path in (segment.log_path, segment.index_path):
+            with open(path, "rb") as f:
+                maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        self._mapped[segment.base_seq] = tuple(maps)
+        if len(self._mapped) > self.max_open_segments:
+            _, (log_map, index_map) = self._mapped.popitem(last=False)
+            log_map.close()
+            index_map.close()
+        return self._mapped[segment.base_seq]
+
+    def close(self):
+        with self._lock:
+            self._log_file.close()
+            self._index_file.close()
+            for log_map, index_map in self._mapped.values():
+                log_map.close()
+                index_map.close()
+            self._mapped.clear()
@@ -0,0 +1,215 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+# Limites (s) dos buckets dos histogramas de latência: de 100 µs a 10 s
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+class Counter:
+    """Contador monotônico, com um valor por combinação de rótulos."""
+    kind = "counter"
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._values = {}  # tupla de rótulos -> valor
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+class Histogram:
+    """Histograma com buckets fixos: registrar uma observação custa uma busca binária e três somas."""
+    kind = "histogram"
+
+    def __init__(self, name, description, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}  # tupla de rótulos -> [contagens por bucket (+Inf no fim), soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[labels] = entry
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def summary(self, labels=()):
+        """Total, média e percentis aproximados (limite superior do bucket) de uma série."""
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                return None
+            counts, total, count = list(entry[0]), entry[1], entry[2]
+        return {"count": count, "mean": total / count, "p50": self._quantile(counts, count, 0.5),
+                "p99": self._quantile(counts, count, 0.99)}
+
+    def _quantile(self, counts, count, fraction):
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= fraction * count:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def label_sets(self):
+        with self._lock:
+            return list(self._values)
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(entry[0]), entry[1], entry[2]) for labels, entry in self._values.items()]
+        samples = []
+        for labels, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((self.name + "_bucket", labels + (_format_bound(bound),), cumulative))
+            samples.append((self.name + "_sum", labels, total))
+            samples.append((self.name + "_count", labels, count))
+        return samples
+
+class Gauge:
+    """Valor instantâneo lido sob demanda, por uma função, no momento da consulta (sem custo no caminho quente)."""
+    kind = "gauge"
+
+    def __init__(self, name, description, read):
+        self.name = name
+        self.description = description
+        self.labelnames = ()
+        self.read = read
+
+    def samples(self):
+        value = self.read()
+        return [] if value is None else [(self.name, (), value)]
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    pairs = (f'{name}="{value}"' for name, value in zip(names, escaped))
+    return "{" + ",".join(pairs) + "}"
+
+class Metrics:
+    """Registro das métricas de um nó. Cada nó tem o seu (vários nós podem rodar no mesmo processo)."""
+    def __init__(self, prefix="chat"):
+        self.prefix = prefix
+        self._metrics = {}  # nome -> métrica, na ordem de registro
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, description, labelnames=()):
+        return self._register(Counter(f"{self.prefix}_{name}", description, labelnames))
+
+    def histogram(self, name, description, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(f"{self.prefix}_{name}", description, labelnames, buckets))
+
+    def gauge(self, name, description, read):
+        return self._register(Gauge(f"{self.prefix}_{name}", description, read))
+
+    def get(self, name):
+        return self._metrics.get(f"{self.prefix}_{name}")
+
+    def render_prometheus(self):
+        """Todas as métricas no formato de texto do Prometheus."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            names = metric.labelnames + (("le",) if metric.kind == "histogram" else ())
+            for sample_name, labels, value in metric.samples():
+                sample_names = names if sample_name.endswith("_bucket") else metric.labelnames
+                lines.append(f"{sample_name}{_format_labels(sample_names, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def totals(self):
+        """Soma de cada contador e valor de cada gauge, sem rótulos (para o comando stats)."""
+        totals = {}
+        for metric in list(self._metrics.values()):
+            if metric.kind != "histogram":
+                totals[metric.name] = sum(value for _, _, value in metric.samples())
+        return totals
+
+class CommunicationMetrics:
+    """Métricas da camada de rede, compartilhadas pelos dois backends de comunicação."""
+    def __init__(self, metrics):
+        self.messages_sent = metrics.counter("messages_sent_total", "Mensagens entregues à camada de rede para envio, por tipo", ("type",))
+        self.bytes_sent = metrics.counter("bytes_sent_total", "Bytes enviados, por tipo de mensagem", ("type",))
+        self.messages_received = metrics.counter("messages_received_total", "Mensagens recebidas, por tipo", ("type",))
+        self.bytes_received = metrics.counter("bytes_received_total", "Bytes recebidos, por tipo de mensagem", ("type",))
+        self.send_failures = metrics.counter("send_failures_total", "Falhas de envio TCP, por peer", ("peer",))
+        self.connect_latency = metrics.histogram("connect_seconds", "Tempo para abrir uma conexão TCP")
+
+    def sent(self, msg_type, nbytes, count=1):
+        self.messages_sent.inc(msg_type, amount=count)
+        self.bytes_sent.inc(msg_type, amount=nbytes * count)
+
+    def received(self, msg_type, nbytes):
+        self.messages_received.inc(msg_type)
+        self.bytes_received.inc(msg_type, amount=nbytes)
+
+    def send_failed(self, ip, port):
+        self.send_failures.inc(f"{ip}:{port}")
+
+    def timed_connect(self, connect):
+        """Envolve uma função de conexão, registrando a latência das conexões bem-sucedidas."""
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            sock = connect(*args, **kwargs)
+            self.connect_latency.observe(time.perf_counter() - started)
+            return sock
+        return timed
+
+class MetricsServer:
+    """Endpoint HTTP local (GET /metrics) com as métricas do nó no formato do Prometheus."""
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        metrics_ref = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics_ref.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Sem log a cada consulta
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address[:2]
+        logger.info(f"Métricas disponíveis em http://{host}:{port}/metrics")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
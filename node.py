@@ -1,141 +1,355 @@
+import os
 import socket
 import threading
 import time
 import random
+import uuid
 from communication import Communication
-from election import Election
+from async_communication import AsyncCommunication
+from election import ELECTION_STRATEGIES
+from failure_detector import PhiAccrualDetector, RttEstimator, Swim
+from catchup import CatchUp
+from codec import PEER_LISTS, SUPPORTED_CODECS
+from dispatcher import Dispatcher
+from membership import Membership
+from peer_table import PeerTable
+from gossip import Gossip, MessageIdCache
+from hierarchy import Hierarchy
+from reliable_multicast import MULTICAST_FEATURE, ReliableMulticast
+from rooms import DEFAULT_ROOM, Rooms
+from message_log import MessageLog, format_entry
+from node_state import NodeState
+from search_index import SearchIndex
+from metrics import Metrics, MetricsServer
 from utils import get_logger
 
 logger = get_logger(__name__)
 
+# Backends de comunicação disponíveis, selecionáveis na inicialização
+BACKENDS = {
+    "threads": Communication,       # Uma thread por conexão e por timer
+    "asyncio": AsyncCommunication,  # Um único loop de eventos e um pool limitado de handlers
+}
+
+HEARTBEAT_INTERVAL = 5 # Intervalo (s) dos heartbeats do coordenador no modo "heartbeat"
+JOIN_RETRY_INITIAL = 0.1 # Espera (s) antes da primeira retransmissão do JOIN_REQUEST
+JOIN_RETRY_MAX = 1.0     # Espera máxima (s) entre retransmissões
+
 class Node:
     """Representa um nó na rede de chat distribuído. Atua como cliente e servidor (P2P)."""
-    def __init__(self, host, port, username):
+    def __init__(self, host, port, username, backend="threads", dissemination="direct", queue_policy="drop_oldest",
+                 data_dir=None, failure_detector="swim", join_timeout=5.0,
+                 election="bully", transport=None, metrics_port=None, rooms=None,
+                 group_size=None, resume=True):
         self.host = host
         self.port = port
         self.username = username # Nome de usuário do nó
         self.id = None # ID único atribuído pelo coordenador
-        self.peers = {} # Dicionário de peers conhecidos (ID -> {ip, port, username})
+        # Peers conhecidos (ID -> {ip, port, username}): tabela imutável, trocada a cada alteração,
+        # para que envios em paralelo iterem sobre uma versão estável sem lock
+        self.peers = PeerTable()
+        self._peers_lock = threading.Lock() # Serializa apenas as alterações da tabela
+        # Serializa a escolha e o registro do ID dos novos nós (JOIN_REQUESTs tratados em paralelo pelo dispatcher)
+        self._join_lock = threading.Lock()
         self.coordinator_id = None
         self.is_coordinator = False
-        self.message_history = []
+        self.join_timeout = join_timeout # Tempo máximo (s) esperando um coordenador antes de assumir a rede
+        self.joined = threading.Event() # Sinalizado quando o JOIN_ACK chega
+        self.join_latency = None # Tempo (s) entre o início da entrada na rede e o ID atribuído
+        # Diretório de dados do nó (histórico em disco); por padrão, um por endereço
+        self.data_dir = data_dir or os.path.join("data", f"{host}_{port}")
+        self.message_log = MessageLog(os.path.join(self.data_dir, "history"))
+        # Índice invertido do histórico (termos e usuários), salvo ao lado do log
+        self.search_index = SearchIndex(os.path.join(self.data_dir, "index"), self.message_log)
         self.stop_event = threading.Event()
+        # Métricas do nó (comando stats e, opcionalmente, endpoint HTTP no formato do Prometheus)
+        self.metrics = Metrics()
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.handler_latency = self.metrics.histogram("handler_seconds", "Tempo de processamento das mensagens recebidas, por tipo",
+                                                      ("type",))
+        self.heartbeats_sent = self.metrics.counter("heartbeats_sent_total", "Heartbeats enviados pelo coordenador")
+        self.heartbeats_received = self.metrics.counter("heartbeats_received_total", "Heartbeats recebidos do coordenador")
         # Inicializa o módulo de comunicação, passando os handlers de mensagem
-        self.communication = Communication(self.host, self.port, self.handle_tcp_message, self.handle_udp_message)
-        self.election = Election(self) # Inicializa o módulo de eleição
-        self.last_heartbeat_time = time.time() # Timestamp do último heartbeat recebido
+        # (transport=None usa a rede real; simulações passam um transporte em memória)
+        self.communication = BACKENDS[backend](self.host, self.port, self.handle_tcp_message, self.handle_udp_message,
+                                               queue_policy=queue_policy, transport=transport, metrics=self.metrics)
+        # Inicializa o módulo de eleição: "bully" (clássico) ou "fast" (Bully modificado, maior ID primeiro)
+        self.election = ELECTION_STRATEGIES[election](self)
+        # Modo hierárquico: grupos de `group_size` nós com um líder cada (None: rede plana)
+        self.hierarchy = Hierarchy(self, group_size, election)
+        # Modo de disseminação do chat: "direct" (envio para todos), "gossip" (epidêmico) ou "multicast" (UDP confiável)
+        self.dissemination = dissemination
+        self.gossip = Gossip(self)
+        self.multicast = ReliableMulticast(self)
+        self.rooms = Rooms(self, rooms) # Salas de chat em que o nó está inscrito
+        self.load_stats = None # Estatísticas das mensagens de carga recebidas (modo headless de main.py)
+        self.seen_messages = MessageIdCache() # IDs de mensagens de chat já entregues (supressão de duplicatas)
+        for entry in self.message_log.recent:
+            self.seen_messages.add(entry.get("msg_id"))
+        self.catchup = CatchUp(self) # Sincronização incremental do histórico
+        self.membership = Membership(self) # Versão da tabela de peers e deltas de entradas/saídas
+        # Snapshot do estado na rede, para reiniciar com o mesmo ID (resume=False entra como um nó novo)
+        self.node_state = NodeState(self)
+        self.resume = resume
+        # Detecção de falhas: "swim" (sondas aleatórias entre os peers) ou "heartbeat" (coordenador envia para todos)
+        self.failure_detector = failure_detector
+        self.rtt = RttEstimator() # RTT observado por peer, para timeouts adaptativos
+        self.swim = Swim(self, self.rtt)
+        # Suspeita (phi-accrual) sobre o coordenador, alimentada pelos sinais de vida dele
+        # (com SWIM o contador de vida do coordenador chega por disseminação, com atraso de alguns períodos)
+        expected_interval = 2 * Swim.PERIOD if failure_detector == "swim" else HEARTBEAT_INTERVAL
+        self.coordinator_detector = PhiAccrualDetector(expected_interval)
+        # Tabela de handlers das mensagens recebidas, processadas em um pool fixo de workers
+        self.dispatcher = Dispatcher(self, {
+            # Entrada na rede e lista de peers
+            "JOIN_REQUEST": self.handle_join_request,
+            "JOIN_ACK": self.handle_join_ack,
+            "NEW_PEER": self.handle_new_peer,
+            "PEER_LIST": self.handle_peer_list,
+            "NODE_LEAVE": self.handle_node_leave,
+            "CHAT_MESSAGE": self.handle_chat_message,
+            "ROOM_SUBSCRIPTION": self.rooms.handle_subscription,
+            # Mensagens de eleição
+            "ELECTION": self.election.handle_election_message,
+            "ANSWER": self.election.handle_answer_message,
+            "COORDINATOR": self.election.handle_coordinator_message,
+            # Detecção de falhas: heartbeats e SWIM
+            "HEARTBEAT": self.handle_heartbeat,
+            "PING": self.swim.handle_ping,
+            "PING_REQ": self.swim.handle_ping_req,
+            "ACK": self.swim.handle_ack,
+            # Tabela de membros versionada
+            "MEMBERSHIP_DELTA": self.membership.handle_delta,
+            "MEMBERSHIP_SYNC": self.handle_membership_sync,
+            # Sincronização do histórico
+            "CATCHUP_REQUEST": self.catchup.handle_request,
+            "CATCHUP_CHUNK": self.catchup.handle_chunk,
+            # Reparo do canal multicast de chat
+            "MCAST_NACK": self.multicast.handle_nack,
+            "MCAST_GAP": self.multicast.handle_gap,
+            "MCAST_START": self.multicast.handle_start,
+        })
+        if self.hierarchy.enabled:
+            self.dispatcher.handlers.update({
+                # Grupos do modo hierárquico: entradas admitidas pelos líderes, falhas e eleição do líder
+                "JOIN_RECORD": self.hierarchy.handle_join_record,
+                "MEMBER_FAILED": self.hierarchy.handle_member_failed,
+                "GROUP_ELECTION": self.hierarchy.election.handle_election_message,
+                "GROUP_ANSWER": self.hierarchy.election.handle_answer_message,
+                "GROUP_LEADER": self.hierarchy.election.handle_coordinator_message,
+            })
+        self.metrics.gauge("peers", "Peers conhecidos (incluindo o próprio nó)", lambda: len(self.peers))
+        self.metrics.gauge("is_coordinator", "1 se este nó é o coordenador", lambda: int(self.is_coordinator))
+        self.metrics.gauge("membership_version", "Versão da tabela de membros", lambda: self.membership.version)
+        self.metrics.gauge("coordinator_phi", "Suspeita (phi) sobre o coordenador atual",
+                           lambda: None if self.is_coordinator else round(self.coordinator_detector.phi(), 3))
+        self.metrics.gauge("history_messages", "Mensagens no histórico em disco", lambda: len(self.message_log))
 
     def start(self):
         """Inicia o nó, a comunicação e os processos de monitoramento."""
+        self.dispatcher.start()
         self.communication.start()
+        if self.metrics_port is not None:
+            self.metrics_server = MetricsServer(self.metrics, self.metrics_port)
+            self.metrics_server.start()
         logger.info(f"Nó iniciado em {self.host}:{self.port}")
+        if self.dissemination == "multicast" and not self.multicast.start():
+            self.dissemination = "direct"
         self.join_network()
-        # Inicia o monitoramento do coordenador em uma thread separada
-        threading.Thread(target=self.monitor_coordinator, daemon=True).start()
-        # Se for o coordenador inicial, começa a enviar heartbeats
-        if self.is_coordinator:
-            threading.Thread(target=self.send_heartbeats, daemon=True).start()
+        # Detecção de falhas e monitoramento do coordenador rodam como tarefas periódicas do backend
+        if self.failure_detector == "swim":
+            self.communication.run_periodic(Swim.PERIOD, self.swim.tick)
+        else:
+            self.communication.run_periodic(HEARTBEAT_INTERVAL, self.send_heartbeats) # Só envia enquanto for o coordenador
+            # Se for o coordenador inicial, começa a enviar heartbeats imediatamente
+            if self.is_coordinator:
+                self.communication.call_later(0, self.send_heartbeats)
+        self.coordinator_detector.reset() # O monitoramento começa agora, após a entrada na rede
+        self.communication.run_periodic(1, self.monitor_coordinator)
+        self.communication.run_periodic(2, self.catchup.check_progress)
+        self.communication.run_periodic(Rooms.REGISTRATION_RETRY, self.rooms.check_registration)
+        self.communication.run_periodic(NodeState.SAVE_INTERVAL, self.node_state.save)
 
     def stop(self):
         """Encerra o nó e os módulos de comunicação."""
         self.stop_event.set()
+        self.node_state.save()
+        self.dispatcher.stop()
         self.communication.stop()
+        self.catchup.stop()
+        self.search_index.close()
+        self.message_log.close()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
         logger.info("Nó encerrado.")
 
-    def join_network(self):
-        """Tenta entrar na rede enviando uma requisição multicast."""
-        join_message = {
+    def join_request(self):
+        """Mensagem JOIN_REQUEST deste nó."""
+        return {
             "type": "JOIN_REQUEST",
             "sender_ip": self.host,
             "sender_port": self.port,
-            "username": self.username # Inclui o nome de usuário na requisição de entrada
+            "username": self.username, # Inclui o nome de usuário na requisição de entrada
+            "codecs": SUPPORTED_CODECS, # Formatos de mensagem que este nó entende
+            "rooms": self.rooms.listing(), # Salas de chat em que o nó está inscrito
+            "features": self.features(),
         }
-        self.communication.send_udp_multicast(join_message)
-        logger.info("Enviado JOIN_REQUEST via multicast.")
 
-        # Espera por uma resposta. Se não houver, assume que é o primeiro nó e se torna coordenador.
-        time.sleep(5)
-        if self.id is None:
+    def features(self):
+        """Recursos opcionais deste nó, anunciados na tabela de membros como os codecs. "multicast": o nó
+        recebe o chat pelo canal multicast (os demais só recebem o chat enviado por TCP)."""
+        return [MULTICAST_FEATURE] if self.dissemination == "multicast" else []
+
+    def join_network(self):
+        """Tenta entrar na rede enviando uma requisição multicast."""
+        join_message = self.join_request()
+        resumed = self.node_state.load() if self.resume else None
+        if resumed is not None:
+            # Reinício: pede de volta o ID anterior e só as alterações da tabela posteriores à versão salva
+            join_message.update(id=resumed["id"], version=resumed["version"])
+        started = time.time()
+        if resumed is not None and self.node_state.contact(join_message):
+            self.joined.wait(NodeState.RESUME_TIMEOUT) # Sem resposta: segue pelo multicast
+        deadline = started + self.join_timeout
+        delay = JOIN_RETRY_INITIAL
+        attempts = 0
+        # Retransmite com backoff exponencial e jitter (um datagrama perdido não deve dividir a rede)
+        # e retorna assim que o JOIN_ACK chegar, sem esperar o prazo inteiro
+        while not self.joined.is_set() and time.time() < deadline:
+            self.communication.send_udp_multicast(join_message)
+            attempts += 1
+            logger.info(f"Enviado JOIN_REQUEST via multicast (tentativa {attempts}).")
+            self.joined.wait(max(0, min(delay * random.uniform(0.5, 1.5), deadline - time.time())))
+            delay = min(delay * 2, JOIN_RETRY_MAX)
+
+        # Se não houver resposta, assume que é o primeiro nó e se torna coordenador.
+        if not self.joined.is_set():
             logger.info("Nenhum coordenador encontrado. Tornando-se o primeiro nó e coordenador.")
-            self.id = 1
+            self.id = self.hierarchy.first_id()
             self.is_coordinator = True
             self.coordinator_id = self.id
             # Adiciona a si mesmo à lista de peers
-            self.peers[self.id] = {"ip": self.host, "port": self.port, "username": self.username}
+            self._add_peer(self.id, {"ip": self.host, "port": self.port, "username": self.username,
+                                     "codecs": SUPPORTED_CODECS, "rooms": self.rooms.listing(),
+                                     "features": self.features()})
+            self.joined.set()
+        self.join_latency = time.time() - started
+        logger.info(f"Nó {self.id}: Entrada na rede concluída em {self.join_latency * 1000:.0f} ms "
+                    f"({attempts} JOIN_REQUEST enviados).")
 
     def handle_tcp_message(self, message, addr):
-        """Processa mensagens recebidas via TCP (ponto a ponto)."""
-        msg_type = message.get("type")
-        logger.debug(f"Mensagem TCP recebida do tipo {msg_type} de {addr}")
-        if msg_type == "JOIN_ACK":
-            self.handle_join_ack(message)
-        elif msg_type == "NEW_PEER":
-            self.handle_new_peer(message)
-        elif msg_type == "PEER_LIST":
-            self.handle_peer_list(message)
-        elif msg_type == "CHAT_MESSAGE":
-            self.handle_chat_message(message)
-        # Mensagens de eleição
-        elif msg_type == "ELECTION":
-            self.election.handle_election_message(message)
-        elif msg_type == "ANSWER":
-            self.election.handle_answer_message(message)
-        elif msg_type == "COORDINATOR":
-            self.election.handle_coordinator_message(message)
-        # Heartbeat
-        elif msg_type == "HEARTBEAT":
-            self.last_heartbeat_time = time.time()
-            logger.debug(f"Heartbeat recebido do coordenador {self.coordinator_id}")
-        elif msg_type == "NODE_LEAVE":
-            self.handle_node_leave(message)
+        """Processa mensagens recebidas via TCP (ponto a ponto): o dispatcher as entrega ao handler
+        do seu tipo (a ordem de chegada é mantida por conexão)."""
+        logger.debug(f"Mensagem TCP recebida do tipo {message.get('type')} de {addr}")
+        self.dispatcher.submit(message, addr)
 
     def handle_udp_message(self, message, addr):
         """Processa mensagens recebidas via UDP multicast (descoberta)."""
         msg_type = message.get("type")
         # Apenas o coordenador responde a requisições de entrada
         if msg_type == "JOIN_REQUEST" and self.is_coordinator:
-            self.handle_join_request(message)
+            self.dispatcher.submit(message, addr)
+
+    def handle_heartbeat(self, message):
+        """Trata um heartbeat do coordenador (modo "heartbeat")."""
+        self.heartbeats_received.inc()
+        self.coordinator_detector.heartbeat()
+        logger.debug(f"Heartbeat recebido do coordenador {self.coordinator_id}")
+        # O heartbeat anuncia a versão da tabela de membros do coordenador
+        self.membership.check_digest(message.get("version"), message.get("digest"))
+
+    def handle_membership_sync(self, message):
+        """Responde a um pedido de sincronização da tabela de membros (coordenador ou líder de grupo)."""
+        if self.is_coordinator or self.hierarchy.is_leader():
+            self.membership.handle_sync_request(message)
 
     def handle_join_request(self, message):
-        """Trata a requisição de entrada de um novo nó (apenas coordenador)."""
-        if not self.is_coordinator:
+        """Trata a requisição de entrada de um novo nó (coordenador ou, no modo hierárquico, o líder
+        do grupo para o qual o coordenador a encaminhou)."""
+        if not self.is_coordinator and not (message.get("forwarded") and self.hierarchy.is_leader()):
+            if "id" in message and not message.get("forwarded"):
+                self.node_state.relay(message) # Nó reiniciado que não sabe quem é o coordenador atual
             return
-        new_peer_ip = message["sender_ip"]
-        new_peer_port = message["sender_port"]
-        new_peer_username = message["username"] # Obtém o nome de usuário do novo nó
-        new_peer_id = max(self.peers.keys()) + 1 # Atribui o próximo ID disponível
-        # Adiciona o novo peer à lista
-        self.peers[new_peer_id] = {"ip": new_peer_ip, "port": new_peer_port, "username": new_peer_username}
-        logger.info(f"Novo peer {new_peer_id} ({new_peer_username}) em {new_peer_ip}:{new_peer_port} entrou.")
-
-        # Envia JOIN_ACK para o novo peer com seu ID e a lista completa de peers
+        # Da escolha do ID ao registro, um pedido por vez: entradas simultâneas não recebem o mesmo ID
+        with self._join_lock:
+            # Nó reiniciado pedindo o ID anterior: o coordenador o devolve, se possível, sem encaminhar a um líder
+            resumed_id = self.node_state.resumable_id(message) if self.is_coordinator else None
+            if self.is_coordinator and resumed_id is None and self.hierarchy.enabled and not message.get("forwarded") \
+                    and self.hierarchy.route_join(message):
+                return # Encaminhada ao líder do grupo escolhido
+            new_peer_ip = message["sender_ip"]
+            new_peer_port = message["sender_port"]
+            new_peer_username = message["username"] # Obtém o nome de usuário do novo nó
+            new_peer_info = {"ip": new_peer_ip, "port": new_peer_port, "username": new_peer_username}
+            self._reconnect(new_peer_ip, new_peer_port, message.get("codecs"))
+            # Divulgados aos demais peers com a tabela de membros
+            for field in PEER_LISTS:
+                if field in message:
+                    new_peer_info[field] = message[field]
+            # Retransmissões do JOIN_REQUEST pelo mesmo endereço recebem o mesmo ID
+            existing_id = resumed_id or next((pid for pid, pinfo in self.peers.items()
+                                              if pinfo["ip"] == new_peer_ip and pinfo["port"] == new_peer_port), None)
+            admitted_id = self.hierarchy.admitted_id((new_peer_ip, new_peer_port)) # Admitido por este líder, ainda sem registro
+            if admitted_id is not None or (existing_id is not None and self.peers.get(existing_id) == new_peer_info):
+                new_peer_id = admitted_id or existing_id
+                version = self.membership.version
+                logger.debug(f"JOIN_REQUEST repetido do peer {new_peer_id}. Reenviando JOIN_ACK.")
+            else:
+                new_peer_id = existing_id or self.hierarchy.assign_id((new_peer_ip, new_peer_port)) # Próximo ID disponível
+                if new_peer_id is None:
+                    logger.warning(f"Bloco de IDs do grupo cheio. JOIN_REQUEST de {new_peer_ip}:{new_peer_port} ignorado.")
+                    return
+                # Adiciona o novo peer à lista; os outros peers recebem a entrada em um delta agrupado
+                version = self.hierarchy.record_join(new_peer_id, new_peer_info)
+                if resumed_id is not None:
+                    logger.info(f"Peer {new_peer_id} ({new_peer_username}) em {new_peer_ip}:{new_peer_port} voltou com o ID anterior.")
+                else:
+                    logger.info(f"Novo peer {new_peer_id} ({new_peer_username}) em {new_peer_ip}:{new_peer_port} entrou.")
+
+        # Envia JOIN_ACK para o novo peer com seu ID e a lista completa (versionada) de peers
         join_ack_message = {
             "type": "JOIN_ACK",
             "id": new_peer_id,
-            "coordinator_id": self.id,
-            "peers": self.peers
-        }
-        self.communication.send_tcp_message(new_peer_ip, new_peer_port, join_ack_message)
-
-        # Informa outros peers sobre o novo peer
-        new_peer_message = {
-            "type": "NEW_PEER",
-            "id": new_peer_id,
-            "ip": new_peer_ip,
-            "port": new_peer_port,
-            "username": new_peer_username # Inclui o nome de usuário na mensagem de novo peer
+            "coordinator_id": self.coordinator_id,
         }
-        for pid, pinfo in self.peers.items():
-            if pid != new_peer_id and pid != self.id:
-                self.communication.send_tcp_message(pinfo["ip"], pinfo["port"], new_peer_message)
+        since = message.get("version") if resumed_id is not None else None
+        changes = self.membership.delta_since(since) if isinstance(since, int) and since <= self.membership.version else None
+        if changes is not None:
+            # Nó reiniciado: já tem a tabela do snapshot e recebe só as alterações posteriores a ela
+            join_ack_message.update(from_version=since, to_version=changes[-1]["v"] if changes else since,
+                                    changes=changes, digest=self.membership.digest())
+        else:
+            peers = dict(self.peers)
+            peers[new_peer_id] = new_peer_info # Admitido por um líder: ainda não está na tabela
+            join_ack_message.update(peers=peers, version=version)
+        # Pela fila de saída: o worker de controle não espera a conexão com o novo nó
+        self.communication.post_tcp_message(new_peer_ip, new_peer_port, join_ack_message)
 
     def handle_join_ack(self, message):
         """Trata a confirmação de entrada na rede (JOIN_ACK)."""
+        if self.joined.is_set():
+            return # Resposta a um JOIN_REQUEST retransmitido
         self.id = message["id"]
         self.coordinator_id = message["coordinator_id"]
-        # Atualiza a lista de peers com a lista completa enviada pelo coordenador
-        self.peers = {int(k): v for k, v in message["peers"].items()}
+        if "changes" in message:
+            # Reinício: parte da tabela do snapshot e aplica as alterações posteriores a ela
+            self._replace_peers(self.node_state.resumed["peers"])
+            self.membership.reset(message["from_version"])
+            self.membership.handle_delta({"type": "MEMBERSHIP_DELTA", "from_version": message["from_version"],
+                                          "to_version": message["to_version"], "changes": message["changes"],
+                                          "digest": message["digest"]})
+        else:
+            # Atualiza a lista de peers com a lista completa enviada pelo coordenador
+            self._replace_peers({int(k): v for k, v in message["peers"].items()})
+            self.membership.reset(message.get("version", 0))
+        if self.node_state.resumed is not None and self.id == self.node_state.resumed["id"]:
+            self.swim.restore(self.node_state.resumed.get("incarnation", 0))
+        self.coordinator_detector.reset()
         logger.info(f"Entrou na rede com ID {self.id}. Coordenador é {self.coordinator_id}")
+        self.joined.set() # Libera join_network imediatamente
+        # Busca no coordenador apenas as mensagens que faltam no histórico local
+        self.catchup.start(self.coordinator_id)
 
     def handle_new_peer(self, message):
         """Trata a notificação de um novo peer na rede."""
@@ -143,103 +357,241 @@ class Node:
         peer_ip = message["ip"]
         peer_port = message["port"]
         peer_username = message["username"] # Obtém o nome de usuário do novo peer
-        self.peers[peer_id] = {"ip": peer_ip, "port": peer_port, "username": peer_username}
+        peer_info = {"ip": peer_ip, "port": peer_port, "username": peer_username}
+        for field in PEER_LISTS:
+            if field in message:
+                peer_info[field] = message[field]
+        self._add_peer(peer_id, peer_info)
         logger.info(f"Novo peer {peer_id} ({peer_username}) adicionado à lista.")
 
     def handle_peer_list(self, message):
         """Trata a atualização completa da lista de peers."""
-        self.peers = {int(k): v for k, v in message["peers"].items()}
+        self._replace_peers({int(k): v for k, v in message["peers"].items()})
         logger.info("Lista de peers atualizada.")
 
     def handle_chat_message(self, message):
         """Trata uma mensagem de chat recebida."""
-        sender_username = message["username"] # Usa o nome de usuário para exibição
-        chat_text = message["text"]
-        display_message = f"{sender_username}: {chat_text}"
-        self.message_history.append(display_message)
-        print(f"\n{display_message}")
-
-    def send_chat_message(self, text):
-        """Envia uma mensagem de chat para todos os peers."""
+        msg_id = message.get("msg_id")
+        if msg_id is not None:
+            if not self.seen_messages.add(msg_id):
+                return # Duplicata (ex.: recebida por outro caminho do gossip)
+            if "ttl" in message:
+                self.gossip.relay(message)
+        if not self.rooms.subscribed(message.get("room", DEFAULT_ROOM)):
+            return # Sala sem inscrição (multicast: o datagrama chega a todo o grupo)
+        if self.load_stats is not None:
+            self.load_stats.observe(message)
+        self.record_chat(message)
+        print(f"\n{format_entry(message)}")
+
+    def record_chat(self, message, own=False):
+        """Grava uma mensagem de chat no log de histórico em disco, indexa-a para a busca e retorna
+        seu número de sequência."""
+        entry = {
+            "ts": message.get("ts", time.time()),
+            "msg_id": message.get("msg_id"),
+            "sender_id": message.get("sender_id"),
+            "username": message["username"],
+            "text": message["text"],
+            "room": message.get("room", DEFAULT_ROOM),
+            "own": own # Mensagem enviada por este nó
+        }
+        seq = self.message_log.append(entry)
+        self.search_index.add(seq, entry)
+        return seq
+
+    @property
+    def message_history(self):
+        """Mensagens recentes do histórico, já formatadas para exibição."""
+        return [format_entry(entry) for entry in self.message_log.recent]
+
+    def send_chat_message(self, text, room=DEFAULT_ROOM):
+        """Envia uma mensagem de chat para os peers inscritos na sala."""
         message = {
             "type": "CHAT_MESSAGE",
+            "msg_id": uuid.uuid4().hex, # Identificador único, usado para suprimir duplicatas
             "sender_id": self.id,
             "username": self.username, # Inclui o nome de usuário na mensagem de chat
-            "text": text
+            "text": text,
+            "room": room,
+            "ts": time.time() # Momento do envio
         }
-        self.message_history.append(f"{self.username} (You): {text}")
-        # Envia a mensagem para todos os peers, exceto para si mesmo
-        for pid, pinfo in self.peers.items():
-            if pid != self.id:
-                self.communication.send_tcp_message(pinfo["ip"], pinfo["port"], message)
+        self.seen_messages.add(message["msg_id"])
+        self.record_chat(message, own=True)
+        if self.dissemination == "gossip":
+            # Envia para um subconjunto aleatório dos inscritos, que repassam a mensagem
+            self.gossip.publish(message)
+        elif self.dissemination == "multicast":
+            # Um datagrama para o grupo; lacunas são reparadas pelos receptores com NACKs
+            self.multicast.publish(message)
+        else:
+            # Enfileira a mensagem para os inscritos na sala, exceto para si mesmo
+            self.broadcast(message, targets=self.rooms.members(room), queued=True)
+
+    def broadcast(self, message, exclude=(), targets=None, queued=False):
+        """Envia uma mensagem em paralelo para os peers (todos, exceto o próprio nó, por padrão).
+        Retorna um dicionário ID -> True/False com o resultado de cada envio. Com queued=True a
+        mensagem vai para as filas de saída dos peers e o resultado indica apenas se foi enfileirada.
+        """
+        if targets is None:
+            targets = self.peers.others(self.id) # Visão calculada uma vez por versão da tabela
+        elif self.id in targets:
+            targets = {pid: pinfo for pid, pinfo in targets.items() if pid != self.id}
+        if exclude:
+            targets = {pid: pinfo for pid, pinfo in targets.items() if pid not in exclude}
+        if queued:
+            return self.communication.post_broadcast(targets, message)
+        return self.communication.broadcast(targets, message)
 
     def set_coordinator(self, coordinator_id):
         """Define o novo coordenador da rede."""
         self.coordinator_id = coordinator_id
         self.is_coordinator = (self.id == coordinator_id)
+        self.coordinator_detector.reset()
         if self.is_coordinator:
             logger.info("Eu sou o novo coordenador.")
-            # Se for o novo coordenador, inicia o envio de heartbeats
-            threading.Thread(target=self.send_heartbeats, daemon=True).start()
+            # Reenvia a tabela de membros para que todos partam da mesma versão
+            self.communication.call_later(0, self.membership.announce_full)
+            if self.failure_detector == "heartbeat":
+                # Se for o novo coordenador, envia heartbeats imediatamente; a tarefa periódica continua o envio
+                self.communication.call_later(0, self.send_heartbeats)
         else:
             logger.info(f"Novo coordenador é {coordinator_id}")
 
     def send_heartbeats(self):
-        """Envia heartbeats periodicamente para monitorar a saúde dos peers (apenas coordenador)."""
-        while self.is_coordinator and not self.stop_event.is_set():
-            heartbeat_message = {"type": "HEARTBEAT", "sender_id": self.id}
-            peers_to_remove = []
-            # Tenta enviar heartbeat para todos os peers
-            for pid, pinfo in self.peers.items():
-                if pid != self.id:
-                    if not self.communication.send_tcp_message(pinfo["ip"], pinfo["port"], heartbeat_message):
-                        logger.warning(f"Peer {pid} não está respondendo. Marcando para remoção.")
-                        peers_to_remove.append(pid)
-            
-            # Remove os peers que falharam
-            if peers_to_remove:
-                for pid in peers_to_remove:
-                    self.remove_peer(pid)
-
-            time.sleep(5) # Envia heartbeat a cada 5 segundos
+        """Envia uma rodada de heartbeats para monitorar a saúde dos peers (coordenador e, no modo
+        hierárquico, os líderes de grupo, cada um para o seu grupo)."""
+        if not (self.is_coordinator or self.hierarchy.is_leader()) or self.stop_event.is_set():
+            return
+        heartbeat_message = {
+            "type": "HEARTBEAT",
+            "sender_id": self.id,
+            # Versão e digest da tabela de membros, para os peers detectarem divergências
+            "version": self.membership.version,
+            "digest": self.membership.digest()
+        }
+        # Envia o heartbeat para todos os peers (ou líderes e grupo) em paralelo
+        results = self.broadcast(heartbeat_message, targets=self.hierarchy.downstream())
+        self.heartbeats_sent.inc(amount=len(results))
+        peers_to_remove = [pid for pid, delivered in results.items() if not delivered]
+        for pid in peers_to_remove:
+            logger.warning(f"Peer {pid} não está respondendo. Marcando para remoção.")
+
+        # Remove os peers que falharam (um líder de grupo informa ao coordenador)
+        for pid in peers_to_remove:
+            if self.is_coordinator:
+                self.remove_peer(pid)
+            else:
+                self.hierarchy.report_failure(pid)
 
     def monitor_coordinator(self):
-        """Monitora o heartbeat do coordenador atual (apenas peers)."""
-        while not self.stop_event.is_set():
-            if not self.is_coordinator and self.coordinator_id is not None:
-                # Se o tempo desde o último heartbeat for maior que 15 segundos (3x o intervalo de envio)
-                if time.time() - self.last_heartbeat_time > 15:
-                    logger.warning(f"Coordenador {self.coordinator_id} falhou. Iniciando eleição.")
-                    # Remove o coordenador falho da lista de peers
-                    self.remove_peer(self.coordinator_id)
-                    # Inicia o algoritmo de eleição
-                    self.election.start_election()
-                    self.last_heartbeat_time = time.time() # Reseta o timer para evitar re-eleição imediata
-            time.sleep(5)
+        """Verifica os sinais de vida do coordenador atual (apenas peers). Executado a cada segundo.
+        O limite não é fixo: o detector phi-accrual se adapta aos intervalos observados."""
+        if self.is_coordinator or self.coordinator_id is None:
+            return
+        phi = self.coordinator_detector.phi()
+        if phi < self.coordinator_detector.threshold:
+            return
+        self.coordinator_detector.reset() # Evita disparar de novo enquanto a falha é tratada
+        if self.failure_detector == "heartbeat" and self.hierarchy.upstream_id() != self.coordinator_id:
+            # No modo hierárquico os heartbeats vêm do líder do grupo
+            self.hierarchy.handle_leader_failure()
+        elif self.failure_detector == "swim" and self.coordinator_id in self.peers:
+            # Confirma com uma sonda (direta e indireta) antes de declarar a falha
+            logger.warning(f"Coordenador {self.coordinator_id} sem sinais de vida (phi={phi:.1f}). Sondando.")
+            self.swim.probe(self.coordinator_id, on_failure=self.swim.confirm_failed)
+        else:
+            self.handle_coordinator_failure()
+
+    def handle_coordinator_failure(self):
+        """Remove o coordenador que falhou e inicia uma eleição."""
+        logger.warning(f"Coordenador {self.coordinator_id} falhou. Iniciando eleição.")
+        # Remove o coordenador falho da lista de peers
+        self.remove_peer(self.coordinator_id)
+        # Inicia o algoritmo de eleição
+        self.election.start_election()
+        self.coordinator_detector.reset() # Reseta o detector para evitar re-eleição imediata
 
     def remove_peer(self, peer_id):
         """Remove um peer da lista e notifica a rede (apenas coordenador)."""
         if peer_id in self.peers:
-            del self.peers[peer_id]
-            logger.info(f"Peer {peer_id} removido.")
             if self.is_coordinator:
-                # Anuncia a saída do nó para os peers restantes
-                leave_message = {"type": "NODE_LEAVE", "id": peer_id}
-                for pid, pinfo in self.peers.items():
-                    if pid != self.id:
-                        self.communication.send_tcp_message(pinfo["ip"], pinfo["port"], leave_message)
+                # A saída entra no próximo delta da tabela de membros enviado aos peers restantes
+                self.membership.record_leave(peer_id)
+            else:
+                self._drop_peer(peer_id)
+            logger.info(f"Peer {peer_id} removido.")
 
     def handle_node_leave(self, message):
         """Trata a notificação de saída de um nó."""
         peer_id = message["id"]
-        if peer_id in self.peers:
-            del self.peers[peer_id]
+        if self._drop_peer(peer_id):
             logger.info(f"Peer {peer_id} saiu da rede.")
 
+    def _add_peer(self, peer_id, info):
+        """Adiciona ou atualiza um peer na tabela local."""
+        with self._peers_lock:
+            old = self.peers.get(peer_id)
+            if old == info:
+                return
+            self.peers = self.peers.with_peer(peer_id, info)
+        self.communication.set_peer_codecs(info["ip"], info["port"], info.get("codecs"))
+        if old is None or (old["ip"], old["port"]) != (info["ip"], info["port"]):
+            self.swim.forget(peer_id) # O ID pode ter sido reatribuído a um novo nó
+        if old is None:
+            self.multicast.peer_joined(peer_id)
+
+    def _reconnect(self, ip, port, codecs):
+        """Descarta as conexões com um endereço de onde veio um JOIN_REQUEST: é um processo novo (ex.: nó
+        reiniciado), e as conexões com o anterior estão mortas. O formato das mensagens é renegociado."""
+        self.communication.close_peer(ip, port)
+        self.communication.set_peer_codecs(ip, port, codecs)
+
+    def _drop_peer(self, peer_id):
+        """Remove um peer da tabela local e fecha suas conexões. Retorna False se ele não existia."""
+        with self._peers_lock:
+            pinfo = self.peers.get(peer_id)
+            if pinfo is None:
+                return False
+            self.peers = self.peers.without(peer_id)
+        self.communication.close_peer(pinfo["ip"], pinfo["port"])
+        self.hierarchy.peer_removed(peer_id)
+        return True
+
+    def _replace_peers(self, peers):
+        """Substitui a tabela local pela tabela completa recebida do coordenador."""
+        with self._peers_lock:
+            old = self.peers
+            self.peers = old.replaced(peers)
+        for peer_id in set(old) - set(peers):
+            pinfo = old[peer_id]
+            self.communication.close_peer(pinfo["ip"], pinfo["port"])
+            self.hierarchy.peer_removed(peer_id)
+        for pinfo in peers.values():
+            self.communication.set_peer_codecs(pinfo["ip"], pinfo["port"], pinfo.get("codecs"))
+        for peer_id in set(peers) - set(old):
+            self.swim.forget(peer_id) # Estado de uma encarnação anterior do peer (ex.: declarado falho antes de reiniciar)
+            self.multicast.peer_joined(peer_id)
+
     def print_peers(self):
         """Imprime a lista de peers conectados."""
         print("Peers conectados:")
         for pid, pinfo in self.peers.items():
             print(f"  - ID: {pid}, Usuário: {pinfo['username']}, Endereço: {pinfo['ip']}:{pinfo['port']}")
 
+    def print_stats(self):
+        """Imprime um resumo das métricas do nó: totais e latências dos handlers por tipo de mensagem."""
+        print("Estatísticas do nó:")
+        prefix = self.metrics.prefix + "_"
+        for name, value in self.metrics.totals().items():
+            print(f"  {name[len(prefix):]}: {value:g}")
+        print("Latência dos handlers (ms):")
+        for labels in sorted(self.handler_latency.label_sets(), key=str):
+            summary = self.handler_latency.summary(labels)
+            print(f"  {labels[0]}: {summary['count']} mensagens, média {summary['mean'] * 1000:.2f}, "
+                  f"p50 <= {summary['p50'] * 1000:g}, p99 <= {summary['p99'] * 1000:g}")
+        summary = self.metrics.get("election_seconds").summary()
+        if summary:
+            print(f"Eleições: {summary['count']}, duração média {summary['mean'] * 1000:.0f} ms")
+
 # O bloco if __name__ == '__main__': foi removido para ser tratado em main.py
@@ -0,0 +1,146 @@
+import json
+import os
+import time
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+class NodeState:
+    """Snapshot do estado do nó na rede (ID, coordenador, tabela de membros e sua versão, encarnação
+    do SWIM), salvo periodicamente no diretório de dados. Quando o processo reinicia, o nó parte dele:
+    envia o JOIN_REQUEST direto ao coordenador que conhecia (um peer que não é mais o coordenador o
+    repassa ao atual) pedindo de volta o ID anterior, e recebe no JOIN_ACK apenas as alterações da
+    tabela posteriores à versão salva. O histórico já retoma do cursor da sincronização (catchup.json).
+    Sem resposta, a entrada segue pelo multicast, ainda pedindo o ID anterior. Um coordenador reiniciado
+    cujo pedido volta para ele mesmo (os peers ainda o têm como coordenador) reassume a coordenação.
+    """
+    SAVE_INTERVAL = 2.0   # Intervalo (s) entre salvamentos (só grava se algo mudou)
+    RESUME_TIMEOUT = 0.5  # Espera (s) pelo JOIN_ACK do coordenador conhecido antes de recorrer ao multicast
+    REANNOUNCE_DELAY = 0.5     # Espera (s) para o coordenador registrar a remoção antes de pedir a volta à tabela
+    REANNOUNCE_INTERVAL = 2.0  # Intervalo mínimo (s) entre dois pedidos de volta
+
+    def __init__(self, node):
+        self.node = node  # Referência ao objeto Node principal
+        self.path = os.path.join(node.data_dir, "state.json")
+        self.resumed = None  # Snapshot carregado no reinício
+        self._written = None  # Conteúdo do último salvamento
+        self._reannounced_at = 0.0
+
+    def load(self):
+        """Carrega o snapshot salvo. Retorna None se não houver um snapshot válido."""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            state["peers"] = {int(pid): pinfo for pid, pinfo in state["peers"].items()}
+            if state["id"] not in state["peers"]:
+                raise ValueError("o próprio nó não está na tabela")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Snapshot do nó em {self.path} descartado ({e}).")
+            return None
+        self.resumed = state
+        logger.info(f"Snapshot encontrado: ID {state['id']}, coordenador {state['coordinator_id']}, "
+                    f"tabela de membros v{state['version']} ({len(state['peers'])} peers).")
+        return state
+
+    def save(self):
+        """Grava o snapshot (arquivo temporário e troca atômica), se o estado mudou desde o último salvamento."""
+        node = self.node
+        if node.id is None or not node.joined.is_set():
+            return
+        state = {
+            "id": node.id,
+            "coordinator_id": node.coordinator_id,
+            "version": node.membership.version,
+            "peers": dict(node.peers),
+            "incarnation": node.swim.incarnation,
+        }
+        data = json.dumps(state)
+        if data == self._written:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        self._written = data
+
+    def contact(self, join_message):
+        """Envia o JOIN_REQUEST por TCP ao coordenador do snapshot (ou, se o coordenador era este nó, ao
+        peer conhecido de maior ID, que o repassa ao coordenador atual). Retorna False se não há a quem enviar."""
+        state = self.resumed
+        others = sorted((pid for pid in state["peers"] if pid != state["id"]), reverse=True)
+        if not others:
+            return False
+        target = state["coordinator_id"] if state["coordinator_id"] in others else others[0]
+        pinfo = state["peers"][target]
+        logger.info(f"Enviando JOIN_REQUEST de reinício ao nó {target} (ID anterior {state['id']}).")
+        return self.node.communication.post_tcp_message(pinfo["ip"], pinfo["port"], join_message)
+
+    def relay(self, message):
+        """Repassa ao coordenador o JOIN_REQUEST de um nó reiniciado recebido por um peer comum (uma vez só:
+        se o coordenador tiver mudado de novo, o nó recorre ao multicast)."""
+        node = self.node
+        if (message["sender_ip"], message["sender_port"]) == (node.host, node.port):
+            # O próprio pedido, repassado por um peer que ainda tem este nó como coordenador: a queda não foi notada
+            self.resume_coordinator()
+            return
+        node._reconnect(message["sender_ip"], message["sender_port"], message.get("codecs"))
+        coordinator = node.peers.get(node.coordinator_id)
+        if message.get("relayed") or coordinator is None:
+            return
+        node.communication.post_tcp_message(coordinator["ip"], coordinator["port"], dict(message, relayed=True))
+
+    def resume_coordinator(self):
+        """Reinício do coordenador antes que os peers notassem a queda: retoma o ID, a tabela e a versão do
+        snapshot e reassume a coordenação, reenviando a tabela completa a todos."""
+        node = self.node
+        state = self.resumed
+        if node.joined.is_set() or state is None or state["coordinator_id"] != state["id"]:
+            return
+        node.id = state["id"]
+        node._replace_peers(state["peers"])
+        node.membership.reset(state["version"])
+        node.swim.restore(state.get("incarnation", 0))
+        logger.info(f"Nó {node.id}: A rede ainda me tem como coordenador. Retomando a tabela de membros v{state['version']}.")
+        node.set_coordinator(node.id)
+        node.joined.set() # Libera join_network imediatamente
+
+    def reannounce(self):
+        """Pede ao coordenador a volta à tabela com o mesmo ID, depois de o nó ser declarado falho por outro
+        peer (ex.: reiniciado no meio de uma suspeita, que expirou antes de ser refutada)."""
+        now = time.time()
+        if now - self._reannounced_at < self.REANNOUNCE_INTERVAL:
+            return
+        self._reannounced_at = now
+        self.node.communication.call_later(self.REANNOUNCE_DELAY, self._reannounce)
+
+    def _reannounce(self):
+        node = self.node
+        coordinator = node.peers.get(node.coordinator_id)
+        if node.is_coordinator or coordinator is None or node.stop_event.is_set():
+            return
+        message = dict(node.join_request(), id=node.id, version=node.membership.version)
+        node.communication.post_tcp_message(coordinator["ip"], coordinator["port"], message)
+        logger.info(f"Nó {node.id}: Pedindo ao coordenador a volta à tabela de membros com o mesmo ID.")
+
+    def resumable_id(self, message):
+        """ID anterior pedido por um nó reiniciado, se ainda puder ser devolvido a ele (apenas coordenador):
+        ainda registrado com o mesmo endereço ou livre. No modo hierárquico, um ID livre precisa estar abaixo
+        do líder do bloco, sem entradas em andamento no grupo. None: o nó entra como um nó novo."""
+        peer_id = message.get("id")
+        if not isinstance(peer_id, int) or peer_id < 1:
+            return None
+        address = (message["sender_ip"], message["sender_port"])
+        holder = self.node.peers.get(peer_id)
+        if holder is not None:
+            return peer_id if (holder["ip"], holder["port"]) == address else None
+        if any((pinfo["ip"], pinfo["port"]) == address for pinfo in self.node.peers.values()):
+            return None # O endereço voltou com outro ID
+        hierarchy = self.node.hierarchy
+        if hierarchy.enabled:
+            group = hierarchy.group_of(peer_id)
+            leader = hierarchy.leader_of(group)
+            if (leader is not None and peer_id > leader) or hierarchy.admitting(group):
+                return None
+        return peer_id
@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import deque
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+# Mensagens de volume (chat e blocos de histórico) vão para a faixa de baixa prioridade; todo o resto é controle
+BULK_TYPES = {"CHAT_MESSAGE", "CATCHUP_CHUNK"}
+
+# Políticas para quando a fila de um peer está cheia
+QUEUE_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+FLUSH_INTERVAL = 0.002          # Janela (s) para agrupar mensagens de chat em uma única escrita
+MAX_BATCH_BYTES = 64 * 1024     # Tamanho máximo de uma escrita agrupada
+
+class PeerOutbox:
+    """Fila de saída de um peer, com uma faixa de controle e uma de volume.
+    A faixa de controle (HEARTBEAT, ELECTION, ANSWER, COORDINATOR, NODE_LEAVE...) é sempre
+    esvaziada antes da faixa de chat. Cada faixa tem profundidade limitada.
+    """
+    def __init__(self, max_depth=1000, policy="drop_oldest", block_timeout=1.0):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"política de fila desconhecida: {policy}")
+        self.max_depth = max_depth
+        self.policy = policy
+        self.block_timeout = block_timeout  # Espera máxima da política "block"
+        self.control = deque()
+        self.bulk = deque()
+        self.dropped = 0  # Mensagens descartadas por fila cheia
+        self.size = 0     # Total de bytes enfileirados
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def put(self, frame, control, can_block=True):
+        """Enfileira um frame. Retorna False se ele foi descartado."""
+        lane = self.control if control else self.bulk
+        with self.condition:
+            if len(lane) >= self.max_depth:
+                if self.policy == "block" and can_block:
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(lane) >= self.max_depth and not self.closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self.condition.wait(remaining):
+                            break
+                if len(lane) >= self.max_depth:
+                    self.dropped += 1
+                    if self.policy != "drop_oldest":
+                        return False
+                    self.size -= len(lane.popleft()) # Descarta a mensagem mais antiga para abrir espaço
+            if self.closed:
+                return False
+            lane.append(frame)
+            self.size += len(frame)
+            self.condition.notify_all()
+            return True
+
+    def has_control(self):
+        return bool(self.control)
+
+    def __len__(self):
+        return len(self.control) + len(self.bulk)
+
+    def drain(self, max_bytes):
+        """Retira frames (controle primeiro) até somar max_bytes. Sempre retira ao menos um frame."""
+        frames = []
+        size = 0
+        with self.condition:
+            for lane in (self.control, self.bulk):
+                while lane and (not frames or size + len(lane[0]) <= max_bytes):
+                    frame = lane.popleft()
+                    frames.append(frame)
+                    size += len(frame)
+            self.size -= size
+            self.condition.notify_all() # Libera produtores bloqueados pela política "block"
+        return frames
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.control.clear()
+            self.bulk.clear()
+            self.size = 0
+            self.condition.notify_all()
+
+class OutboundQueues:
+    """Filas de saída por peer, cada uma com uma thread de escrita que agrupa as mensagens
+    pendentes em uma única escrita. O agrupamento espera até flush_interval por mais mensagens,
+    a menos que haja mensagens de controle ou o lote já tenha atingido max_batch_bytes.
+    """
+    def __init__(self, write, flush_interval=FLUSH_INTERVAL, max_batch_bytes=MAX_BATCH_BYTES,
+                 max_depth=1000, policy="drop_oldest", idle_exit=30.0):
+        self.write = write  # Função (ip, port, data) que envia os bytes e levanta exceção em caso de falha
+        self.flush_interval = flush_interval
+        self.max_batch_bytes = max_batch_bytes
+        self.max_depth = max_depth
+        self.policy = policy
+        self.idle_exit = idle_exit  # A thread de escrita termina após esse tempo sem mensagens
+        self._outboxes = {}  # (ip, port) -> PeerOutbox
+        self._writers = {}   # (ip, port) -> thread de escrita
+        self._lock = threading.Lock()
+
+    def post(self, ip, port, frame, msg_type):
+        """Enfileira um frame para o peer. Retorna False se a fila estava cheia e o frame foi descartado."""
+        key = (ip, port)
+        with self._lock:
+            outbox = self._outboxes.get(key)
+            if outbox is None:
+                outbox = PeerOutbox(self.max_depth, self.policy)
+                self._outboxes[key] = outbox
+        accepted = outbox.put(frame, control=msg_type not in BULK_TYPES)
+        if not accepted:
+            logger.warning(f"Fila de saída para {ip}:{port} cheia. Mensagem {msg_type} descartada.")
+        # A thread de escrita é (re)criada depois do put, para não perder um frame se ela terminar por ociosidade
+        with self._lock:
+            if key not in self._writers and self._outboxes.get(key) is outbox:
+                writer = threading.Thread(target=self._write_loop, args=(key, outbox), daemon=True)
+                self._writers[key] = writer
+                writer.start()
+        return accepted
+
+    def _write_loop(self, key, outbox):
+        """Thread de escrita de um peer: agrupa os frames pendentes e os envia em uma única escrita."""
+        while True:
+            with outbox.condition:
+                if not outbox.condition.wait_for(lambda: len(outbox) or outbox.closed, timeout=self.idle_exit):
+                    with self._lock:
+                        # Encerra por ociosidade, a menos que um frame tenha chegado nesse meio tempo
+                        if not len(outbox) and self._writers.get(key) is threading.current_thread():
+                            del self._writers[key]
+                            return
+                    continue
+                if outbox.closed:
+                    return
+            if not outbox.has_control() and outbox.size < self.max_batch_bytes:
+                time.sleep(self.flush_interval) # Janela curta para agrupar mais mensagens de chat
+            frames = outbox.drain(self.max_batch_bytes)
+            try:
+                self.write(key[0], key[1], b"".join(frames))
+            except Exception as e:
+                logger.warning(f"Falha ao enviar {len(frames)} mensagens enfileiradas para {key[0]}:{key[1]}: {e}")
+
+    def close_peer(self, ip, port):
+        """Descarta a fila de um peer que saiu da rede."""
+        with self._lock:
+            outbox = self._outboxes.pop((ip, port), None)
+            self._writers.pop((ip, port), None)
+        if outbox is not None:
+            outbox.close()
+
+    def close_all(self):
+        with self._lock:
+            outboxes = list(self._outboxes.values())
+            self._outboxes.clear()
+            self._writers.clear()
+        for outbox in outboxes:
+            outbox.close()
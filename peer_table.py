@@ -0,0 +1,67 @@
+from collections.abc import Mapping
+from types import MappingProxyType
+
+class PeerTable(Mapping):
+    """Tabela de peers imutável (ID -> {ip, port, username}), com uma versão local.
+    Alterações criam uma nova tabela, que o nó troca atomicamente pela anterior; quem está
+    iterando continua com a versão antiga, estável, sem precisar de lock. As visões derivadas
+    (peers exceto o próprio nó, peers de ID maior...) são calculadas uma vez por versão.
+    """
+    __slots__ = ("_peers", "version", "_views")
+
+    def __init__(self, peers=None, version=0):
+        self._peers = dict(peers or {})
+        self.version = version  # Incrementada a cada alteração local (não é a versão da tabela de membros)
+        self._views = {}  # chave -> visão já calculada para esta versão
+
+    def __getitem__(self, peer_id):
+        return self._peers[peer_id]
+
+    def __iter__(self):
+        return iter(self._peers)
+
+    def __len__(self):
+        return len(self._peers)
+
+    def __repr__(self):
+        return f"PeerTable(v{self.version}, {self._peers})"
+
+    def with_peer(self, peer_id, info):
+        """Nova tabela com o peer adicionado ou atualizado (a própria tabela, se nada mudar)."""
+        if self._peers.get(peer_id) == info:
+            return self
+        peers = dict(self._peers)
+        peers[peer_id] = info
+        return PeerTable(peers, self.version + 1)
+
+    def without(self, peer_id):
+        """Nova tabela sem o peer (a própria tabela, se ele não existir)."""
+        if peer_id not in self._peers:
+            return self
+        peers = dict(self._peers)
+        del peers[peer_id]
+        return PeerTable(peers, self.version + 1)
+
+    def replaced(self, peers):
+        """Nova tabela com o conteúdo de `peers` (ex.: tabela completa recebida do coordenador)."""
+        return PeerTable(peers, self.version + 1)
+
+    def view(self, key, compute):
+        """Retorna a visão `key`, calculando-a com `compute(tabela)` na primeira consulta desta versão."""
+        try:
+            return self._views[key]
+        except KeyError:
+            value = compute(self)
+            self._views[key] = value # Cálculos concorrentes produzem o mesmo valor: basta o último
+            return value
+
+    def others(self, self_id):
+        """Peers exceto o próprio nó (somente leitura: a mesma visão é compartilhada por todos os leitores)."""
+        return self.view(("others", self_id), lambda table: MappingProxyType(
+            {pid: pinfo for pid, pinfo in table._peers.items() if pid != self_id}))
+
+    def higher(self, self_id):
+        """Peers com ID maior que `self_id`, do maior para o menor (candidatos de uma eleição)."""
+        return self.view(("higher", self_id), lambda table: MappingProxyType({
+            pid: table._peers[pid] for pid in sorted(table._peers, reverse=True) if self_id is not None and pid > self_id
+        }))
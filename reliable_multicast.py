@@ -0,0 +1,281 @@
+import random
+import struct
+import threading
+import time
+from collections import OrderedDict
+from communication import CHAT_MULTICAST_PORT
+from codec import decode_message, encode_message, negotiate
+from rooms import DEFAULT_ROOM
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+# Cabeçalho dos datagramas: magic, tipo, ID do remetente, época, sequência, índice do fragmento, total de fragmentos
+HEADER = struct.Struct("!2sBIIIHH")
+MAGIC = b"RM"
+KIND_DATA = 1    # Fragmento de uma mensagem de chat
+KIND_STATUS = 2  # Última sequência enviada (permite detectar a perda das últimas mensagens)
+MULTICAST_FEATURE = "multicast"  # Recurso anunciado na tabela de membros pelos nós que recebem o canal
+
+class ReliableMulticast:
+    """Canal de chat confiável sobre UDP multicast: um datagrama por mensagem (ou por fragmento)
+    substitui os N-1 envios TCP. Cada remetente numera suas mensagens; os receptores entregam em
+    ordem por remetente, detectam lacunas e pedem a retransmissão (NACK, via TCP) ao remetente, que
+    guarda as últimas mensagens em um buffer limitado e as reenvia por multicast. Mensagens que já
+    saíram do buffer são informadas ao receptor (MCAST_GAP), que segue adiante.
+    """
+    FRAGMENT_SIZE = 1400       # Bytes de payload por datagrama (cabe em um quadro Ethernet)
+    RETRANSMIT_BUFFER = 1024   # Mensagens guardadas pelo remetente para retransmissão
+    REPAIR_INTERVAL = 0.1      # Período (s) da verificação de lacunas e dos NACKs
+    NACK_RETRY = 0.3           # Espera (s) antes de repetir o NACK de uma mesma sequência
+    REPAIR_HOLDOFF = 0.05      # Uma sequência não é reenviada de novo dentro desse intervalo (NACKs de vários receptores)
+    STATUS_INTERVAL = 1.0      # Período (s) do anúncio da última sequência enviada
+    STATUS_DURATION = 10.0     # Por quanto tempo (s) após o último envio o anúncio continua
+    MAX_NACK = 256             # Sequências por NACK
+    MAX_PENDING = 4096         # Mensagens fora de ordem guardadas por remetente
+    IDLE_SENDER = 60.0         # Estado de remetentes que saíram da rede é descartado após esse tempo (s)
+    FRAGMENT_TTL = 5.0         # Fragmentos de uma mensagem incompleta são descartados após esse tempo (s); o NACK a pede de novo
+
+    def __init__(self, node, port=CHAT_MULTICAST_PORT):
+        self.node = node  # Referência ao objeto Node principal
+        self.port = port
+        self.epoch = random.getrandbits(32)  # Identifica esta execução: um remetente reiniciado recomeça a numeração
+        self.seq = 0  # Última sequência enviada
+        self.sent = OrderedDict()  # seq -> datagramas, para retransmissão
+        self._repaired = {}  # seq -> momento do último reenvio
+        self._last_send = 0.0
+        self._last_status = 0.0
+        self.senders = {}  # ID do remetente -> estado de recepção
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.events = node.metrics.counter("multicast_events_total", "Eventos do canal multicast de chat", ("event",))
+
+    def start(self):
+        """Abre o canal multicast. Retorna False se o multicast não estiver disponível."""
+        try:
+            self.node.communication.open_multicast_channel(self.port, self.handle_datagram)
+        except OSError as e:
+            logger.warning(f"Multicast indisponível ({e}). O chat usará envios TCP diretos.")
+            return False
+        self.node.communication.run_periodic(self.REPAIR_INTERVAL, self.tick)
+        return True
+
+    # --- Envio ---
+
+    def publish(self, message):
+        """Envia uma mensagem de chat para o grupo. Se algum inscrito da sala não recebe o canal (outro modo de
+        disseminação ou multicast indisponível nele), ou se o envio multicast falhar, usa TCP."""
+        targets = self.node.rooms.members(message.get("room", DEFAULT_ROOM))
+        if not all(MULTICAST_FEATURE in (pinfo.get("features") or ()) for pinfo in targets.values()):
+            self.events.inc("direct")
+            self.node.broadcast(message, targets=targets, queued=True)
+            return
+        payload = encode_message(message, self.node.peers.view("multicast_codec", self._group_codec))
+        fragments = [payload[i:i + self.FRAGMENT_SIZE] for i in range(0, len(payload), self.FRAGMENT_SIZE)] or [b""]
+        if len(fragments) > 0xFFFF:
+            raise ValueError("mensagem grande demais para o canal multicast")
+        with self._send_lock:
+            self.seq += 1
+            datagrams = [HEADER.pack(MAGIC, KIND_DATA, self.node.id, self.epoch, self.seq, index, len(fragments)) + fragment
+                         for index, fragment in enumerate(fragments)]
+            self.sent[self.seq] = datagrams
+            if len(self.sent) > self.RETRANSMIT_BUFFER:
+                evicted, _ = self.sent.popitem(last=False)
+                self._repaired.pop(evicted, None)
+            self._last_send = time.time()
+            delivered = all([self.node.communication.send_multicast_datagram(d, self.port) for d in datagrams])
+        if len(datagrams) > 1:
+            self.events.inc("fragmented")
+        if not delivered:
+            # O multicast falhou neste envio: os peers recebem a mensagem por TCP (duplicatas são descartadas pelo msg_id)
+            self.events.inc("tcp_fallback")
+            self.node.broadcast(message, queued=True)
+
+    @staticmethod
+    def _group_codec(peers):
+        """Codec das mensagens do grupo: binário só se todos os peers o entenderem."""
+        return "binary" if all(negotiate(pinfo.get("codecs")) == "binary" for pinfo in peers.values()) else "json"
+
+    def _send_status(self):
+        datagram = HEADER.pack(MAGIC, KIND_STATUS, self.node.id, self.epoch, self.seq, 0, 0)
+        self.node.communication.send_multicast_datagram(datagram, self.port)
+
+    def handle_nack(self, message):
+        """Reenvia por multicast as mensagens pedidas; se alguma já saiu do buffer, informa com MCAST_GAP."""
+        if message["epoch"] != self.epoch:
+            return # NACK para uma execução anterior deste nó: o receptor se ajusta ao receber a época atual
+        if not self._retransmit(message["missing"]):
+            return
+        requester = self.node.peers.get(message["sender_id"])
+        if requester is None:
+            return
+        with self._send_lock:
+            first_available = next(iter(self.sent), self.seq + 1)
+        self.node.communication.post_tcp_message(requester["ip"], requester["port"], {
+            "type": "MCAST_GAP",
+            "sender_id": self.node.id,
+            "epoch": self.epoch,
+            "next_seq": first_available,
+        })
+
+    def _retransmit(self, missing):
+        """Reenvia as sequências ainda no buffer. Retorna True se alguma delas já não estiver disponível."""
+        now = time.time()
+        unavailable = False
+        with self._send_lock:
+            for seq in missing:
+                datagrams = self.sent.get(seq)
+                if datagrams is None:
+                    unavailable = True
+                    continue
+                if now - self._repaired.get(seq, 0) < self.REPAIR_HOLDOFF:
+                    continue # Já reenviada a pedido de outro receptor
+                self._repaired[seq] = now
+                for datagram in datagrams:
+                    self.node.communication.send_multicast_datagram(datagram, self.port)
+                self.events.inc("retransmitted")
+        return unavailable
+
+    def peer_joined(self, peer_id):
+        """Informa a um novo peer a partir de qual sequência ele deve receber as mensagens deste nó
+        (as anteriores ele obtém pelo histórico). Sem isso, a perda dos primeiros datagramas passaria despercebida."""
+        if self.node.dissemination != "multicast" or peer_id == self.node.id:
+            return
+        peer = self.node.peers.get(peer_id)
+        if peer is None:
+            return
+        with self._send_lock:
+            next_seq = self.seq + 1
+        self.node.communication.post_tcp_message(peer["ip"], peer["port"], {
+            "type": "MCAST_START",
+            "sender_id": self.node.id,
+            "epoch": self.epoch,
+            "next_seq": next_seq,
+        })
+
+    # --- Recepção ---
+
+    def handle_start(self, message):
+        """Registra o ponto de partida do fluxo de um remetente; lacunas a partir dele são pedidas por NACK."""
+        with self._lock:
+            state = self.senders.get(message["sender_id"])
+            if state is None or state["epoch"] != message["epoch"]:
+                self.senders[message["sender_id"]] = self._new_state(message["epoch"], message["next_seq"])
+            elif message["next_seq"] < state["next"]:
+                # Datagramas perdidos antes do primeiro recebido: as retransmissões já entregues são descartadas pelo msg_id
+                state["next"] = message["next_seq"]
+
+    def handle_datagram(self, data, addr):
+        """Trata um datagrama do canal: fragmento de mensagem ou anúncio da última sequência de um remetente."""
+        if len(data) < HEADER.size or data[:2] != MAGIC:
+            return
+        _, kind, sender_id, epoch, seq, index, count = HEADER.unpack_from(data)
+        if sender_id == self.node.id:
+            return # O próprio envio, recebido de volta pelo grupo
+        if kind == KIND_DATA and index >= count:
+            self.events.inc("invalid")
+            return # Cabeçalho inconsistente (datagrama corrompido)
+        with self._lock:
+            state = self.senders.get(sender_id)
+            if state is None or state["epoch"] != epoch:
+                # Primeiro datagrama deste remetente (ou ele reiniciou): as mensagens anteriores vêm pelo histórico
+                state = self._new_state(epoch, seq if kind == KIND_DATA else seq + 1)
+                self.senders[sender_id] = state
+            state["last_seen"] = time.time()
+            state["highest"] = max(state["highest"], seq)
+            if kind != KIND_DATA or seq < state["next"] or seq in state["pending"]:
+                return # Anúncio de status ou duplicata
+            message = self._reassemble(state, sender_id, seq, index, count, data[HEADER.size:])
+            if message is None or len(state["pending"]) >= self.MAX_PENDING:
+                return
+            state["pending"][seq] = message
+            state["nacked"].pop(seq, None)
+            self._deliver_ready(state)
+
+    def _new_state(self, epoch, next_seq):
+        return {"epoch": epoch, "next": next_seq, "highest": next_seq - 1,
+                "pending": {}, "fragments": {}, "nacked": {}, "last_seen": time.time()}
+
+    def _reassemble(self, state, sender_id, seq, index, count, fragment):
+        """Guarda um fragmento; retorna a mensagem completa quando todos os fragmentos chegarem.
+        Uma mensagem que não pode ser decodificada (datagrama truncado ou corrompido) é descartada:
+        a sequência continua faltando e é pedida de novo por NACK."""
+        if count == 1:
+            payload = fragment
+        else:
+            pending = state["fragments"].setdefault(seq, {"count": count, "parts": {}, "at": time.time()})
+            if pending["count"] != count:
+                self.events.inc("invalid")
+                return None # Fragmento de outra mensagem com a mesma sequência (corrompido)
+            pending["parts"][index] = fragment
+            if len(pending["parts"]) < count:
+                return None
+            del state["fragments"][seq]
+            payload = b"".join(pending["parts"][i] for i in range(count))
+        try:
+            return decode_message(payload)
+        except Exception as e:
+            logger.warning(f"Nó {self.node.id}: Mensagem multicast {seq} do nó {sender_id} inválida descartada ({e}).")
+            self.events.inc("invalid")
+            return None
+
+    def _deliver_ready(self, state):
+        """Entrega, em ordem, as mensagens consecutivas a partir da próxima esperada."""
+        while state["next"] in state["pending"]:
+            message = state["pending"].pop(state["next"])
+            state["next"] += 1
+            # Mesmo caminho das mensagens TCP: worker do remetente, em ordem, com supressão de duplicatas
+            self.node.dispatcher.submit(message, None)
+
+    def handle_gap(self, message):
+        """O remetente já não tem as mensagens pedidas: entrega o que chegou e segue a partir da primeira disponível."""
+        with self._lock:
+            state = self.senders.get(message["sender_id"])
+            if state is None or state["epoch"] != message["epoch"] or message["next_seq"] <= state["next"]:
+                return
+            skipped = sorted(seq for seq in state["pending"] if seq < message["next_seq"])
+            lost = message["next_seq"] - state["next"] - len(skipped)
+            for seq in skipped:
+                self.node.dispatcher.submit(state["pending"].pop(seq), None)
+            state["next"] = message["next_seq"]
+            state["fragments"] = {seq: parts for seq, parts in state["fragments"].items() if seq >= state["next"]}
+            state["nacked"] = {seq: t for seq, t in state["nacked"].items() if seq >= state["next"]}
+            self._deliver_ready(state)
+        logger.warning(f"Nó {self.node.id}: {lost} mensagens multicast do nó {message['sender_id']} "
+                       f"não puderam ser recuperadas.")
+        self.events.inc("lost", amount=lost)
+
+    def tick(self):
+        """Executado periodicamente: envia NACKs das lacunas, anuncia a última sequência e descarta remetentes inativos."""
+        now = time.time()
+        nacks = []
+        with self._lock:
+            for sender_id, state in list(self.senders.items()):
+                if sender_id not in self.node.peers and now - state["last_seen"] > self.IDLE_SENDER:
+                    del self.senders[sender_id]
+                    continue
+                if state["fragments"]:
+                    # Mensagens que não se completaram (fragmentos perdidos ou cabeçalho inválido)
+                    state["fragments"] = {seq: pending for seq, pending in state["fragments"].items()
+                                          if now - pending["at"] < self.FRAGMENT_TTL and seq >= state["next"]}
+                missing = [seq for seq in range(state["next"], state["highest"] + 1)
+                           if seq not in state["pending"] and now - state["nacked"].get(seq, 0) >= self.NACK_RETRY]
+                missing = missing[:self.MAX_NACK]
+                for seq in missing:
+                    state["nacked"][seq] = now
+                if missing:
+                    nacks.append((sender_id, state["epoch"], missing))
+        for sender_id, epoch, missing in nacks:
+            sender = self.node.peers.get(sender_id)
+            if sender is None:
+                continue # Remetente ainda desconhecido (tabela de membros atrasada): tenta no próximo período
+            self.node.communication.post_tcp_message(sender["ip"], sender["port"], {
+                "type": "MCAST_NACK",
+                "sender_id": self.node.id,
+                "epoch": epoch,
+                "missing": missing,
+            })
+            self.events.inc("nack_sent")
+        if self.seq and now - self._last_send < self.STATUS_DURATION and now - self._last_status >= self.STATUS_INTERVAL:
+            self._last_status = now
+            self._send_status()
@@ -0,0 +1,102 @@
+import re
+import threading
+import time
+from types import MappingProxyType
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_ROOM = "geral"  # Sala das mensagens sem sala (comando chat) e única sala dos nós de versões antigas
+ROOM_NAME = re.compile(r"^[^\W\d_][\w-]{0,31}$")  # Começa com letra (não se confunde com números nos comandos)
+
+def valid_room(name):
+    return bool(ROOM_NAME.match(name))
+
+def room_index(peers):
+    """Índice sala -> {ID: peer} dos inscritos. Peers sem a lista de salas (versões antigas) estão só na sala padrão."""
+    index = {}
+    for pid, pinfo in peers.items():
+        for room in pinfo.get("rooms", (DEFAULT_ROOM,)):
+            index.setdefault(room, {})[pid] = pinfo
+    return index
+
+class Rooms:
+    """Salas de chat (tópicos). Cada nó anuncia suas inscrições no seu registro da tabela de membros
+    (campo "rooms"), e a tabela mantém um índice sala -> inscritos, recalculado uma vez por versão:
+    uma mensagem de uma sala vai apenas para os seus inscritos. Alterações de inscrição passam
+    pelo coordenador, que as divulga como as demais alterações da tabela.
+    """
+    REGISTRATION_RETRY = 2.0  # Espera (s) antes de reenviar ao coordenador inscrições ainda não refletidas na tabela
+
+    def __init__(self, node, rooms=None):
+        self.node = node  # Referência ao objeto Node principal
+        self.subscriptions = set(rooms or (DEFAULT_ROOM,))
+        self._announced_at = 0.0
+        self._lock = threading.Lock()
+
+    def listing(self):
+        """Salas inscritas, em ordem (formato do registro na tabela de membros)."""
+        with self._lock:
+            return sorted(self.subscriptions)
+
+    def subscribed(self, room):
+        return room in self.subscriptions
+
+    def members(self, room):
+        """Peers inscritos na sala, exceto o próprio nó (somente leitura, calculado uma vez por versão da tabela)."""
+        self_id = self.node.id
+        return self.node.peers.view(("room", room, self_id), lambda table: MappingProxyType({
+            pid: pinfo for pid, pinfo in table.view("rooms", room_index).get(room, {}).items() if pid != self_id
+        }))
+
+    def join(self, room):
+        """Inscreve o nó na sala. Retorna False se ele já estava inscrito."""
+        with self._lock:
+            if room in self.subscriptions:
+                return False
+            self.subscriptions.add(room)
+        self._announce()
+        return True
+
+    def leave(self, room):
+        """Cancela a inscrição na sala. Retorna False se o nó não estava inscrito."""
+        with self._lock:
+            if room not in self.subscriptions:
+                return False
+            self.subscriptions.discard(room)
+        self._announce()
+        return True
+
+    def _announce(self):
+        """Envia as inscrições atuais ao coordenador (ou as registra, se este nó for o coordenador)."""
+        if not self.node.joined.is_set():
+            return # As inscrições seguem no JOIN_REQUEST
+        self._announced_at = time.time()
+        message = {"type": "ROOM_SUBSCRIPTION", "sender_id": self.node.id, "rooms": self.listing()}
+        if self.node.is_coordinator:
+            self.handle_subscription(message)
+            return
+        coordinator = self.node.peers.get(self.node.coordinator_id)
+        if coordinator is not None:
+            self.node.communication.post_tcp_message(coordinator["ip"], coordinator["port"], message)
+
+    def handle_subscription(self, message):
+        """Registra as inscrições de um peer na tabela de membros (apenas coordenador)."""
+        if not self.node.is_coordinator:
+            return
+        peer_id = message["sender_id"]
+        info = self.node.peers.get(peer_id)
+        rooms = sorted(room for room in message["rooms"] if valid_room(room))
+        if info is None or info.get("rooms") == rooms:
+            return
+        self.node.membership.record_update(peer_id, dict(info, rooms=rooms))
+        logger.info(f"Nó {peer_id} agora está nas salas: {', '.join(rooms) or '(nenhuma)'}")
+
+    def check_registration(self):
+        """Reenvia as inscrições se a tabela ainda não as reflete (ex.: o coordenador caiu antes de divulgá-las).
+        Executado periodicamente."""
+        own = self.node.peers.get(self.node.id)
+        if own is None or own.get("rooms") == self.listing():
+            return
+        if time.time() - self._announced_at >= self.REGISTRATION_RETRY:
+            self._announce()
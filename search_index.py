@@ -0,0 +1,224 @@
+import heapq
+import os
+import re
+import struct
+import sys
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+TOKEN = re.compile(r"\w+")
+MAX_TOKEN_LENGTH = 64  # Tokens maiores (ex.: hashes colados no chat) não entram no índice
+
+# Cabeçalho do arquivo do índice: identificador, versão do formato, ordem dos bytes e sequência até a qual
+# todas as mensagens estão indexadas
+HEADER = struct.Struct("!4sBcQ")
+MAGIC = b"CIDX"
+FORMAT_VERSION = 1
+BYTE_ORDER = b"<" if sys.byteorder == "little" else b">"
+# Cada termo: tamanho da chave (UTF-8) e número de sequências, seguidos da chave e das sequências (uint32)
+TERM = struct.Struct("!HI")
+COUNT = struct.Struct("!I")
+# Busca com vários termos: sequências conferidas por busca binária antes de passar à interseção
+# de conjuntos, usada enquanto as demais listas não passam desta razão do tamanho da menor
+PROBE = 64
+SET_INTERSECTION_RATIO = 32
+
+def normalize(text):
+    """Minúsculas e sem acentos ("Não" e "nao" são o mesmo termo)."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def tokenize(text):
+    """Termos distintos de um texto, na ordem em que aparecem."""
+    return list(dict.fromkeys(t for t in TOKEN.findall(normalize(text)) if len(t) <= MAX_TOKEN_LENGTH))
+
+class SearchIndex:
+    """Índice invertido do histórico de chat: termo -> sequências do log e usuário -> sequências.
+    É atualizado a cada mensagem gravada e salvo em disco ao lado do histórico, a cada
+    CHECKPOINT_EVERY mensagens e ao encerrar o nó. Na inicialização o índice salvo é carregado e
+    apenas as mensagens gravadas depois do último salvamento são indexadas a partir do log.
+    Mensagens gravadas em paralelo podem chegar ao índice fora de ordem, então o salvamento registra a
+    maior sequência abaixo da qual não há lacunas; as que já estavam indexadas acima dela são
+    reindexadas na carga sem duplicar as listas.
+    As listas de sequências ficam ordenadas, então as consultas partem das mensagens mais recentes
+    e param assim que a página está completa.
+    """
+    CHECKPOINT_EVERY = 5000  # Mensagens indexadas entre dois salvamentos do índice
+    REBUILD_BATCH = 1000     # Entradas lidas do log por vez ao indexar o que falta
+
+    def __init__(self, directory, message_log, checkpoint_every=CHECKPOINT_EVERY):
+        self.path = os.path.join(directory, "index.bin")
+        self.message_log = message_log
+        self.checkpoint_every = checkpoint_every
+        self.terms = {}  # termo -> array de sequências
+        self.users = {}  # usuário (normalizado) -> array de sequências
+        self.last_seq = 0  # Sequência até a qual todas as mensagens estão indexadas
+        self._ahead = set()  # Sequências indexadas acima de last_seq (à espera das anteriores)
+        self._pending = 0  # Mensagens indexadas desde o último salvamento
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Um salvamento por vez (mesmo arquivo temporário)
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._catch_up()
+
+    def _load(self):
+        """Carrega o índice salvo. Um arquivo inválido, de outra plataforma ou à frente do log é descartado."""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            magic, version, order, last_seq = HEADER.unpack_from(data, 0)
+            if magic != MAGIC or version != FORMAT_VERSION or order != BYTE_ORDER or last_seq > self.message_log.last_seq:
+                raise ValueError("índice incompatível com o log")
+            offset = HEADER.size
+            tables = []
+            for _ in range(2):
+                table, offset = self._unpack_table(data, offset)
+                tables.append(table)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Índice de busca em {self.path} descartado ({e}). Reconstruindo a partir do log.")
+            return
+        self.terms, self.users = tables
+        self.last_seq = last_seq
+
+    @staticmethod
+    def _unpack_table(data, offset):
+        (count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        table = {}
+        for _ in range(count):
+            key_length, size = TERM.unpack_from(data, offset)
+            offset += TERM.size
+            key = data[offset:offset + key_length].decode("utf-8")
+            offset += key_length
+            postings = array("I")
+            postings.frombytes(data[offset:offset + size * postings.itemsize])
+            offset += size * postings.itemsize
+            table[key] = postings
+        return table, offset
+
+    def _catch_up(self):
+        """Indexa as mensagens gravadas no log depois do último salvamento do índice."""
+        start = self.last_seq + 1
+        missing = self.message_log.last_seq - self.last_seq
+        if missing <= 0:
+            return
+        while start <= self.message_log.last_seq:
+            entries = self.message_log.read(start, self.REBUILD_BATCH)
+            if not entries:
+                break
+            for entry in entries:
+                self.add(entry["seq"], entry, checkpoint=False)
+            start = entries[-1]["seq"] + 1
+        self.save()
+        logger.info(f"Índice de busca: {missing} mensagens indexadas a partir do log.")
+
+    def add(self, seq, entry, checkpoint=True):
+        """Indexa uma mensagem gravada no log com a sequência `seq`."""
+        tokens = tokenize(entry.get("text") or "")
+        user = normalize(entry.get("username") or "")
+        with self._lock:
+            if seq <= self.last_seq or seq in self._ahead:
+                return # Já indexada
+            for token in tokens:
+                self._post(self.terms, token, seq)
+            self._post(self.users, user, seq)
+            if seq == self.last_seq + 1:
+                self.last_seq = seq
+                while self.last_seq + 1 in self._ahead:
+                    self.last_seq += 1
+                    self._ahead.discard(self.last_seq)
+            else:
+                self._ahead.add(seq)
+            self._pending += 1
+            due = checkpoint and self._pending >= self.checkpoint_every
+        if due:
+            self.save()
+
+    @staticmethod
+    def _post(table, key, seq):
+        postings = table.get(key)
+        if postings is None:
+            table[key] = array("I", (seq,))
+        elif not postings or postings[-1] < seq:
+            postings.append(seq)
+        elif _missing(postings, seq):
+            # Mensagens gravadas em paralelo podem chegar ao índice fora de ordem; uma sequência já
+            # presente (salva acima de last_seq e reindexada na carga) não é repetida
+            insort(postings, seq)
+
+    def search(self, text, offset=0, limit=20):
+        """Mensagens que contêm todos os termos de `text`, da mais recente para a mais antiga.
+        Retorna (sequências da página, há mais resultados)."""
+        tokens = tokenize(text)
+        if not tokens:
+            return [], False
+        with self._lock:
+            lists = sorted((self.terms.get(token, array("I")) for token in tokens), key=len)
+            return self._page(lists[0], lists[1:], offset, limit)
+
+    def by_user(self, username, offset=0, limit=20):
+        """Mensagens de um usuário, da mais recente para a mais antiga. Retorna (sequências, há mais resultados)."""
+        with self._lock:
+            return self._page(self.users.get(normalize(username), array("I")), (), offset, limit)
+
+    @staticmethod
+    def _page(postings, others, offset, limit):
+        """Uma página da interseção das listas, da sequência mais recente para a mais antiga.
+        Retorna (sequências, há mais resultados)."""
+        if not others:
+            end = max(0, len(postings) - offset)
+            start = max(0, end - limit)
+            return postings[start:end].tolist()[::-1], start > 0
+        wanted = offset + limit + 1 # Um a mais, para saber se há outra página
+        # As demais listas muito maiores que a menor: só a busca binária compensa
+        use_sets = sum(map(len, others)) <= SET_INTERSECTION_RATIO * len(postings)
+        matches = []
+        # Percorre a menor lista a partir das mensagens mais recentes, conferindo as demais por busca
+        # binária: em buscas com muitos resultados, a página se completa logo
+        for position, seq in enumerate(reversed(postings)):
+            if use_sets and position == PROBE:
+                # Poucos resultados até aqui: interseção de conjuntos (em C) do restante da lista
+                rest = set(postings[:len(postings) - PROBE]).intersection(*others)
+                matches += heapq.nlargest(wanted - len(matches), rest)
+                break
+            if not any(_missing(other, seq) for other in others):
+                matches.append(seq)
+                if len(matches) == wanted:
+                    break
+        return matches[offset:offset + limit], len(matches) == wanted
+
+    def save(self):
+        """Grava o índice em disco (arquivo temporário e troca atômica)."""
+        with self._save_lock:
+            self._save()
+
+    def _save(self):
+        with self._lock:
+            parts = [HEADER.pack(MAGIC, FORMAT_VERSION, BYTE_ORDER, self.last_seq)]
+            for table in (self.terms, self.users):
+                parts.append(COUNT.pack(len(table)))
+                for key, postings in table.items():
+                    encoded = key.encode("utf-8")
+                    parts.append(TERM.pack(len(encoded), len(postings)))
+                    parts.append(encoded)
+                    parts.append(postings.tobytes())
+            self._pending = 0
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(parts))
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        if self._pending:
+            self.save()
+
+def _missing(postings, seq):
+    i = bisect_left(postings, seq)
+    return i == len(postings) or postings[i] != seq
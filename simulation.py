@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from node import Node
+from transport import LoopbackNetwork
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+class Simulation:
+    """Executa N nós no mesmo processo sobre a rede em memória (LoopbackNetwork), sem multicast real.
+    Cada nó recebe um IP próprio (10.0.x.y) e um diretório de dados temporário. A rede permite
+    configurar latência, jitter e perda, e a simulação permite derrubar, reiniciar ou isolar nós.
+    Usa o backend com threads: o número de nós viável é limitado pelas threads por conexão.
+    """
+    PORT = 9000
+    FIRST_JOIN_TIMEOUT = 0.5  # O primeiro nó não tem coordenador para encontrar
+
+    def __init__(self, size, latency=0.0, jitter=0.0, loss=0.0, seed=None, workdir=None, **node_options):
+        self.size = size
+        self.network = LoopbackNetwork(latency=latency, jitter=jitter, loss=loss, seed=seed)
+        self._own_workdir = workdir is None
+        self.workdir = workdir or tempfile.mkdtemp(prefix="chat-sim-")
+        self.node_options = node_options  # Opções repassadas a cada Node (eleição, detector de falhas...)
+        self.nodes = []
+        self.crashed = set()  # Índices dos nós derrubados
+
+    def address(self, index):
+        return f"10.0.{index // 250}.{index % 250 + 1}"
+
+    def _create_node(self, index, **options):
+        ip = self.address(index)
+        options = dict(self.node_options, **options)
+        return Node(ip, self.PORT, f"user{index}", data_dir=os.path.join(self.workdir, f"node{index}"),
+                    transport=self.network.transport(ip), **options)
+
+    def start(self):
+        """Inicia o primeiro nó (que se torna coordenador) e depois os demais, em paralelo."""
+        first = self._create_node(0, join_timeout=self.FIRST_JOIN_TIMEOUT)
+        first.start()
+        self.nodes = [first] + [self._create_node(i) for i in range(1, self.size)]
+        threads = [threading.Thread(target=node.start, daemon=True) for node in self.nodes[1:]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logger.info(f"Simulação com {self.size} nós iniciada.")
+        return self
+
+    def alive(self):
+        """Nós que não foram derrubados."""
+        return [node for i, node in enumerate(self.nodes) if i not in self.crashed]
+
+    def coordinator(self):
+        return next((node for node in self.alive() if node.is_coordinator), None)
+
+    def crash(self, index):
+        """Derruba um nó, como se o processo tivesse terminado (conexões passam a ser recusadas)."""
+        self.crashed.add(index)
+        self.nodes[index].stop()
+
+    def restart(self, index, **options):
+        """Reinicia um nó derrubado no mesmo endereço e diretório de dados (retoma o snapshot do seu estado)."""
+        node = self._create_node(index, **options)
+        self.nodes[index] = node
+        self.crashed.discard(index)
+        node.start()
+        return node
+
+    def isolate(self, index):
+        """Isola um nó da rede sem derrubá-lo (partição): seus envios e recebimentos são descartados."""
+        self.network.isolate(self.address(index))
+
+    def heal(self, index):
+        self.network.heal(self.address(index))
+
+    def wait_until(self, predicate, timeout, interval=0.01):
+        """Espera até `predicate()` ser verdadeiro. Retorna o tempo decorrido, ou None se o prazo acabar."""
+        started = time.time()
+        while time.time() - started < timeout:
+            if predicate():
+                return time.time() - started
+            time.sleep(interval)
+        return None
+
+    def converged(self):
+        """True se todos os nós vivos concordam sobre o coordenador e a tabela de membros."""
+        alive = self.alive()
+        if not alive:
+            return True
+        coordinators = {node.coordinator_id for node in alive}
+        tables = {frozenset(node.peers) for node in alive}
+        return len(coordinators) == 1 and None not in coordinators and len(tables) == 1 \
+            and set(next(iter(tables))) == {node.id for node in alive}
+
+    def stop(self):
+        # Isola todos antes de encerrar: sem isso, cada nó derrubado dispara detecções e eleições nos demais
+        for index in range(len(self.nodes)):
+            self.isolate(index)
+        for index in set(range(len(self.nodes))) - self.crashed:
+            self.nodes[index].stop()
+        self.crashed.update(range(len(self.nodes)))
+        if self._own_workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
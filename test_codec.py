@@ -0,0 +1,75 @@
+import unittest
+from codec import ENVELOPE, FLAG_COMPRESSED, JSON_SCHEMA, SCHEMAS, SCHEMAS_BY_TYPE, decode_message, encode_message
+
+PEER = {"ip": "10.0.0.2", "port": 5001, "username": "ana", "codecs": ["binary", "json"], "rooms": ["geral", "jogos"],
+        "features": ["multicast"]}
+PROBE = {"seq": 7, "sender_id": 3, "port": 5003, "version": 12, "ip": "10.0.0.3",
+         "updates": [{"id": 4, "state": "suspect", "inc": 2}], "coordinator_beat": [1, 99], "target_id": 5, "digest": "00ff10aa"}
+
+# Uma mensagem de exemplo por esquema, com os campos opcionais presentes
+SAMPLES = {
+    "HEARTBEAT": {"type": "HEARTBEAT", "sender_id": 1, "version": 12, "digest": "0123456789abcdef"},
+    "ELECTION": {"type": "ELECTION", "sender_id": 2},
+    "ANSWER": {"type": "ANSWER", "sender_id": 3},
+    "COORDINATOR": {"type": "COORDINATOR", "coordinator_id": 4},
+    "CHAT_MESSAGE": {"type": "CHAT_MESSAGE", "sender_id": 2, "ts": 1700000000.25, "msg_id": "9f86d081884c7d65",
+                     "username": "ana", "text": "olá, sala!", "ttl": 3, "relay_id": 5, "room": "jogos"},
+    "PING": dict(PROBE, type="PING"),
+    "ACK": dict(PROBE, type="ACK"),
+    "PING_REQ": dict(PROBE, type="PING_REQ"),
+    "JOIN_ACK": {"type": "JOIN_ACK", "id": 2, "coordinator_id": 1, "version": 3,
+                 "peers": {1: {"ip": "10.0.0.1", "port": 5000, "username": "coordenador"}, 2: PEER}},
+    "MEMBERSHIP_DELTA": {"type": "MEMBERSHIP_DELTA", "to_version": 5, "digest": "abcdef0123456789", "full": False,
+                         "from_version": 3, "peers": {2: PEER},
+                         "changes": [{"v": 4, "op": "join", "id": 2, "info": PEER}, {"v": 5, "op": "leave", "id": 6, "info": None}]},
+    "CATCHUP_REQUEST": {"type": "CATCHUP_REQUEST", "sender_id": 2, "port": 5001, "from_seq": 10, "since_ts": 1700000000.5,
+                        "limit": 500, "ip": "10.0.0.2", "rooms": ["geral", "jogos"]},
+    "MCAST_NACK": {"type": "MCAST_NACK", "sender_id": 2, "epoch": 1, "missing": [4, 5, 9]},
+    "MCAST_GAP": {"type": "MCAST_GAP", "sender_id": 2, "epoch": 1, "next_seq": 40},
+    "MCAST_START": {"type": "MCAST_START", "sender_id": 2, "epoch": 1, "next_seq": 17},
+}
+
+def _schema_id(payload):
+    return ENVELOPE.unpack_from(payload)[2]
+
+class CodecRoundTripTest(unittest.TestCase):
+    """Cada esquema codifica e decodifica suas mensagens sem perdas, com e sem compressão."""
+
+    def test_every_schema_has_a_sample(self):
+        self.assertEqual(set(SAMPLES), {schema.msg_type for schema in SCHEMAS})
+
+    def test_binary_round_trip(self):
+        for msg_type, message in SAMPLES.items():
+            with self.subTest(msg_type=msg_type):
+                payload = encode_message(message, "binary")
+                self.assertEqual(_schema_id(payload), SCHEMAS_BY_TYPE[msg_type].schema_id)
+                self.assertEqual(decode_message(payload), message)
+
+    def test_without_optional_fields(self):
+        message = {"type": "CHAT_MESSAGE", "sender_id": 2, "ts": 1.5, "msg_id": "ab", "username": "ana", "text": "oi"}
+        self.assertEqual(decode_message(encode_message(message, "binary")), message)
+
+    def test_compressed_round_trip(self):
+        peers = {i: dict(PEER, ip=f"10.0.{i // 250}.{i % 250}", username=f"user{i}") for i in range(1, 300)}
+        message = {"type": "JOIN_ACK", "id": 7, "coordinator_id": 1, "version": 299, "peers": peers}
+        payload = encode_message(message, "binary")
+        self.assertTrue(ENVELOPE.unpack_from(payload)[1] & FLAG_COMPRESSED)
+        self.assertEqual(decode_message(payload), message)
+
+    def test_json_inside_envelope(self):
+        # Campos fora do esquema (ou tipo sem esquema): JSON dentro do envelope binário, comprimido se grande
+        for message in ({"type": "ELECTION", "sender_id": 2, "extra": True},
+                        {"type": "CATCHUP_CHUNK", "entries": [{"seq": i, "text": "mensagem " * 10} for i in range(50)]}):
+            with self.subTest(msg_type=message["type"]):
+                payload = encode_message(message, "binary")
+                self.assertEqual(_schema_id(payload), JSON_SCHEMA)
+                self.assertEqual(decode_message(payload), message)
+
+    def test_json_codec(self):
+        message = SAMPLES["ELECTION"]
+        payload = encode_message(message, "json")
+        self.assertEqual(payload[:1], b"{")
+        self.assertEqual(decode_message(payload), message)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import socket
+import threading
+import unittest
+from framing import BufferPool, FrameReader, encode_frame
+
+class _ChunkedConnection:
+    """Conexão falsa que entrega os bytes em pedaços fixos pelo recv_into, como o TCP pode fazer."""
+    def __init__(self, data, chunk):
+        self.data = data
+        self.chunk = chunk
+        self.position = 0
+
+    def recv_into(self, buffer):
+        size = min(self.chunk, len(buffer), len(self.data) - self.position)
+        buffer[:size] = self.data[self.position:self.position + size]
+        self.position += size
+        return size
+
+class FrameReaderTest(unittest.TestCase):
+    """Frames divididos entre leituras (cabeçalho e payload) e maiores que o buffer do pool."""
+
+    def _read(self, payloads, chunk, buffer_size=64):
+        data = b"".join(encode_frame(payload) for payload in payloads)
+        reader = FrameReader(_ChunkedConnection(data, chunk), BufferPool(buffer_size=buffer_size))
+        try:
+            return [bytes(payload) for payload in reader.read_frames(threading.Event())]
+        finally:
+            reader.close()
+
+    def test_split_across_reads(self):
+        payloads = [b"a", b"", b"x" * 40, bytes(range(7)) * 3]
+        for chunk in (1, 2, 3, 5, 13):
+            with self.subTest(chunk=chunk):
+                self.assertEqual(self._read(payloads, chunk), payloads)
+
+    def test_frame_larger_than_buffer(self):
+        payloads = [b"p" * 10, b"g" * 1000, b"q" * 30]
+        self.assertEqual(self._read(payloads, chunk=17), payloads)
+
+    def test_legacy_sender(self):
+        data = b'{"type": "A"}\n{"type": "B"}\n'
+        reader = FrameReader(_ChunkedConnection(data, 5), BufferPool(buffer_size=64))
+        self.assertEqual([bytes(p) for p in reader.read_frames(threading.Event())], [b'{"type": "A"}', b'{"type": "B"}'])
+
+    def test_socket_pair(self):
+        left, right = socket.socketpair()
+        payloads = [bytes([i % 256]) * i for i in range(0, 3000, 150)]
+        sender = threading.Thread(target=lambda: (left.sendall(b"".join(map(encode_frame, payloads))), left.close()))
+        sender.start()
+        with right:
+            reader = FrameReader(right, BufferPool(buffer_size=256))
+            received = [bytes(payload) for payload in reader.read_frames(threading.Event())]
+        sender.join()
+        self.assertEqual(received, payloads)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import logging
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from communication import MULTICAST_GROUP, MULTICAST_PORT
+from node import Node
+from utils import serialize_message
+
+JOINS = 400  # JOIN_REQUESTs simultâneos por teste
+
+def _join_request(i):
+    # Endereços sem listener: o JOIN_ACK falha sem afetar a tabela do coordenador
+    return {"type": "JOIN_REQUEST", "sender_ip": "127.0.0.1", "sender_port": 40000 + i, "username": f"user{i}"}
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class ConcurrentJoinTest(unittest.TestCase):
+    """Entradas simultâneas no coordenador: cada nó recebe um ID próprio e nenhuma entrada da tabela
+    é sobrescrita (a versão da tabela conta exatamente uma entrada por nó registrado)."""
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.workdir = tempfile.mkdtemp(prefix="chat-test-")
+        self.switch_interval = sys.getswitchinterval()
+        self.node = None
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+        if self.node is not None:
+            self.node.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        logging.disable(logging.NOTSET)
+
+    def _start_coordinator(self, backend):
+        self.node = Node("127.0.0.1", _free_port(), "coordenador", backend=backend, data_dir=self.workdir,
+                         join_timeout=0.2, resume=False)
+        self.node.start()
+        self.assertTrue(self.node.is_coordinator)
+        return self.node
+
+    def _wait_settled(self, expected, timeout=30.0):
+        """Espera a tabela chegar a `expected` peers ou, com as filas do dispatcher vazias, parar de crescer."""
+        deadline = time.time() + timeout
+        while time.time() < deadline and len(self.node.peers) < expected:
+            size = len(self.node.peers)
+            time.sleep(0.5)
+            idle = not any(q.qsize() for lane in self.node.dispatcher.lanes.values() for q in lane)
+            if idle and len(self.node.peers) == size:
+                break
+
+    def _assert_unique_ids(self):
+        peers = self.node.peers
+        addresses = {(pinfo["ip"], pinfo["port"]) for pinfo in peers.values()}
+        self.assertEqual(len(addresses), len(peers))
+        self.assertEqual(self.node.membership.version, len(peers) - 1)
+
+    def _join_in_threads(self, threads=8):
+        """Entrega os JOIN_REQUESTs ao nó por várias threads, cada um com um endereço de origem diferente."""
+        sys.setswitchinterval(1e-6) # Trocas de thread frequentes expõem as condições de corrida (até o tearDown)
+        def deliver(start):
+            for i in range(start, JOINS, threads):
+                self.node.handle_udp_message(_join_request(i), (f"10.0.{i // 250}.{i % 250 + 1}", MULTICAST_PORT))
+        workers = [threading.Thread(target=deliver, args=(k,)) for k in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def test_threads_backend(self):
+        self._start_coordinator("threads")
+        self._join_in_threads()
+        self._wait_settled(JOINS + 1)
+        self.assertEqual(len(self.node.peers), JOINS + 1)
+        self._assert_unique_ids()
+
+    def test_asyncio_backend(self):
+        self._start_coordinator("asyncio")
+        self._join_in_threads()
+        self._wait_settled(JOINS + 1)
+        self.assertEqual(len(self.node.peers), JOINS + 1)
+        self._assert_unique_ids()
+
+    def test_asyncio_backend_multicast(self):
+        """JOIN_REQUESTs pelo listener multicast do backend asyncio (um datagrama pode se perder no caminho)."""
+        self._start_coordinator("asyncio")
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP) as sock:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            for i in range(JOINS):
+                sock.sendto(serialize_message(_join_request(i)).encode("utf-8"), (MULTICAST_GROUP, MULTICAST_PORT))
+        self._wait_settled(JOINS + 1)
+        self.assertGreater(len(self.node.peers), 1)
+        self._assert_unique_ids()
+
+if __name__ == "__main__":
+    unittest.main()
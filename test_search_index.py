@@ -0,0 +1,61 @@
+import logging
+import shutil
+import tempfile
+import unittest
+from array import array
+from message_log import MessageLog
+from search_index import SearchIndex
+
+def _entry(i):
+    return {"username": "ana" if i % 2 else "bruno", "text": f"mensagem {i} sobre {'jogos' if i % 3 == 0 else 'trabalho'}"}
+
+class SearchIndexTest(unittest.TestCase):
+    """Mensagens indexadas fora de ordem e salvamentos com lacunas: o índice recarregado é igual ao do log."""
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.workdir = tempfile.mkdtemp(prefix="chat-index-")
+        self.log = MessageLog(f"{self.workdir}/log")
+        self.index = None
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        logging.disable(logging.NOTSET)
+
+    def _open_index(self):
+        self.index = SearchIndex(f"{self.workdir}/index", self.log)
+        return self.index
+
+    def test_post_out_of_order(self):
+        table = {}
+        for seq in (5, 1, 9, 3, 9, 5, 7):
+            SearchIndex._post(table, "termo", seq)
+        self.assertEqual(table["termo"], array("I", (1, 3, 5, 7, 9)))
+
+    def test_add_out_of_order(self):
+        index = self._open_index()
+        seqs = [self.log.append(_entry(i)) for i in range(1, 11)]
+        for seq in reversed(seqs):
+            index.add(seq, _entry(seq))
+        self.assertEqual(index.last_seq, 10)
+        self.assertEqual(index.search("jogos")[0], [9, 6, 3])
+        self.assertEqual(index.by_user("ANA")[0], [9, 7, 5, 3, 1])
+
+    def test_checkpoint_with_gap_and_reload(self):
+        index = self._open_index()
+        for i in range(1, 11):
+            self.log.append(_entry(i))
+        for seq in (1, 2, 3, 5, 6, 8): # 4 e 7 ainda não indexadas no salvamento
+            index.add(seq, _entry(seq))
+        index.save()
+        self.assertEqual(index.last_seq, 3)
+        reloaded = self._open_index()
+        self.assertEqual(reloaded.last_seq, 10)
+        self.assertEqual(reloaded.search("mensagem", limit=20), ([10, 9, 8, 7, 6, 5, 4, 3, 2, 1], False))
+        self.assertEqual(reloaded.search("jogos")[0], [9, 6, 3])
+        reloaded.close()
+        self.assertEqual(self._open_index().by_user("bruno")[0], [10, 8, 6, 4, 2])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,377 @@
+import heapq
+import itertools
+import random
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+class SocketTransport:
+    """Transporte padrão: sockets TCP e UDP multicast do sistema operacional.
+    O módulo de comunicação cria todos os seus sockets por meio de um transporte, o que permite
+    substituí-lo pela rede em memória (LoopbackTransport) em simulações e benchmarks.
+    """
+    def listen_tcp(self, ip, port, backlog=10):
+        """Abre o socket TCP que aceita conexões de outros peers."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((ip, port))
+        sock.listen(backlog)
+        return sock
+
+    def connect_tcp(self, ip, port, timeout):
+        """Abre uma conexão TCP com um peer."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect((ip, port))
+        except Exception:
+            sock.close()
+            raise
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def multicast_receiver(self, group, port):
+        """Abre o socket UDP inscrito no grupo multicast."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # O bind é feito em "" para escutar em todas as interfaces de rede disponíveis
+        sock.bind(('', port))
+        # Adiciona o socket ao grupo multicast
+        mreq = struct.pack("4sl", socket.inet_aton(group), socket.INADDR_ANY)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        return sock
+
+    def multicast_sender(self):
+        """Abre um socket UDP para envio ao grupo multicast."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2) # TTL (Time-To-Live) da mensagem
+        return sock
+
+class LoopbackNetwork:
+    """Rede em memória para vários nós no mesmo processo, sem sockets nem multicast reais.
+    Cada nó recebe seu próprio transporte (e IP); a rede aplica latência, jitter e perda, e permite
+    isolar um endereço (partição). Perdas em conexões TCP viram atraso de retransmissão, como no TCP real.
+    """
+    RETRANSMIT_DELAY = 0.2  # Atraso (s) somado a um segmento TCP "perdido"
+
+    def __init__(self, latency=0.0, jitter=0.0, loss=0.0, seed=None):
+        self.latency = latency  # Atraso (s) de ida de cada envio
+        self.jitter = jitter    # Atraso adicional aleatório, entre 0 e jitter
+        self.loss = loss        # Probabilidade de perda de cada envio
+        self.random = random.Random(seed)
+        self.isolated = set()   # IPs isolados: envios de e para eles são descartados
+        self.bytes_sent = {}    # IP -> bytes enviados (TCP e multicast)
+        self.sends = {}         # IP -> número de envios
+        self._listeners = {}    # (ip, port) -> _LoopbackListener
+        self._groups = {}       # (grupo, porta) -> conjunto de _LoopbackDatagramSocket
+        self._ports = itertools.count(40000)  # Portas efêmeras das conexões de saída
+        self._lock = threading.Lock()
+
+    def transport(self, ip):
+        """Retorna o transporte de um nó com o IP informado."""
+        return LoopbackTransport(self, ip)
+
+    def isolate(self, ip):
+        """Isola um IP da rede: conexões não completam e envios são descartados em silêncio."""
+        with self._lock:
+            self.isolated.add(ip)
+
+    def heal(self, ip):
+        with self._lock:
+            self.isolated.discard(ip)
+
+    def _delay(self, tcp):
+        with self._lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            lost = self.random.random() < self.loss
+        if lost and tcp:
+            delay += self.RETRANSMIT_DELAY
+        return None if lost and not tcp else delay
+
+    def _account(self, ip, size):
+        with self._lock:
+            self.bytes_sent[ip] = self.bytes_sent.get(ip, 0) + size
+            self.sends[ip] = self.sends.get(ip, 0) + 1
+
+    def _reachable(self, src_ip, dst_ip):
+        with self._lock:
+            return src_ip not in self.isolated and dst_ip not in self.isolated
+
+    def _listen(self, addr, listener):
+        with self._lock:
+            if addr in self._listeners:
+                raise OSError(98, "Address already in use")
+            self._listeners[addr] = listener
+
+    def _unlisten(self, addr, listener):
+        with self._lock:
+            if self._listeners.get(addr) is listener:
+                del self._listeners[addr]
+
+    def _connect(self, src_ip, addr, timeout):
+        if not self._reachable(src_ip, addr[0]):
+            time.sleep(timeout or 0)
+            raise socket.timeout("timed out")
+        with self._lock:
+            listener = self._listeners.get(addr)
+            local = (src_ip, next(self._ports))
+        if listener is None:
+            raise ConnectionRefusedError(111, "Connection refused")
+        # O handshake custa uma ida e volta
+        delay = self.latency * 2
+        if delay:
+            time.sleep(delay)
+        outbound, inbound = _Pipe(), _Pipe()
+        client = _LoopbackSocket(self, local, addr, inbound, outbound)
+        listener._enqueue(_LoopbackSocket(self, addr, local, outbound, inbound), local)
+        return client
+
+    def _join_group(self, group, receiver):
+        with self._lock:
+            self._groups.setdefault(group, set()).add(receiver)
+
+    def _leave_group(self, group, receiver):
+        with self._lock:
+            self._groups.get(group, set()).discard(receiver)
+
+    def _multicast(self, src_ip, data, group):
+        self._account(src_ip, len(data))
+        with self._lock:
+            receivers = list(self._groups.get(group, ()))
+        for receiver in receivers:
+            if not self._reachable(src_ip, receiver.ip):
+                continue
+            delay = self._delay(tcp=False)
+            if delay is not None:
+                receiver._deliver(bytes(data), (src_ip, group[1]), time.monotonic() + delay)
+
+class LoopbackTransport:
+    """Transporte de um nó sobre a LoopbackNetwork, com a mesma interface de SocketTransport."""
+    def __init__(self, network, ip):
+        self.network = network
+        self.ip = ip  # IP do nó na rede em memória
+
+    def listen_tcp(self, ip, port, backlog=10):
+        return _LoopbackListener(self.network, (ip, port))
+
+    def connect_tcp(self, ip, port, timeout):
+        return self.network._connect(self.ip, (ip, port), timeout)
+
+    def multicast_receiver(self, group, port):
+        return _LoopbackDatagramSocket(self.network, self.ip, (group, port))
+
+    def multicast_sender(self):
+        return _LoopbackDatagramSocket(self.network, self.ip, None)
+
+class _Pipe:
+    """Um sentido de uma conexão em memória: os bytes chegam em ordem, cada escrita após o atraso da rede."""
+    def __init__(self):
+        self.chunks = deque()  # [momento da entrega, bytes, offset já lido]
+        self.closed = False
+        self.last_delivery = 0.0
+        self.cond = threading.Condition()
+
+    def write(self, data, deliver_at):
+        with self.cond:
+            if self.closed:
+                raise BrokenPipeError(32, "Broken pipe")
+            # Uma escrita nunca ultrapassa a anterior (entrega em ordem, como no TCP)
+            self.last_delivery = max(self.last_delivery, deliver_at)
+            self.chunks.append([self.last_delivery, bytes(data), 0])
+            self.cond.notify_all()
+
+    def read_into(self, buffer, timeout, peek=False):
+        """Copia bytes disponíveis para `buffer`. Retorna 0 se o outro lado fechou; lança
+        socket.timeout (ou BlockingIOError, com timeout 0) se nada chegar no prazo."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if self.chunks and self.chunks[0][0] <= now:
+                    return self._copy(buffer, now, peek)
+                if self.closed and not self.chunks:
+                    return 0
+                if timeout == 0:
+                    raise BlockingIOError(11, "Resource temporarily unavailable")
+                wait = self.chunks[0][0] - now if self.chunks else None
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise socket.timeout("timed out")
+                    wait = remaining if wait is None else min(wait, remaining)
+                self.cond.wait(wait)
+
+    def _copy(self, buffer, now, peek):
+        view = memoryview(buffer)
+        copied = 0
+        for chunk in self.chunks:
+            if chunk[0] > now or copied == len(view):
+                break
+            deliver_at, data, offset = chunk
+            size = min(len(data) - offset, len(view) - copied)
+            view[copied:copied + size] = data[offset:offset + size]
+            copied += size
+            if peek:
+                continue
+            chunk[2] += size
+        if not peek:
+            while self.chunks and self.chunks[0][2] == len(self.chunks[0][1]):
+                self.chunks.popleft()
+        return copied
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+class _LoopbackSocket:
+    """Ponta de uma conexão TCP em memória, com os métodos de socket usados pela comunicação."""
+    def __init__(self, network, local, remote, inbound, outbound):
+        self.network = network
+        self.local = local
+        self.remote = remote
+        self.inbound = inbound    # Pipe lido por esta ponta
+        self.outbound = outbound  # Pipe escrito por esta ponta
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def setblocking(self, flag):
+        self.timeout = None if flag else 0
+
+    def setsockopt(self, *args):
+        pass
+
+    def getpeername(self):
+        return self.remote
+
+    def sendall(self, data):
+        if self.outbound.closed:
+            raise BrokenPipeError(32, "Broken pipe")
+        if not self.network._reachable(self.local[0], self.remote[0]):
+            return # Descartado em silêncio, como em uma partição de rede
+        self.network._account(self.local[0], len(data))
+        self.outbound.write(data, time.monotonic() + self.network._delay(tcp=True))
+
+    def recv_into(self, buffer, nbytes=0):
+        return self.inbound.read_into(buffer, self.timeout)
+
+    def recv(self, size, flags=0):
+        buffer = bytearray(size)
+        received = self.inbound.read_into(buffer, self.timeout, peek=bool(flags & socket.MSG_PEEK))
+        return bytes(buffer[:received])
+
+    def close(self):
+        self.inbound.close()
+        self.outbound.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _LoopbackListener:
+    """Socket de escuta TCP em memória."""
+    def __init__(self, network, addr):
+        self.network = network
+        self.addr = addr
+        self.timeout = None
+        self.closed = False
+        self._pending = deque()
+        self._cond = threading.Condition()
+        network._listen(addr, self)
+
+    def _enqueue(self, conn, remote):
+        with self._cond:
+            if self.closed:
+                raise ConnectionRefusedError(111, "Connection refused")
+            self._pending.append((conn, remote))
+            self._cond.notify()
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def accept(self):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._pending or self.closed, self.timeout):
+                raise socket.timeout("timed out")
+            if self.closed:
+                raise OSError(9, "Bad file descriptor")
+            return self._pending.popleft()
+
+    def close(self):
+        self.network._unlisten(self.addr, self)
+        with self._cond:
+            self.closed = True
+            pending, self._pending = self._pending, deque()
+            self._cond.notify_all()
+        for conn, _ in pending:
+            conn.close()
+
+class _LoopbackDatagramSocket:
+    """Socket UDP em memória: inscrito em um grupo multicast (recepção) ou só para envio."""
+    def __init__(self, network, ip, group):
+        self.network = network
+        self.ip = ip
+        self.group = group
+        self.timeout = None
+        self.closed = False
+        self._queue = []  # heap de (momento da entrega, ordem, dados, remetente)
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        if group is not None:
+            network._join_group(group, self)
+
+    def _deliver(self, data, sender, deliver_at):
+        with self._cond:
+            heapq.heappush(self._queue, (deliver_at, next(self._order), data, sender))
+            self._cond.notify()
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def setsockopt(self, *args):
+        pass
+
+    def sendto(self, data, addr):
+        self.network._multicast(self.ip, data, addr)
+        return len(data)
+
+    def recvfrom_into(self, buffer, nbytes=0):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self.closed:
+                    raise OSError(9, "Bad file descriptor")
+                now = time.monotonic()
+                if self._queue and self._queue[0][0] <= now:
+                    _, _, data, sender = heapq.heappop(self._queue)
+                    size = min(len(data), len(buffer))
+                    buffer[:size] = data[:size]
+                    return size, sender
+                wait = self._queue[0][0] - now if self._queue else None
+                if deadline is not None:
+                    if deadline - now <= 0:
+                        raise socket.timeout("timed out")
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._cond.wait(wait)
+
+    def close(self):
+        if self.group is not None:
+            self.network._leave_group(self.group, self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()